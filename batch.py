@@ -0,0 +1,239 @@
+from board import *
+import evaluation
+import numpy
+
+
+# positions are arrays of piece codes by square number, as in Board.squares, of shape (N, 64); planes are (N, 12, 8, 8)
+# arrays of 0 and 1 with one plane for each piece kind of white then black, in the order pawn, knight, bishop, rook,
+# queen, king, indexed by row then column, so planes[n, plane, 0, 0] is a1
+PLANE_CODES = [kind | color for color in (WHITE, BLACK) for kind in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING)]
+
+_SQUARES = numpy.arange(64)
+_ROWS = numpy.arange(8)[:, None]
+_MIDDLEGAME = numpy.array(MIDDLEGAME_SCORES, numpy.int32)
+_ENDGAME = numpy.array(ENDGAME_SCORES, numpy.int32)
+_PHASES = numpy.array(PHASES, numpy.int32)
+# square number reached by each of up to 7 steps in each slider direction, or 64 off the board
+_RAY_TARGETS = {offset: numpy.array([[RAYS[offset][index][step] if step < len(RAYS[offset][index]) else 64 for index in range(64)] for step in range(7)]) for offset in ROOK_OFFSETS + BISHOP_OFFSETS}
+# square numbers a knight or king on each square moves to, padded with 64
+_STEP_TARGETS = {kind: numpy.array([[targets[index][slot] if slot < len(targets[index]) else 64 for index in range(64)] for slot in range(8)]) for kind, targets in ((KNIGHT, KNIGHT_TARGETS), (KING, KING_TARGETS))}
+# passed pawn bonus by row, for white and black pawns, (middlegame, endgame)
+_PASSED = {
+	WHITE: [numpy.array([evaluation.PASSED_PAWN[row - 1][phase] if 1 <= row <= 6 else 0 for row in range(8)])[:, None] for phase in (0, 1)],
+	BLACK: [numpy.array([evaluation.PASSED_PAWN[6 - row][phase] if 1 <= row <= 6 else 0 for row in range(8)])[:, None] for phase in (0, 1)],
+}
+
+
+def _shelter_tables(forward):
+	"""Return the shield pawn bonus by king square and pawn square, and the columns next to each king square."""
+	shield = numpy.zeros((64, 64), numpy.int32)
+	columns = numpy.zeros((64, 8), bool)
+	for king in range(64):
+		column = king % 8
+		for side in (column - 1, column, column + 1):
+			if not 0 <= side < 8:
+				continue
+			columns[king, side] = True
+			for distance in (1, 2):
+				target = king - column + side + distance * forward
+				if 0 <= target < 64:
+					shield[king, target] = evaluation.SHIELD_PAWN[distance - 1]
+	return shield, columns
+
+
+_SHELTER = {WHITE: _shelter_tables(8), BLACK: _shelter_tables(-8)}
+_ZONES = numpy.array([[target in evaluation.KING_ZONES[index] for target in range(64)] for index in range(64)])
+
+
+def to_array(boards):
+	"""
+	Return the piece codes of boards as an (N, 64) int8 array.
+
+	Args:
+		boards: iterable of chessboards.
+	"""
+	data = b''.join(bytes(board.squares) for board in boards)
+	return numpy.frombuffer(data, numpy.int8).reshape(-1, 64).copy()
+
+
+def to_planes(positions):
+	"""Return the (N, 12, 8, 8) uint8 planes of an (N, 64) array of piece codes."""
+	positions = numpy.asarray(positions)
+	planes = positions[:, None, :] == numpy.array(PLANE_CODES, numpy.int8)[None, :, None]
+	return planes.reshape(-1, 12, 8, 8).astype(numpy.uint8)
+
+
+def from_planes(planes):
+	"""Return the (N, 64) int8 array of piece codes of (N, 12, 8, 8) planes."""
+	planes = numpy.asarray(planes).reshape(-1, 12, 64)
+	return (planes * numpy.array(PLANE_CODES, numpy.int8)[None, :, None]).sum(axis=1).astype(numpy.int8)
+
+
+def _positions(positions):
+	"""Return positions given as piece codes or planes as an (N, 64) intp array of piece codes."""
+	positions = numpy.asarray(positions)
+	if positions.ndim == 4:
+		positions = from_planes(positions)
+	if positions.ndim != 2 or positions.shape[1] != 64:
+		raise ValueError('positions need shape (N, 64) or (N, 12, 8, 8), not ' + str(positions.shape))
+	return positions.astype(numpy.intp)
+
+
+def _pawn_terms(white, black):
+	"""Return the doubled, isolated and passed pawn counts, (N, 2) arrays, and the pawn structure scores."""
+	pawns = {WHITE: white.reshape(-1, 8, 8), BLACK: black.reshape(-1, 8, 8)}
+	files = {color: pawns[color].sum(axis=1) for color in pawns}
+	# the rearmost pawn of each color on each column, and the same over the column and the columns beside it
+	lowest = numpy.where(pawns[WHITE], _ROWS, 8).min(axis=1)
+	highest = numpy.where(pawns[BLACK], _ROWS, -1).max(axis=1)
+	lowest = numpy.pad(lowest, ((0, 0), (1, 1)), constant_values=8)
+	highest = numpy.pad(highest, ((0, 0), (1, 1)), constant_values=-1)
+	blockers = {
+		WHITE: numpy.maximum(numpy.maximum(highest[:, :-2], highest[:, 1:-1]), highest[:, 2:])[:, None, :] <= _ROWS,
+		BLACK: numpy.minimum(numpy.minimum(lowest[:, :-2], lowest[:, 1:-1]), lowest[:, 2:])[:, None, :] >= _ROWS,
+	}
+
+	counts = {'doubled': [], 'isolated': [], 'passed': []}
+	middlegame = 0
+	endgame = 0
+	for color, sign in ((WHITE, 1), (BLACK, -1)):
+		occupied = numpy.pad(files[color] > 0, ((0, 0), (1, 1)))
+		doubled = numpy.maximum(files[color] - 1, 0).sum(axis=1)
+		isolated = (files[color] * ~(occupied[:, :-2] | occupied[:, 2:])).sum(axis=1)
+		passed = pawns[color] & blockers[color]
+		counts['doubled'].append(doubled)
+		counts['isolated'].append(isolated)
+		counts['passed'].append(passed.sum(axis=(1, 2)))
+		middlegame = middlegame + sign * (doubled * evaluation.DOUBLED_PAWN[0] + isolated * evaluation.ISOLATED_PAWN[0] + (passed * _PASSED[color][0]).sum(axis=(1, 2)))
+		endgame = endgame + sign * (doubled * evaluation.DOUBLED_PAWN[1] + isolated * evaluation.ISOLATED_PAWN[1] + (passed * _PASSED[color][1]).sum(axis=(1, 2)))
+	return {name: numpy.stack(values, axis=1) for name, values in counts.items()}, middlegame, endgame
+
+
+def _mobility(positions):
+	"""Return the (N, 2) number of moves the knights, bishops, rooks, queens and king of each color could make."""
+	kinds = positions & 7
+	# the squares of all positions in one row, each position followed by a -1 standing for off the board
+	flat = numpy.pad(positions.astype(numpy.int8), ((0, 0), (0, 1)), constant_values=-1).ravel()
+	# one slot per position and color, so that the moves of every piece are added up with one bincount
+	slots = []
+	counts = []
+	for lines, pieces in ((ROOK_OFFSETS, (ROOK, QUEEN)), (BISHOP_OFFSETS, (BISHOP, QUEEN)), (None, (KNIGHT,)), (None, (KING,))):
+		# the moving pieces are found first, so that only the squares they look at are read
+		position, square = numpy.nonzero(numpy.isin(kinds, pieces))
+		color = (positions[position, square] & BLACK).astype(numpy.int8)
+		base = position * 65
+		moves = numpy.zeros(len(position), numpy.int32)
+		if lines is None:
+			for targets in _STEP_TARGETS[pieces[0]]:
+				target = flat[base + targets[square]]
+				moves += (target == EMPTY) | ((target > 0) & ((target & BLACK) != color))
+		for offset in lines or ():
+			open_line = numpy.ones(len(position), bool)
+			for targets in _RAY_TARGETS[offset]:
+				target = flat[base + targets[square]]
+				moves += open_line & ((target == EMPTY) | ((target > 0) & ((target & BLACK) != color)))
+				open_line &= target == EMPTY
+				if not open_line.any():
+					break
+		slots.append(position * 2 + color // BLACK)
+		counts.append(moves)
+	return numpy.bincount(numpy.concatenate(slots), numpy.concatenate(counts), minlength=2 * len(positions)).astype(numpy.int32).reshape(-1, 2)
+
+
+def _king_terms(positions, white_pawns, black_pawns):
+	"""Return the (N,) king shelter and king attackers scores, positive for white, as evaluation computes them."""
+	kinds = positions & 7
+	shelter = 0
+	attackers = 0
+	for color, sign, pawns, enemy in ((WHITE, 1, white_pawns, BLACK), (BLACK, -1, black_pawns, WHITE)):
+		kings = positions == KING | color
+		present = kings.any(axis=1)
+		king = kings.argmax(axis=1)
+		shield, columns = _SHELTER[color]
+		files = pawns.reshape(-1, 8, 8).any(axis=1)
+		score = (shield[king] * pawns).sum(axis=1)
+		score += (columns[king] & ~files).sum(axis=1) * evaluation.OPEN_FILE_NEAR_KING
+		shelter = shelter + sign * score * present
+		near = _ZONES[king] & ((positions & BLACK) == enemy) & (kinds != EMPTY) & (kinds != PAWN) & (kinds != KING)
+		attackers = attackers + sign * near.sum(axis=1) * evaluation.KING_ATTACKER * present
+	return shelter, attackers
+
+
+def features(positions):
+	"""
+	Compute evaluation features of many positions at once.
+
+	Args:
+		positions: (N, 64) array of piece codes, or (N, 12, 8, 8) planes.
+
+	Returns:
+		A dict of arrays, each with one entry per position:
+		'counts': (N, 12) number of pieces of each kind and color, in the order of the planes.
+		'middlegame', 'endgame': (N,) material and piece-square scores, positive for white, as Board keeps them.
+		'phase': (N,) game phase, 24 with all pieces on the board.
+		'mobility': (N, 2) moves the knights, bishops, rooks, queens and king of white and black could make, ignoring
+			pins and checks; a proxy for the mobility of each side.
+		'doubled', 'isolated', 'passed': (N, 2) number of doubled, isolated and passed pawns of white and black.
+		'pawn_middlegame', 'pawn_endgame': (N,) pawn structure scores, positive for white.
+		'king_shelter', 'king_attackers': (N,) middlegame king safety scores, positive for white.
+
+	Raises:
+		ValueError: if positions does not have one of the two shapes.
+	"""
+	positions = _positions(positions)
+	pawn_counts, terms = _terms(positions)
+	result = {
+		'counts': numpy.bincount((positions + 16 * numpy.arange(len(positions))[:, None]).ravel(), minlength=16 * len(positions)).reshape(-1, 16)[:, PLANE_CODES],
+		'mobility': _mobility(positions),
+	}
+	result.update(terms)
+	result.update(pawn_counts)
+	return result
+
+
+def _terms(positions):
+	"""
+	Return the terms of the evaluation of (N, 64) positions, without the counts and mobility only features adds.
+
+	Returns:
+		A (pawn counts, terms) tuple of the 'doubled', 'isolated' and 'passed' arrays, and the 'middlegame', 'endgame',
+		'phase', 'pawn_middlegame', 'pawn_endgame', 'king_shelter' and 'king_attackers' arrays, as features returns them.
+	"""
+	white_pawns = positions == PAWN
+	black_pawns = positions == PAWN | BLACK
+	pawn_counts, pawn_middlegame, pawn_endgame = _pawn_terms(white_pawns, black_pawns)
+	shelter, attackers = _king_terms(positions, white_pawns, black_pawns)
+	terms = {
+		'middlegame': _MIDDLEGAME[positions, _SQUARES].sum(axis=1),
+		'endgame': _ENDGAME[positions, _SQUARES].sum(axis=1),
+		'phase': _PHASES[positions].sum(axis=1),
+		'pawn_middlegame': pawn_middlegame,
+		'pawn_endgame': pawn_endgame,
+		'king_shelter': shelter,
+		'king_attackers': attackers,
+	}
+	return pawn_counts, terms
+
+
+def evaluate(positions, side=None):
+	"""
+	Evaluate many positions at once, giving the same scores as evaluation.evaluate.
+
+	Args:
+		positions: (N, 64) array of piece codes, or (N, 12, 8, 8) planes.
+		side: (N,) array of the player to move in each position, 0 for white and 1 for black, to score each position
+			from the point of view of that player, as packed.decode_array gives it; or None to score them all for white.
+
+	Returns:
+		An (N,) int32 array of scores in centipawns.
+	"""
+	pawn_counts, values = _terms(_positions(positions))
+	middlegame = values['middlegame'] + values['pawn_middlegame'] + values['king_shelter'] + values['king_attackers']
+	endgame = values['endgame'] + values['pawn_endgame']
+	phase = numpy.minimum(values['phase'], PHASE_TOTAL)
+	blend = middlegame * phase + endgame * (PHASE_TOTAL - phase)
+	# rounded toward zero, as evaluation.evaluate rounds
+	scores = (numpy.sign(blend) * (numpy.abs(blend) // PHASE_TOTAL)).astype(numpy.int32)
+	if side is not None:
+		scores = numpy.where(numpy.asarray(side) == 1, -scores, scores)
+	return scores
@@ -0,0 +1,211 @@
+from utils import *
+import argparse
+import gc
+import json
+import math
+import statistics
+import sys
+import time
+
+
+# (name, FEN record) of the positions every benchmark is run on
+POSITIONS = [
+	('opening', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'),
+	('middlegame', 'r1bq1rk1/pp2bppp/2n1pn2/2pp4/3P4/2PBPN2/PP1N1PPP/R1BQ1RK1 w - - 0 8'),
+	('endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1'),
+	('castling', 'r3k2r/pppq1ppp/2n1bn2/3pp3/3PP3/2N1BN2/PPPQ1PPP/R3K2R w KQkq - 0 1'),
+	('en passant', 'rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3'),
+]
+PIECE_TYPES = (Pawn, Rook, Knight, Bishop, Queen, King)
+
+
+def measure(function, repeats=20, warmup=3, min_time=0.01):
+	"""
+	Time calls to function.
+
+	The number of calls per repeat is doubled until a repeat takes at least min_time, and the garbage collector is off
+	while timing, as in timeit.
+
+	Args:
+		function: function taking no arguments.
+		repeats: number of timed repeats.
+		warmup: number of repeats run first and not counted.
+		min_time: least time in seconds a repeat should take.
+
+	Returns:
+		A dict of the median, 95th percentile and fastest time per call in microseconds over the repeats, the number of
+		repeats, and the number of calls per repeat.
+	"""
+	clock = time.perf_counter
+	number = 1
+	while True:
+		begin = clock()
+		for call in range(number):
+			function()
+		if clock() - begin >= min_time or number >= 1 << 20:
+			break
+		number *= 2
+
+	enabled = gc.isenabled()
+	gc.disable()
+	try:
+		times = []
+		for repeat in range(warmup + repeats):
+			begin = clock()
+			for call in range(number):
+				function()
+			times.append((clock() - begin) / number * 1e6)
+	finally:
+		if enabled:
+			gc.enable()
+	times = sorted(times[warmup:])
+	return {
+		'median_us': statistics.median(times),
+		'p95_us': times[max(math.ceil(0.95 * len(times)) - 1, 0)],
+		'min_us': times[0],
+		'repeats': repeats,
+		'number': number,
+	}
+
+
+def _display_frame():
+	"""
+	Return a function drawing a full frame of chess.display_board off screen for a board, or None without pygame.
+
+	The function draws on its own Surface, putting chess.screen back after each frame.
+	"""
+	try:
+		import chess
+		import render
+		render.start_display()
+	except ImportError:
+		return None
+	surface = render.pygame.Surface((render.SIZE, render.SIZE))
+
+	def frame(board):
+		screen = chess.screen
+		chess.screen = surface
+		try:
+			return chess.display_board(board)
+		finally:
+			chess.screen = screen
+	return frame
+
+
+def benchmarks(display=True):
+	"""
+	Return the benchmarks, as (name, function) pairs, where name is 'position/benchmark' or the benchmark alone.
+
+	get_moves is timed for every piece of its type in a position, of both colors, valid_move for every move the pieces of
+	the player to move might make, and King.check for the king of the player to move. can_move is timed with the move
+	cache emptied before each call, and again with its answer cached.
+
+	Args:
+		display: whether to time a full frame of display_board, which needs pygame.
+	"""
+	cases = [('starting_board', starting_board)]
+	frame = _display_frame() if display else None
+	for name, fen in POSITIONS:
+		board, player = from_fen(fen)
+		for piece_type in PIECE_TYPES:
+			pieces = [piece for piece in board.values() if type(piece) == piece_type]
+			if pieces:
+				cases.append((name + '/' + piece_type.__name__ + '.get_moves', lambda pieces=pieces: [piece.get_moves() for piece in pieces]))
+		moves = [(piece, end) for piece in board.by_color[player].values() for end in piece.get_moves()]
+		cases.append((name + '/valid_move', lambda moves=moves: [piece.valid_move(end) for piece, end in moves]))
+		king = board.pieces[board.kings[player]]
+		cases.append((name + '/King.check', lambda king=king: king.check(king.location)))
+
+		def cold(board=board, player=player):
+			MOVE_CACHE.clear()
+			return can_move(player, board)
+		cases.append((name + '/can_move', cold))
+		cases.append((name + '/can_move cached', lambda board=board, player=player: can_move(player, board)))
+		if frame is not None:
+			cases.append((name + '/display_board', lambda board=board: frame(board)))
+	return cases
+
+
+def run(select=None, repeats=20, warmup=3, min_time=0.01, display=True, progress=None):
+	"""
+	Run the benchmarks.
+
+	Args:
+		select: run only the benchmarks whose names contain this string, or all of them if None.
+		repeats, warmup, min_time: as for measure.
+		display: whether to time display_board.
+		progress: function called with each benchmark's name and result as it finishes, or None.
+
+	Returns:
+		A dict that can be written as JSON: the Python version, and a dict from each benchmark's name to its result.
+	"""
+	results = {}
+	for name, function in benchmarks(display):
+		if select is not None and select not in name:
+			continue
+		results[name] = measure(function, repeats, warmup, min_time)
+		if progress is not None:
+			progress(name, results[name])
+	MOVE_CACHE.clear()
+	return {'python': sys.version.split()[0], 'benchmarks': results}
+
+
+def compare(results, baseline, threshold=0.1):
+	"""
+	Compare benchmark results with a baseline run.
+
+	Args:
+		results: dict returned by run.
+		baseline: dict returned by an earlier run, such as one read from its JSON file.
+		threshold: fraction by which a median time may grow before it counts as a slowdown.
+
+	Returns:
+		A list of (name, baseline median, median, ratio, slower) tuples for the benchmarks in both runs, where slower is
+		True if the ratio of the medians is more than 1 + threshold.
+	"""
+	rows = []
+	for name, result in results['benchmarks'].items():
+		if name in baseline['benchmarks']:
+			before = baseline['benchmarks'][name]['median_us']
+			ratio = result['median_us'] / before if before else 1.0
+			rows.append((name, before, result['median_us'], ratio, ratio > 1 + threshold))
+	return rows
+
+
+def main():
+	"""Run the benchmarks from the command line, optionally saving them or comparing them with a baseline."""
+	parser = argparse.ArgumentParser(description='Time the piece move generators and utility functions on a standard set of positions.')
+	parser.add_argument('-k', '--select', help='only run benchmarks whose names contain this string')
+	parser.add_argument('-r', '--repeats', type=int, default=20, help='number of timed repeats (default: 20)')
+	parser.add_argument('-w', '--warmup', type=int, default=3, help='number of repeats run before timing (default: 3)')
+	parser.add_argument('-t', '--min-time', type=float, default=0.01, help='least seconds per repeat (default: 0.01)')
+	parser.add_argument('--no-display', action='store_true', help='skip timing display_board')
+	parser.add_argument('-j', '--json', help='write the results to this JSON file')
+	parser.add_argument('-c', '--compare', help='JSON file of baseline results to compare with')
+	parser.add_argument('--threshold', type=float, default=0.1, help='fraction a median may grow by before it counts as a slowdown (default: 0.1)')
+	args = parser.parse_args()
+
+	print('benchmark'.ljust(36) + 'median us'.rjust(13) + 'p95 us'.rjust(13) + 'min us'.rjust(13))
+	def progress(name, result):
+		print(name.ljust(36) + format(result['median_us'], '13.2f') + format(result['p95_us'], '13.2f') + format(result['min_us'], '13.2f'), flush=True)
+	results = run(args.select, args.repeats, args.warmup, args.min_time, not args.no_display, progress)
+	if args.json:
+		with open(args.json, 'w') as file:
+			json.dump(results, file, indent=1)
+	if not args.compare:
+		return 0
+
+	with open(args.compare) as file:
+		baseline = json.load(file)
+	print()
+	print('benchmark'.ljust(36) + 'baseline us'.rjust(13) + 'median us'.rjust(13) + 'change'.rjust(10))
+	slower = 0
+	for name, before, after, ratio, flagged in compare(results, baseline, args.threshold):
+		slower += flagged
+		print(name.ljust(36) + format(before, '13.2f') + format(after, '13.2f') + format((ratio - 1) * 100, '+9.1f') + '%' + ('  SLOWER' if flagged else ''))
+	print(str(slower) + ' benchmarks slower than the baseline by more than ' + format(args.threshold * 100, '.0f') + '%')
+	return 1 if slower else 0
+
+
+if __name__ == '__main__':
+	raise SystemExit(main())
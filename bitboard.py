@@ -0,0 +1,429 @@
+from pieces import *
+from utils import apply_castling
+
+# bitboards are Python ints using bit n for square number n (a1 = bit 0, h8 = bit 63)
+FULL = (1 << 64) - 1
+
+
+def _mask(squares):
+	"""Return the bitboard with the bits of squares set."""
+	mask = 0
+	for square in squares:
+		if square != -1:
+			mask |= 1 << square
+	return mask
+
+
+def _rank_attacks(column, occupied):
+	"""Return the 8-bit set of columns a rook on column attacks along a row holding the 8-bit set occupied."""
+	attacks = 0
+	for step in (-1, 1):
+		target = column + step
+		while 0 <= target < 8:
+			attacks |= 1 << target
+			if occupied & (1 << target):
+				break
+			target += step
+	return attacks
+
+
+KNIGHT_ATTACKS = [_mask(KNIGHT_TARGETS[square]) for square in range(64)]
+KING_ATTACKS = [_mask(KING_TARGETS[square]) for square in range(64)]
+# squares a pawn of each color (0 white, 1 black) on square attacks
+PAWN_ATTACKS = [[_mask(PAWN_CAPTURES[color][square]) for square in range(64)] for color in ('white', 'black')]
+# line masks through each square, excluding the square itself
+FILE_MASKS = [_mask(RAYS[UP][square] + RAYS[DOWN][square]) for square in range(64)]
+DIAGONAL_MASKS = [_mask(RAYS[RIGHT_UP][square] + RAYS[LEFT_DOWN][square]) for square in range(64)]
+ANTIDIAGONAL_MASKS = [_mask(RAYS[LEFT_UP][square] + RAYS[RIGHT_DOWN][square]) for square in range(64)]
+# row attacks by column and the occupancy of the six inner columns of the row
+RANK_ATTACKS = [[_rank_attacks(column, inner << 1) for inner in range(64)] for column in range(8)]
+
+
+def _between(square):
+	"""Return the bitboards of the squares strictly between square and each square, 0 where the two share no line."""
+	between = [0] * 64
+	for offset in ROOK_OFFSETS + BISHOP_OFFSETS:
+		line = 0
+		for target in RAYS[offset][square]:
+			between[target] = line
+			line |= 1 << target
+	return between
+
+
+# the row each side's pawns promote on, by side
+LAST_ROWS = (_mask(range(56, 64)), _mask(range(8)))
+# squares strictly between two squares on a row, file or diagonal, by both square numbers
+BETWEEN = [_between(square) for square in range(64)]
+# (right, king start, king end, rook start, rook end, squares that must be empty, squares that must not be attacked)
+CASTLES = (
+	(WHITE_KINGSIDE, 4, 6, 7, 5, _mask([5, 6]), (4, 5, 6)),
+	(WHITE_QUEENSIDE, 4, 2, 0, 3, _mask([1, 2, 3]), (4, 3, 2)),
+	(BLACK_KINGSIDE, 60, 62, 63, 61, _mask([61, 62]), (60, 61, 62)),
+	(BLACK_QUEENSIDE, 60, 58, 56, 59, _mask([57, 58, 59]), (60, 59, 58)),
+)
+
+
+def _swap(bits):
+	"""Return bits with the order of its bytes (the rows of the board) reversed."""
+	return int.from_bytes(bits.to_bytes(8, 'little'), 'big')
+
+
+def _line_attacks(square, occupied, mask):
+	"""Return the attacks of a slider on square along the file or diagonal mask, by hyperbola quintessence."""
+	bit = 1 << square
+	forward = occupied & mask
+	reverse = _swap(forward)
+	forward = (forward - bit) & FULL
+	reverse = (reverse - _swap(bit)) & FULL
+	return (forward ^ _swap(reverse)) & mask
+
+
+def _rook_lines(square, occupied):
+	"""Return the bitboard of squares a rook on square attacks, given the bitboard of occupied squares."""
+	shift = square & 56
+	row = RANK_ATTACKS[square & 7][(occupied >> (shift + 1)) & 63] << shift
+	return row | _line_attacks(square, occupied, FILE_MASKS[square])
+
+
+def _bishop_lines(square, occupied):
+	"""Return the bitboard of squares a bishop on square attacks, given the bitboard of occupied squares."""
+	return _line_attacks(square, occupied, DIAGONAL_MASKS[square]) | _line_attacks(square, occupied, ANTIDIAGONAL_MASKS[square])
+
+
+def _blockers(square, offsets):
+	"""Return the bitboard of the squares that can block a slider on square along offsets, leaving out each ray's last square."""
+	return _mask(target for offset in offsets for target in RAYS[offset][square][:-1])
+
+
+# the squares whose occupancy decides each slider's attacks, and the attacks found so far by that occupancy
+ROOK_BLOCKERS = [_blockers(square, ROOK_OFFSETS) for square in range(64)]
+BISHOP_BLOCKERS = [_blockers(square, BISHOP_OFFSETS) for square in range(64)]
+_ROOK_CACHE = [{} for square in range(64)]
+_BISHOP_CACHE = [{} for square in range(64)]
+
+
+def rook_attacks(square, occupied):
+	"""Return the bitboard of squares a rook on square attacks, given the bitboard of occupied squares."""
+	occupied &= ROOK_BLOCKERS[square]
+	cache = _ROOK_CACHE[square]
+	attacks = cache.get(occupied)
+	if attacks is None:
+		attacks = cache[occupied] = _rook_lines(square, occupied)
+	return attacks
+
+
+def bishop_attacks(square, occupied):
+	"""Return the bitboard of squares a bishop on square attacks, given the bitboard of occupied squares."""
+	occupied &= BISHOP_BLOCKERS[square]
+	cache = _BISHOP_CACHE[square]
+	attacks = cache.get(occupied)
+	if attacks is None:
+		attacks = cache[occupied] = _bishop_lines(square, occupied)
+	return attacks
+
+
+def _squares(bits):
+	"""Yield the square numbers of the set bits of bits."""
+	while bits:
+		low = bits & -bits
+		yield low.bit_length() - 1
+		bits ^= low
+
+
+class Position:
+	"""
+	Chess position stored as twelve bitboards, for fast bulk move generation.
+
+	Positions are immutable: make_move returns a new position.
+	"""
+
+	__slots__ = ('bitboards', 'side', 'castling', 'en_passant')
+
+	def __init__(self, bitboards, side, castling, en_passant):
+		"""
+		bitboards: list of 12 bitboards, white pawn, knight, bishop, rook, queen, king, then the same for black.
+		side: the player to move, 0 for white or 1 for black.
+		castling: castling rights, a combination of WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE and BLACK_QUEENSIDE.
+		en_passant: square number a pawn may capture en passant on, or -1.
+		"""
+		self.bitboards = bitboards
+		self.side = side
+		self.castling = castling
+		self.en_passant = en_passant
+
+	def occupancy(self, side):
+		"""Return the bitboard of squares holding pieces of side."""
+		bitboards = self.bitboards
+		base = 6 * side
+		return bitboards[base] | bitboards[base + 1] | bitboards[base + 2] | bitboards[base + 3] | bitboards[base + 4] | bitboards[base + 5]
+
+	def attacked(self, square, side, occupied):
+		"""Return if any piece of side attacks square, given the bitboard of occupied squares."""
+		bitboards = self.bitboards
+		base = 6 * side
+		if PAWN_ATTACKS[1 - side][square] & bitboards[base]:
+			return True
+		if KNIGHT_ATTACKS[square] & bitboards[base + 1]:
+			return True
+		if KING_ATTACKS[square] & bitboards[base + 5]:
+			return True
+		queens = bitboards[base + 4]
+		rooks = bitboards[base + 3] | queens
+		if rooks and rook_attacks(square, occupied) & rooks:
+			return True
+		bishops = bitboards[base + 2] | queens
+		return bool(bishops and bishop_attacks(square, occupied) & bishops)
+
+	def in_check(self):
+		"""Return if the side to move is in check."""
+		king = self.bitboards[6 * self.side + 5]
+		return self.attacked(king.bit_length() - 1, 1 - self.side, self.occupancy(0) | self.occupancy(1))
+
+	def pseudo_legal_moves(self):
+		"""Return moves as (start, end, promotion) tuples, ignoring whether they leave the king in check."""
+		side = self.side
+		own = self.occupancy(side)
+		occupied = own | self.occupancy(1 - side)
+		king = self.bitboards[6 * side + 5].bit_length() - 1
+		targets = self._targets(own, occupied, FULL, {}, self.en_passant)
+		targets.append((king, KING_ATTACKS[king] & ~own))
+		moves = self._expand(targets)
+		self._castles(occupied, moves)
+		return moves
+
+	def _targets(self, own, occupied, allowed, pins, en_passant):
+		"""
+		Return the squares the pieces of the side to move besides the king may move to.
+
+		Args:
+			own: bitboard of the squares holding pieces of the side to move.
+			occupied: bitboard of the occupied squares.
+			allowed: bitboard of the squares the pieces may move to, such as the squares that block a check.
+			pins: dict from the square number of each pinned piece to the bitboard of the line it may move along.
+			en_passant: square number pawns may capture en passant on, or -1 to leave those captures out.
+
+		Returns:
+			A list of (start, ends) tuples, where ends is the bitboard of the squares the piece on start may move to.
+		"""
+		side = self.side
+		bitboards = self.bitboards
+		base = 6 * side
+		allowed &= ~own
+		targets = []
+
+		forward = 8 if side == 0 else -8
+		start_row = 1 if side == 0 else 6
+		captures = (occupied & allowed) | (1 << en_passant if en_passant != -1 else 0)
+		for start in _squares(bitboards[base]):
+			ends = PAWN_ATTACKS[side][start] & captures
+			end = start + forward
+			if not occupied & (1 << end):
+				ends |= 1 << end & allowed
+				if start >> 3 == start_row and not occupied & (1 << (end + forward)):
+					ends |= 1 << (end + forward) & allowed
+			if start in pins:
+				ends &= pins[start]
+			targets.append((start, ends))
+		for start in _squares(bitboards[base + 1]):
+			# a pinned knight can never stay on its line
+			if start not in pins:
+				targets.append((start, KNIGHT_ATTACKS[start] & allowed))
+		for start in _squares(bitboards[base + 2] | bitboards[base + 4]):
+			targets.append((start, bishop_attacks(start, occupied) & pins.get(start, allowed) & allowed))
+		for start in _squares(bitboards[base + 3] | bitboards[base + 4]):
+			targets.append((start, rook_attacks(start, occupied) & pins.get(start, allowed) & allowed))
+		return targets
+
+	def _expand(self, targets):
+		"""Return the moves to the squares of targets, as _targets returns them, listing each choice of promotion."""
+		pawns = self.bitboards[6 * self.side]
+		last_row = LAST_ROWS[self.side]
+		moves = []
+		for start, ends in targets:
+			if ends & last_row and pawns >> start & 1:
+				for end in _squares(ends):
+					for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+						moves.append((start, end, promotion))
+			else:
+				for end in _squares(ends):
+					moves.append((start, end, 0))
+		return moves
+
+	def _castles(self, occupied, moves):
+		"""Append to moves the castling moves of the side to move, which may not start, cross or end in check."""
+		side = self.side
+		for right, king_start, king_end, rook_start, rook_end, between, safe in CASTLES:
+			if self.castling & right and (king_start >> 3 == 0) == (side == 0) and not occupied & between:
+				if not any(self.attacked(square, 1 - side, occupied) for square in safe):
+					moves.append((king_start, king_end, 0))
+
+	def make_move(self, move):
+		"""Return the position after making move, a (start, end, promotion) tuple."""
+		start, end, promotion = move
+		side = self.side
+		bitboards = list(self.bitboards)
+		base = 6 * side
+		start_bit = 1 << start
+		end_bit = 1 << end
+
+		kind = 0
+		while not bitboards[base + kind] & start_bit:
+			kind += 1
+		enemy = 6 - base
+		for index in range(enemy, enemy + 6):
+			if bitboards[index] & end_bit:
+				bitboards[index] ^= end_bit
+				break
+		bitboards[base + kind] ^= start_bit
+		bitboards[base + (promotion - 1 if promotion else kind)] |= end_bit
+
+		en_passant = -1
+		if kind == 0:
+			if end == self.en_passant:
+				bitboards[enemy] ^= 1 << (end - 8 if side == 0 else end + 8)
+			elif end - start in (16, -16):
+				en_passant = (start + end) // 2
+		elif kind == 5 and end - start in (2, -2):
+			rook_start, rook_end = (start + 3, start + 1) if end > start else (start - 4, start - 1)
+			bitboards[base + 3] ^= (1 << rook_start) | (1 << rook_end)
+		castling = self.castling & CASTLING_MASKS[start] & CASTLING_MASKS[end]
+		return Position(bitboards, 1 - side, castling, en_passant)
+
+	def _legal_targets(self):
+		"""
+		Return the legal moves, as targets that _expand lists and a list of moves found one at a time.
+
+		The pieces giving check and the pinned pieces are found once, and the other pieces' targets are masked with
+		them, so only king moves and en passant captures are tried on the board.
+
+		Returns:
+			A (targets, moves) tuple: targets is a list of (start, ends) tuples as _targets returns them, and moves
+			holds the castling moves and en passant captures as (start, end, promotion) tuples.
+		"""
+		side = self.side
+		bitboards = self.bitboards
+		enemy = 6 - 6 * side
+		own = self.occupancy(side)
+		occupied = own | self.occupancy(1 - side)
+		king = bitboards[6 * side + 5].bit_length() - 1
+		bishops = bitboards[enemy + 2] | bitboards[enemy + 4]
+		rooks = bitboards[enemy + 3] | bitboards[enemy + 4]
+		checkers = (PAWN_ATTACKS[side][king] & bitboards[enemy]) | (KNIGHT_ATTACKS[king] & bitboards[enemy + 1])
+		pins = {}
+		for attacks, sliders in ((bishop_attacks, bishops), (rook_attacks, rooks)):
+			if sliders:
+				seen = attacks(king, occupied)
+				checkers |= seen & sliders
+				# a slider seen through one piece of the side to move pins it
+				blockers = seen & own
+				for pinner in _squares(attacks(king, occupied ^ blockers) & sliders & ~seen):
+					line = BETWEEN[king][pinner]
+					pins[(line & blockers).bit_length() - 1] = line | 1 << pinner
+
+		# the king's own square is left out of the occupancy so that it does not hide the squares behind it
+		without_king = occupied ^ (1 << king)
+		ends = 0
+		for end in _squares(KING_ATTACKS[king] & ~own):
+			if not self.attacked(end, 1 - side, without_king):
+				ends |= 1 << end
+		moves = []
+		if checkers & (checkers - 1):
+			return [(king, ends)], moves
+		if checkers:
+			allowed = checkers | BETWEEN[king][checkers.bit_length() - 1]
+		else:
+			allowed = FULL
+			self._castles(occupied, moves)
+		targets = self._targets(own, occupied, allowed, pins, -1)
+		targets.append((king, ends))
+		if self.en_passant != -1:
+			for start in _squares(PAWN_ATTACKS[1 - side][self.en_passant] & bitboards[6 * side]):
+				move = (start, self.en_passant, 0)
+				after = self.make_move(move)
+				if not after.attacked(king, 1 - side, after.occupancy(0) | after.occupancy(1)):
+					moves.append(move)
+		return targets, moves
+
+	def legal_moves(self):
+		"""Return the legal moves as (start, end, promotion) tuples."""
+		targets, moves = self._legal_targets()
+		return self._expand(targets) + moves
+
+	def count_legal_moves(self):
+		"""Return the number of legal moves, counting each choice of promotion, without listing them."""
+		targets, moves = self._legal_targets()
+		pawns = self.bitboards[6 * self.side]
+		last_row = LAST_ROWS[self.side]
+		count = len(moves)
+		for start, ends in targets:
+			if ends & last_row and pawns >> start & 1:
+				count += 4 * ends.bit_count()
+			else:
+				count += ends.bit_count()
+		return count
+
+
+def perft(position, depth):
+	"""
+	Count the leaf nodes of the tree of legal moves from a Position, as perft.perft does for a chessboard.
+
+	Args:
+		position: Position to count from.
+		depth: number of moves deep to search.
+
+	Returns:
+		The number of move sequences of length depth, counting each choice of promotion as a separate move.
+	"""
+	if depth == 0:
+		return 1
+	if depth == 1:
+		return position.count_legal_moves()
+	nodes = 0
+	for move in position.legal_moves():
+		nodes += perft(position.make_move(move), depth - 1)
+	return nodes
+
+
+def from_board(board, player):
+	"""
+	Return the Position of a chessboard.
+
+	Args:
+		board: chessboard.
+		player: 'white' or 'black', the player to move.
+
+	Returns:
+		A Position with the castling rights and en passant square of board's state.
+	"""
+	bitboards = [0] * 12
+	for square, code in enumerate(board.squares):
+		if code != EMPTY:
+			bitboards[(6 if code & BLACK else 0) + (code & 7) - 1] |= 1 << square
+
+	return Position(bitboards, 0 if player == 'white' else 1, board.state.castling, board.state.en_passant)
+
+
+def to_board(position):
+	"""
+	Return the chessboard of a Position.
+
+	Returns:
+		A (board, player) tuple, where player is 'white' or 'black', the player to move.
+	"""
+	board = Board()
+	for index, bits in enumerate(position.bitboards):
+		color = 'white' if index < 6 else 'black'
+		kind = index % 6 + 1
+		for square in _squares(bits):
+			if kind in (ROOK, KING):
+				board[NAMES[square]] = PIECE_CLASSES[kind](color, NAMES[square], board, True)
+			else:
+				board[NAMES[square]] = PIECE_CLASSES[kind](color, NAMES[square], board)
+
+	apply_castling(board, position.castling)
+
+	player = 'white' if position.side == 0 else 'black'
+	if position.en_passant != -1:
+		board.state.en_passant = en_passant_square(board, NAMES[position.en_passant - 8 if position.side == 0 else position.en_passant + 8], player)
+	rehash(board, player)
+	return board, player
@@ -0,0 +1,448 @@
+import random
+
+
+FILES = 'abcdefgh'
+RANKS = '12345678'
+
+# square indices run a1 = 0, b1 = 1, ..., h1 = 7, a2 = 8, ..., h8 = 63
+NAMES = tuple(file + rank for rank in RANKS for file in FILES)
+SQUARES = {name: index for index, name in enumerate(NAMES)}
+
+# piece codes: a piece kind, plus BLACK for black pieces
+EMPTY = 0
+PAWN = 1
+KNIGHT = 2
+BISHOP = 3
+ROOK = 4
+QUEEN = 5
+KING = 6
+WHITE = 0
+BLACK = 8
+COLORS = {'white': WHITE, 'black': BLACK}
+
+# 10x12 mailbox: the board surrounded by a two square border of -1, so that stepping off the board is a lookup
+MAILBOX64 = [21 + 10 * (index // 8) + index % 8 for index in range(64)]
+MAILBOX = [MAILBOX64.index(cell) if cell in MAILBOX64 else -1 for cell in range(120)]
+
+# mailbox offsets, with rows increasing up the board
+UP = 10
+DOWN = -10
+LEFT = -1
+RIGHT = 1
+LEFT_UP = 9
+RIGHT_UP = 11
+LEFT_DOWN = -11
+RIGHT_DOWN = -9
+# castling rights bits
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+# castling rights kept when a move starts or ends on each square
+CASTLING_MASKS = [15] * 64
+CASTLING_MASKS[SQUARES['e1']] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASKS[SQUARES['h1']] = 15 & ~WHITE_KINGSIDE
+CASTLING_MASKS[SQUARES['a1']] = 15 & ~WHITE_QUEENSIDE
+CASTLING_MASKS[SQUARES['e8']] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASKS[SQUARES['h8']] = 15 & ~BLACK_KINGSIDE
+CASTLING_MASKS[SQUARES['a8']] = 15 & ~BLACK_QUEENSIDE
+# (castling right, king square, rook square, color) of each castling right
+CASTLING_HOMES = (
+	(WHITE_KINGSIDE, SQUARES['e1'], SQUARES['h1'], WHITE),
+	(WHITE_QUEENSIDE, SQUARES['e1'], SQUARES['a1'], WHITE),
+	(BLACK_KINGSIDE, SQUARES['e8'], SQUARES['h8'], BLACK),
+	(BLACK_QUEENSIDE, SQUARES['e8'], SQUARES['a8'], BLACK),
+)
+# the entries of CASTLING_HOMES each square takes part in
+CASTLING_HOMES_AT = [tuple(home for home in CASTLING_HOMES if index in home[1:3]) for index in range(64)]
+
+KNIGHT_OFFSETS = (-21, -19, -12, -8, 8, 12, 19, 21)
+KING_OFFSETS = (LEFT_DOWN, LEFT, LEFT_UP, DOWN, UP, RIGHT_DOWN, RIGHT, RIGHT_UP)
+ROOK_OFFSETS = (LEFT, RIGHT, UP, DOWN)
+BISHOP_OFFSETS = (LEFT_UP, RIGHT_UP, LEFT_DOWN, RIGHT_DOWN)
+
+
+# Zobrist keys: a position's key is the XOR of the keys of its pieces on their squares, its castling rights, the column
+# a pawn may capture en passant on, and ZOBRIST_SIDE if black is to move
+_generator = random.Random(20260101)
+ZOBRIST_PIECES = [[_generator.getrandbits(64) if code & 7 else 0 for square in range(64)] for code in range(16)]
+ZOBRIST_SIDE = _generator.getrandbits(64)
+_rights = [_generator.getrandbits(64) for right in range(4)]
+ZOBRIST_CASTLING = [_rights[0] * (mask & 1) ^ _rights[1] * (mask >> 1 & 1) ^ _rights[2] * (mask >> 2 & 1) ^ _rights[3] * (mask >> 3 & 1) for mask in range(16)]
+ZOBRIST_EN_PASSANT = [_generator.getrandbits(64) for column in range(8)]
+# the keys of the pawns, and 0 for the other piece codes
+ZOBRIST_PAWNS = [keys if code & 7 == PAWN else [0] * 64 for code, keys in enumerate(ZOBRIST_PIECES)]
+
+
+# material and piece-square scores, from the PeSTO evaluation by Ronald Friederich: a middlegame and an endgame value for
+# each piece kind, and for each kind a middlegame and an endgame table laid out as a board is printed, a8 first
+MIDDLEGAME_VALUES = (0, 82, 337, 365, 477, 1025, 0)
+ENDGAME_VALUES = (0, 94, 281, 297, 512, 936, 0)
+MIDDLEGAME_TABLES = {
+	PAWN: (
+		0, 0, 0, 0, 0, 0, 0, 0,
+		98, 134, 61, 95, 68, 126, 34, -11,
+		-6, 7, 26, 31, 65, 56, 25, -20,
+		-14, 13, 6, 21, 23, 12, 17, -23,
+		-27, -2, -5, 12, 17, 6, 10, -25,
+		-26, -4, -4, -10, 3, 3, 33, -12,
+		-35, -1, -20, -23, -15, 24, 38, -22,
+		0, 0, 0, 0, 0, 0, 0, 0,
+	),
+	KNIGHT: (
+		-167, -89, -34, -49, 61, -97, -15, -107,
+		-73, -41, 72, 36, 23, 62, 7, -17,
+		-47, 60, 37, 65, 84, 129, 73, 44,
+		-9, 17, 19, 53, 37, 69, 18, 22,
+		-13, 4, 16, 13, 28, 19, 21, -8,
+		-23, -9, 12, 10, 19, 17, 25, -16,
+		-29, -53, -12, -3, -1, 18, -14, -19,
+		-105, -21, -58, -33, -17, -28, -19, -23,
+	),
+	BISHOP: (
+		-29, 4, -82, -37, -25, -42, 7, -8,
+		-26, 16, -18, -13, 30, 59, 18, -47,
+		-16, 37, 43, 40, 35, 50, 37, -2,
+		-4, 5, 19, 50, 37, 37, 7, -2,
+		-6, 13, 13, 26, 34, 12, 10, 4,
+		0, 15, 15, 15, 14, 27, 18, 10,
+		4, 15, 16, 0, 7, 21, 33, 1,
+		-33, -3, -14, -21, -13, -12, -39, -21,
+	),
+	ROOK: (
+		32, 42, 32, 51, 63, 9, 31, 43,
+		27, 32, 58, 62, 80, 67, 26, 44,
+		-5, 19, 26, 36, 17, 45, 61, 16,
+		-24, -11, 7, 26, 24, 35, -8, -20,
+		-36, -26, -12, -1, 9, -7, 6, -23,
+		-45, -25, -16, -17, 3, 0, -5, -33,
+		-44, -16, -20, -9, -1, 11, -6, -71,
+		-19, -13, 1, 17, 16, 7, -37, -26,
+	),
+	QUEEN: (
+		-28, 0, 29, 12, 59, 44, 43, 45,
+		-24, -39, -5, 1, -16, 57, 28, 54,
+		-13, -17, 7, 8, 29, 56, 47, 57,
+		-27, -27, -16, -16, -1, 17, -2, 1,
+		-9, -26, -9, -10, -2, -4, 3, -3,
+		-14, 2, -11, -2, -5, 2, 14, 5,
+		-35, -8, 11, 2, 8, 15, -3, 1,
+		-1, -18, -9, 10, -15, -25, -31, -50,
+	),
+	KING: (
+		-65, 23, 16, -15, -56, -34, 2, 13,
+		29, -1, -20, -7, -8, -4, -38, -29,
+		-9, 24, 2, -16, -20, 6, 22, -22,
+		-17, -20, -12, -27, -30, -25, -14, -36,
+		-49, -1, -27, -39, -46, -44, -33, -51,
+		-14, -14, -22, -46, -44, -30, -15, -27,
+		1, 7, -8, -64, -43, -16, 9, 8,
+		-15, 36, 12, -54, 8, -28, 24, 14,
+	),
+}
+ENDGAME_TABLES = {
+	PAWN: (
+		0, 0, 0, 0, 0, 0, 0, 0,
+		178, 173, 158, 134, 147, 132, 165, 187,
+		94, 100, 85, 67, 56, 53, 82, 84,
+		32, 24, 13, 5, -2, 4, 17, 17,
+		13, 9, -3, -7, -7, -8, 3, -1,
+		4, 7, -6, 1, 0, -5, -1, -8,
+		13, 8, 8, 10, 13, 0, 2, -7,
+		0, 0, 0, 0, 0, 0, 0, 0,
+	),
+	KNIGHT: (
+		-58, -38, -13, -28, -31, -27, -63, -99,
+		-25, -8, -25, -2, -9, -25, -24, -52,
+		-24, -20, 10, 9, -1, -9, -19, -41,
+		-17, 3, 22, 22, 22, 11, 8, -18,
+		-18, -6, 16, 25, 16, 17, 4, -18,
+		-23, -3, -1, 15, 10, -3, -20, -22,
+		-42, -20, -10, -5, -2, -20, -23, -44,
+		-29, -51, -23, -15, -22, -18, -50, -64,
+	),
+	BISHOP: (
+		-14, -21, -11, -8, -7, -9, -17, -24,
+		-8, -4, 7, -12, -3, -13, -4, -14,
+		2, -8, 0, -1, -2, 6, 0, 4,
+		-3, 9, 12, 9, 14, 10, 3, 2,
+		-6, 3, 13, 19, 7, 10, -3, -9,
+		-12, -3, 8, 10, 13, 3, -7, -15,
+		-14, -18, -7, -1, 4, -9, -15, -27,
+		-23, -9, -23, -5, -9, -16, -5, -17,
+	),
+	ROOK: (
+		13, 10, 18, 15, 12, 12, 8, 5,
+		11, 13, 13, 11, -3, 3, 8, 3,
+		7, 7, 7, 5, 4, -3, -5, -3,
+		4, 3, 13, 1, 2, 1, -1, 2,
+		3, 5, 8, 4, -5, -6, -8, -11,
+		-4, 0, -5, -1, -7, -12, -8, -16,
+		-6, -6, 0, 2, -9, -9, -11, -3,
+		-9, 2, 3, -1, -5, -13, 4, -20,
+	),
+	QUEEN: (
+		-9, 22, 22, 27, 27, 19, 10, 20,
+		-17, 20, 32, 41, 58, 25, 30, 0,
+		-20, 6, 9, 49, 47, 35, 19, 9,
+		3, 22, 24, 45, 57, 40, 57, 36,
+		-18, 28, 19, 47, 31, 34, 39, 23,
+		-16, -27, 15, 6, 9, 17, 10, 5,
+		-22, -23, -30, -16, -16, -23, -36, -32,
+		-33, -28, -22, -43, -5, -32, -20, -41,
+	),
+	KING: (
+		-74, -35, -18, -18, -11, 15, 4, -17,
+		-12, 17, 14, 17, 17, 38, 23, 11,
+		10, 17, 23, 15, 20, 45, 44, 13,
+		-8, 22, 24, 27, 26, 33, 26, 3,
+		-18, -4, 21, 24, 27, 23, 9, -11,
+		-19, -3, 11, 21, 23, 16, 7, -9,
+		-27, -11, 4, 13, 14, 4, -5, -17,
+		-53, -34, -21, -11, -28, -14, -24, -43,
+	),
+}
+# game phase weight of each piece kind; the phase is 24 with all pieces on the board, falling to 0 as they are traded
+PHASE_WEIGHTS = (0, 0, 1, 1, 2, 4, 0)
+PHASE_TOTAL = 24
+
+
+def _scores(values, tables):
+	"""Return the signed score, positive for white, of each piece code on each square number, material included."""
+	scores = [[0] * 64 for code in range(16)]
+	for kind, table in tables.items():
+		for index in range(64):
+			# the tables put a8 first, so a white piece on index reads row 7 - index // 8, and black pieces are mirrored
+			scores[kind | WHITE][index] = values[kind] + table[index ^ 56]
+			scores[kind | BLACK][index] = -(values[kind] + table[index])
+	return scores
+
+
+MIDDLEGAME_SCORES = _scores(MIDDLEGAME_VALUES, MIDDLEGAME_TABLES)
+ENDGAME_SCORES = _scores(ENDGAME_VALUES, ENDGAME_TABLES)
+PHASES = [PHASE_WEIGHTS[code & 7] if code & 7 <= KING else 0 for code in range(16)]
+
+
+def _step(index, offset):
+	"""Return the square one step from index in the mailbox direction offset, or -1 if that is off the board."""
+	return MAILBOX[MAILBOX64[index] + offset]
+
+
+def _walk(index, offset):
+	"""Return the squares stepping from index in the mailbox direction offset, up to the edge of the board."""
+	squares = []
+	target = _step(index, offset)
+	while target != -1:
+		squares.append(target)
+		target = _step(target, offset)
+	return tuple(squares)
+
+
+# attack tables, built once: each entry is indexed by square number and holds square numbers
+RAYS = {offset: [_walk(index, offset) for index in range(64)] for offset in ROOK_OFFSETS + BISHOP_OFFSETS}
+ROOK_RAYS = [tuple(RAYS[offset][index] for offset in ROOK_OFFSETS) for index in range(64)]
+BISHOP_RAYS = [tuple(RAYS[offset][index] for offset in BISHOP_OFFSETS) for index in range(64)]
+QUEEN_RAYS = [ROOK_RAYS[index] + BISHOP_RAYS[index] for index in range(64)]
+KNIGHT_TARGETS = [tuple(_step(index, offset) for offset in KNIGHT_OFFSETS if _step(index, offset) != -1) for index in range(64)]
+KING_TARGETS = [tuple(_step(index, offset) for offset in KING_OFFSETS if _step(index, offset) != -1) for index in range(64)]
+# (one step, two step) advances for a pawn of each color; the two step advance is -1 off the pawn's starting row
+PAWN_ADVANCES = {
+	'white': [(_step(index, UP), _step(index, 2 * UP) if index // 8 == 1 else -1) for index in range(64)],
+	'black': [(_step(index, DOWN), _step(index, 2 * DOWN) if index // 8 == 6 else -1) for index in range(64)],
+}
+# (left, right) capture squares for a pawn of each color, -1 where the diagonal is off the board
+PAWN_CAPTURES = {
+	'white': [(_step(index, LEFT_UP), _step(index, RIGHT_UP)) for index in range(64)],
+	'black': [(_step(index, LEFT_DOWN), _step(index, RIGHT_DOWN)) for index in range(64)],
+}
+
+
+class GameState:
+	"""The state of a game besides where its pieces stand, replaced with an updated copy by each move."""
+
+	__slots__ = ('side', 'castling', 'en_passant', 'halfmove', 'fullmove')
+
+	def __init__(self, side='white', castling=0, en_passant=-1, halfmove=0, fullmove=1):
+		"""
+		side: 'white' or 'black', the player to move.
+		castling: castling rights, a combination of the castling rights bits.
+		en_passant: square number the player to move may capture en passant on, or -1. It is only set when a pawn of
+			the player to move stands next to the pawn that has just advanced two squares.
+		halfmove: number of moves since the last capture or pawn move.
+		fullmove: number of the move being played, starting at 1 and increasing after each black move.
+		"""
+		self.side = side
+		self.castling = castling
+		self.en_passant = en_passant
+		self.halfmove = halfmove
+		self.fullmove = fullmove
+
+	def copy(self):
+		"""Return a copy of the state."""
+		return GameState(self.side, self.castling, self.en_passant, self.halfmove, self.fullmove)
+
+	def __eq__(self, other):
+		return type(other) == GameState and (self.side, self.castling, self.en_passant, self.halfmove, self.fullmove) == (other.side, other.castling, other.en_passant, other.halfmove, other.fullmove)
+
+	def __repr__(self):
+		return 'GameState(' + ', '.join(repr(getattr(self, name)) for name in self.__slots__) + ')'
+
+
+class Board:
+	"""
+	Chessboard backed by a flat array of 64 integer piece codes indexed by square number.
+
+	The board can also be used like the dict of algebraic locations it replaces: board['e4'] holds a Piece or 'empty'.
+
+	state is the GameState of the position. key is the board's Zobrist key, hashing the pieces, the castling rights and
+	en passant square of state, and the player to move; it is kept up to date as pieces are placed and moved. Placing a
+	King or Rook on a castling square, or setting its moved flag there, grants or takes away the castling rights it
+	takes part in, so a board set up by hand can castle as its moved flags say.
+
+	kings maps each color to the square number of its king, or -1 if it has none, and by_color maps each color to a
+	dict from the square numbers of its pieces to the pieces. Both are kept up to date as pieces are placed and moved.
+
+	middlegame and endgame are the material and piece-square scores of the pieces, positive for white, and phase is
+	the sum of their game phase weights. pawn_key is the XOR of the Zobrist keys of the pawns alone. They too are
+	updated as pieces are placed, with the difference made by each square, so evaluation.evaluate need not walk the
+	board.
+	"""
+
+	def __init__(self):
+		"""Create an empty board."""
+		self.squares = [EMPTY] * 64
+		self.pieces = ['empty'] * 64
+		self.key = 0
+		self.state = GameState()
+		self.kings = {'white': -1, 'black': -1}
+		self.by_color = {'white': {}, 'black': {}}
+		self.middlegame = 0
+		self.endgame = 0
+		self.phase = 0
+		self.pawn_key = 0
+
+	def __getitem__(self, location):
+		return self.pieces[SQUARES[location]]
+
+	def __setitem__(self, location, piece):
+		index = SQUARES[location]
+		removed = self.pieces[index]
+		if removed != 'empty':
+			del self.by_color[removed.color][index]
+			if removed.kind == KING and self.kings[removed.color] == index:
+				self.kings[removed.color] = -1
+		if piece == 'empty':
+			code = EMPTY
+		else:
+			code = piece.kind | COLORS[piece.color]
+			self.by_color[piece.color][index] = piece
+			if piece.kind == KING:
+				self.kings[piece.color] = index
+		old = self.squares[index]
+		self.key ^= ZOBRIST_PIECES[old][index] ^ ZOBRIST_PIECES[code][index]
+		self.middlegame += MIDDLEGAME_SCORES[code][index] - MIDDLEGAME_SCORES[old][index]
+		self.endgame += ENDGAME_SCORES[code][index] - ENDGAME_SCORES[old][index]
+		self.phase += PHASES[code] - PHASES[old]
+		if old & 7 == PAWN or code & 7 == PAWN:
+			self.pawn_key ^= ZOBRIST_PAWNS[old][index] ^ ZOBRIST_PAWNS[code][index]
+		self.pieces[index] = piece
+		self.squares[index] = code
+		if CASTLING_HOMES_AT[index]:
+			self.sync_castling(index)
+
+	def sync_castling(self, index):
+		"""
+		(Mutating) Set the castling rights of state that involve square number index from the pieces and their moved
+		flags, keeping key up to date.
+
+		A right is held while the King and Rook it moves stand on their squares and have not moved. Moves take rights
+		away by themselves, so this only matters for boards set up by hand.
+		"""
+		state = self.state
+		squares = self.squares
+		castling = state.castling
+		for right, king, rook, color in CASTLING_HOMES_AT[index]:
+			if squares[king] == KING | color and squares[rook] == ROOK | color and not self.pieces[king].moved and not self.pieces[rook].moved:
+				castling |= right
+			else:
+				castling &= ~right
+		if castling != state.castling:
+			self.key ^= ZOBRIST_CASTLING[state.castling] ^ ZOBRIST_CASTLING[castling]
+			state.castling = castling
+
+	def __contains__(self, location):
+		return location in SQUARES
+
+	def __iter__(self):
+		return iter(NAMES)
+
+	def __len__(self):
+		return 64
+
+	def keys(self):
+		"""Return the locations of all squares."""
+		return NAMES
+
+	def values(self):
+		"""Return the contents of all squares, in the same order as keys()."""
+		return list(self.pieces)
+
+	def items(self):
+		"""Return (location, contents) pairs for all squares."""
+		return list(zip(NAMES, self.pieces))
+
+	def get(self, location, default=None):
+		"""Return the contents of location, or default if location is not on the board."""
+		if location in SQUARES:
+			return self.pieces[SQUARES[location]]
+		return default
+
+
+def is_square_attacked(board, square, by_color):
+	"""
+	Return if any piece of by_color attacks square.
+
+	Looks outward from square along the knight, pawn, king and slider lines, stopping each line at its first piece.
+
+	Args:
+		board: chessboard.
+		square: square number, or location such as 'e4'.
+		by_color: 'white' or 'black'.
+
+	Returns:
+		A boolean representing if a piece of by_color could capture on square.
+	"""
+	if type(square) == str:
+		square = SQUARES[square]
+	squares = board.squares
+	color = COLORS[by_color]
+
+	pawn = PAWN | color
+	for target in PAWN_CAPTURES['black' if by_color == 'white' else 'white'][square]:
+		if target != -1 and squares[target] == pawn:
+			return True
+	knight = KNIGHT | color
+	for target in KNIGHT_TARGETS[square]:
+		if squares[target] == knight:
+			return True
+	king = KING | color
+	for target in KING_TARGETS[square]:
+		if squares[target] == king:
+			return True
+
+	queen = QUEEN | color
+	rook = ROOK | color
+	for ray in ROOK_RAYS[square]:
+		for target in ray:
+			if squares[target] != EMPTY:
+				if squares[target] == rook or squares[target] == queen:
+					return True
+				break
+	bishop = BISHOP | color
+	for ray in BISHOP_RAYS[square]:
+		for target in ray:
+			if squares[target] != EMPTY:
+				if squares[target] == bishop or squares[target] == queen:
+					return True
+				break
+	return False
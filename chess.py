@@ -1,41 +1,33 @@
 from utils import *
-import pygame
+from render import SIZE, YELLOW, GREEN, pygame
+import render
 import sys
-import os
 
 
-SIZE = 600
 SQUARE_SIZE = SIZE / 8
-BLACK = 0, 0, 0
-WHITE = 255, 255, 255
-LIGHT = 210, 180, 140
-DARK = 139, 69, 19
-YELLOW = 255, 215, 0
-GREEN = 154, 205, 50
 TAN = 245, 222, 179
 
-pygame.init()
+# the Pygame window, opened by main() so that importing this module has no side effects
+screen = None
 
-# images found at:
-# https://commons.wikimedia.org/wiki/Category:PNG_chess_pieces/Standard_transparent
 
-white_pawn = pygame.image.load(os.path.join('images', 'WP.png'))
-white_rook = pygame.image.load(os.path.join('images', 'WR.png'))
-white_knight = pygame.image.load(os.path.join('images', 'WN.png'))
-white_bishop = pygame.image.load(os.path.join('images', 'WB.png'))
-white_queen = pygame.image.load(os.path.join('images', 'WQ.png'))
-white_king = pygame.image.load(os.path.join('images', 'WK.png'))
-black_pawn = pygame.image.load(os.path.join('images', 'BP.png'))
-black_rook = pygame.image.load(os.path.join('images', 'BR.png'))
-black_knight = pygame.image.load(os.path.join('images', 'BN.png'))
-black_bishop = pygame.image.load(os.path.join('images', 'BB.png'))
-black_queen = pygame.image.load(os.path.join('images', 'BQ.png'))
-black_king = pygame.image.load(os.path.join('images', 'BK.png'))
+def draw_square(board, location, highlight=None, size=SIZE, clear=True):
+	"""
+	Draw one square of board, with its piece, in the Pygame window.
 
-screen = pygame.display.set_mode((SIZE, SIZE))
+	Args:
+		location: location of the square.
+		highlight: color to highlight the square with, or None.
+		size: size of the Pygame window.
+		clear: whether to draw the empty square first; False if the background has just been drawn.
+
+	Returns:
+		The pygame.Rect drawn over.
+	"""
+	return render.draw_square(screen, board, location, highlight, size, clear)
 
 
-def display_board(board, pending=False, clicked_location=None, size=SIZE):
+def display_board(board, pending=False, clicked_location=None, size=SIZE, targets=None, changed=None):
 	"""
 	Display board in the Pygame window.
 
@@ -43,55 +35,34 @@ def display_board(board, pending=False, clicked_location=None, size=SIZE):
 		pending: boolean representing if the user has chosen a piece to move, but hasn't chosen its new location yet.
 		clicked_location: if pending, the location of the piece the user has chosen.
 		size: size of the Pygame window.
+		targets: if pending, the locations the chosen piece may move to; looked up in MOVE_CACHE if None.
+		changed: locations to redraw, or None to redraw the whole board.
+
+	Returns:
+		The list of pygame.Rects drawn over, to pass to pygame.display.update.
 	"""
-	square_size = size / 8
-	border = square_size/15
-	c = 0
-	for column in range(8):
-		r = 0
-		for row in range(8):
-			if (column + row) % 2 == 0:
-				pygame.draw.rect(screen, LIGHT, [c, r, square_size, square_size])
-			else:
-				pygame.draw.rect(screen, DARK, [c, r, square_size, square_size])
-			if pending and clicked_location == chr(ord('a') + column) + str(8 - row):
-				pygame.draw.rect(screen, YELLOW, [c + border, r + border, square_size - 2 * border, square_size - 2 * border])
-			if pending and board[clicked_location].valid_move(chr(ord('a') + column) + str(8 - row)):
-				pygame.draw.rect(screen, GREEN, [c + border, r + border, square_size - 2 * border, square_size - 2 * border])
-			r += square_size
-		c += square_size
-
-	c = (square_size - 60) / 2
-	for column in range(ord('a'), ord('h') + 1):
-		r = (square_size - 60) / 2
-		for row in range(8, 0, -1):
-			position = chr(column) + str(row)
-			if type(board[position]) == Pawn and board[position].color == 'white':
-				screen.blit(white_pawn, (c, r))
-			if type(board[position]) == Rook and board[position].color == 'white':
-				screen.blit(white_rook, (c, r))
-			if type(board[position]) == Knight and board[position].color == 'white':
-				screen.blit(white_knight, (c, r))
-			if type(board[position]) == Bishop and board[position].color == 'white':
-				screen.blit(white_bishop, (c, r))
-			if type(board[position]) == Queen and board[position].color == 'white':
-				screen.blit(white_queen, (c, r))
-			if type(board[position]) == King and board[position].color == 'white':
-				screen.blit(white_king, (c, r))
-			if type(board[position]) == Pawn and board[position].color == 'black':
-				screen.blit(black_pawn, (c, r))
-			if type(board[position]) == Rook and board[position].color == 'black':
-				screen.blit(black_rook, (c, r))
-			if type(board[position]) == Knight and board[position].color == 'black':
-				screen.blit(black_knight, (c, r))
-			if type(board[position]) == Bishop and board[position].color == 'black':
-				screen.blit(black_bishop, (c, r))
-			if type(board[position]) == Queen and board[position].color == 'black':
-				screen.blit(black_queen, (c, r))
-			if type(board[position]) == King and board[position].color == 'black':
-				screen.blit(black_king, (c, r))
-			r += square_size
-		c += square_size
+	if pending and targets is None:
+		targets = [end for start, end in MOVE_CACHE.legal_moves(board, board[clicked_location].color) if start == clicked_location]
+	if changed is None:
+		screen.blit(render.background(size), (0, 0))
+		for location in board.keys():
+			if pending and location == clicked_location:
+				draw_square(board, location, YELLOW, size, False)
+			elif pending and location in targets:
+				draw_square(board, location, GREEN, size, False)
+			elif board[location] != 'empty':
+				draw_square(board, location, None, size, False)
+		return [pygame.Rect(0, 0, size, size)]
+
+	rects = []
+	for location in changed:
+		if pending and location == clicked_location:
+			rects.append(draw_square(board, location, YELLOW, size))
+		elif pending and location in targets:
+			rects.append(draw_square(board, location, GREEN, size))
+		else:
+			rects.append(draw_square(board, location, None, size))
+	return rects
 
 
 def display_promotion(player, size=SIZE):
@@ -105,86 +76,97 @@ def display_promotion(player, size=SIZE):
 	Returns:
 		The user's choice: 'Queen', 'Rook', 'Bishop', or 'Knight'.
 	"""
-	left_edge = (size - 375) / 2
-	top_edge = (size - 75) / 2
-	pygame.draw.rect(screen, TAN, [left_edge, top_edge, 375, 75])
-	if player == 'white':
-		screen.blit(white_queen, (left_edge + 27 + (87 * 0), top_edge + 7.5))
-		screen.blit(white_rook, (left_edge + 27 + (87 * 1), top_edge + 7.5))
-		screen.blit(white_bishop, (left_edge + 27 + (87 * 2), top_edge + 7.5))
-		screen.blit(white_knight, (left_edge + 27 + (87 * 3), top_edge + 7.5))
-	else:
-		screen.blit(black_queen, (left_edge + 27 + (87 * 0), top_edge + 7.5))
-		screen.blit(black_rook, (left_edge + 27 + (87 * 1), top_edge + 7.5))
-		screen.blit(black_bishop, (left_edge + 27 + (87 * 2), top_edge + 7.5))
-		screen.blit(black_knight, (left_edge + 27 + (87 * 3), top_edge + 7.5))
-	pygame.display.flip()
+	# the panel is laid out for a 600 pixel window, and scaled to size
+	scale = size / 600
+	width = 375 * scale
+	height = 75 * scale
+	left_edge = (size - width) / 2
+	top_edge = (size - height) / 2
+	pygame.draw.rect(screen, TAN, [left_edge, top_edge, width, height])
+	for index, piece in enumerate((Queen, Rook, Bishop, Knight)):
+		render.sprites(size).blit(screen, (piece, player), (left_edge + (57 + 87 * index) * scale, top_edge + height / 2))
+	pygame.display.update([left_edge, top_edge, width, height])
 
 	while True:
-		for event in pygame.event.get():
-			if event.type == pygame.QUIT:
-				pygame.quit()
-				sys.exit()
-			if event.type == pygame.MOUSEBUTTONUP:
-				x, y = pygame.mouse.get_pos()
-				if top_edge < y and y < top_edge + 75:
-					if left_edge < x and x < left_edge + 100.5:
-						return 'Queen'
-					if left_edge + 100.5 < x and x < left_edge + 375 / 2:
-						return 'Rook'
-					if left_edge + 375 / 2 < x and x < left_edge + 375 - 100.5:
-						return 'Bishop'
-					if left_edge + 375 - 100.5 < x and x < left_edge + 375:
-						return 'Knight'
-
-
-BOARD = starting_board()
-display_board(BOARD)
-pygame.display.flip()
-
-pending = False
-player = 'white'
-pygame.display.set_caption("White's turn")
-start = None
-game_over = False
-
-while True:
-	for event in pygame.event.get():
+		event = pygame.event.wait()
 		if event.type == pygame.QUIT:
 			pygame.quit()
 			sys.exit()
+		if event.type == pygame.MOUSEBUTTONUP:
+			x, y = event.pos
+			if top_edge < y and y < top_edge + height:
+				if left_edge < x and x < left_edge + 100.5 * scale:
+					return 'Queen'
+				if left_edge + 100.5 * scale < x and x < left_edge + width / 2:
+					return 'Rook'
+				if left_edge + width / 2 < x and x < left_edge + width - 100.5 * scale:
+					return 'Bishop'
+				if left_edge + width - 100.5 * scale < x and x < left_edge + width:
+					return 'Knight'
+
+
+def main():
+	"""Open the Pygame window and run a two-player game until the window is closed."""
+	global screen
+	pygame.init()
+	screen = pygame.display.set_mode((SIZE, SIZE))
+
+	board = starting_board()
+	display_board(board)
+	pygame.display.flip()
+
+	pending = False
+	player = 'white'
+	pygame.display.set_caption("White's turn")
+	start = None
+	targets = []
+	game_over = False
+
+	# block until the next event, so that an idle game uses no CPU
+	while True:
+		event = pygame.event.wait()
+		if event.type == pygame.QUIT:
+			pygame.quit()
+			return
 		if event.type == pygame.MOUSEBUTTONUP:
 			if game_over:
 				continue
-			x, y = pygame.mouse.get_pos()
+			x, y = event.pos
 			column = chr(ord('a') + int(x // SQUARE_SIZE))
 			row = 8 - (y // SQUARE_SIZE)
 			position = column + str(int(row))
-			if not pending and BOARD[position] != 'empty' and BOARD[position].color == player:
+			before = list(board.squares)
+			changed = set([start] + targets) if pending else set()
+			if not pending and board[position] != 'empty' and board[position].color == player:
 				start = position
+				targets = [end for begin, end in MOVE_CACHE.legal_moves(board, player) if begin == start]
 				pending = True
 			elif pending:
-				piece = BOARD[start]
-				if piece != 'empty' and BOARD[start].valid_move(position):
+				piece = board[start]
+				if position in targets:
 					piece.make_move(position)
 					if type(piece) == Pawn and piece.promoted:
-						display_board(BOARD)
-						promote(BOARD, display_promotion(player), player, position)
-					if not can_move(opponent(player), BOARD):
-						for position in BOARD.keys():
-							if type(BOARD[position]) == King and BOARD[position].color == opponent(player):
-								if BOARD[position].check(position):
-									pygame.display.set_caption('Checkmate!  ' + player.title() + ' wins!')
-								else:
-									pygame.display.set_caption('Stalemate!')
-								break
-						display_board(BOARD)
+						# show the pawn on its new square, without the highlights, behind the promotion choices
+						pygame.display.update(display_board(board))
+						promote(board, display_promotion(player), player, position)
+						display_board(board)
 						pygame.display.flip()
-						pending = False
+					status = MOVE_CACHE.status(board, opponent(player))
+					if status == 'checkmate':
+						pygame.display.set_caption('Checkmate!  ' + player.title() + ' wins!')
+						game_over = True
+					elif status == 'stalemate':
+						pygame.display.set_caption('Stalemate!')
 						game_over = True
-						break
-					player = opponent(player)
-					pygame.display.set_caption(player.title() + "'s turn")
+					else:
+						player = opponent(player)
+						pygame.display.set_caption(player.title() + "'s turn")
 				pending = False
-			display_board(BOARD, pending, start)
-			pygame.display.flip()
+			if pending:
+				changed.update([start] + targets)
+			changed.update(NAMES[index] for index in range(64) if before[index] != board.squares[index])
+			pygame.display.update(display_board(board, pending, start, targets=targets, changed=changed))
+
+
+if __name__ == '__main__':
+	main()
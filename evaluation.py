@@ -0,0 +1,190 @@
+from utils import *
+
+
+# pawn structure penalties and bonuses, as (middlegame, endgame) pairs
+DOUBLED_PAWN = (-10, -25)
+ISOLATED_PAWN = (-12, -15)
+# bonus for a passed pawn by the number of rows it has advanced from its starting row
+PASSED_PAWN = (
+	(0, 0),
+	(5, 10),
+	(10, 17),
+	(15, 30),
+	(30, 55),
+	(60, 100),
+)
+# middlegame bonus for each pawn one and two rows in front of a castled king, on its column or the columns beside it
+SHIELD_PAWN = (15, 8)
+# middlegame penalty for each column beside or under the king with no pawn of the king's color
+OPEN_FILE_NEAR_KING = -20
+# middlegame penalty for each opponent piece (besides pawns and the king) within two squares of the king
+KING_ATTACKER = -8
+# the squares within two squares of each square
+KING_ZONES = [frozenset(target for target in range(64) if abs(target % 8 - index % 8) <= 2 and abs(target // 8 - index // 8) <= 2) for index in range(64)]
+
+
+def piece_scores(board):
+	"""
+	Return the material and piece-square scores of board, computed from scratch.
+
+	Only used to check the scores board keeps up to date as pieces are placed and moved.
+
+	Returns:
+		A (middlegame, endgame, phase) tuple, equal to (board.middlegame, board.endgame, board.phase).
+	"""
+	middlegame = 0
+	endgame = 0
+	phase = 0
+	for index, code in enumerate(board.squares):
+		middlegame += MIDDLEGAME_SCORES[code][index]
+		endgame += ENDGAME_SCORES[code][index]
+		phase += PHASES[code]
+	return middlegame, endgame, phase
+
+
+def verify(board):
+	"""Return if the scores and pawn key kept by board match the ones computed from scratch."""
+	pawn_key = 0
+	for index, code in enumerate(board.squares):
+		pawn_key ^= ZOBRIST_PAWNS[code][index]
+	return (board.middlegame, board.endgame, board.phase, board.pawn_key) == piece_scores(board) + (pawn_key,)
+
+
+def pawn_structure(board):
+	"""
+	Return the doubled, isolated and passed pawn scores of board, positive for white.
+
+	Returns:
+		A (middlegame, endgame) tuple.
+	"""
+	columns = {WHITE: [0] * 8, BLACK: [0] * 8}
+	# the row of the rearmost pawn of each color on each column: the lowest for white, the highest for black
+	backs = {WHITE: [8] * 8, BLACK: [-1] * 8}
+	pawns = []
+	for player, color in COLORS.items():
+		for index, piece in board.by_color[player].items():
+			if piece.kind == PAWN:
+				column = index % 8
+				row = index // 8
+				columns[color][column] += 1
+				backs[color][column] = min(backs[color][column], row) if color == WHITE else max(backs[color][column], row)
+				pawns.append((color, column, row))
+
+	middlegame = 0
+	endgame = 0
+	for color in (WHITE, BLACK):
+		sign = 1 if color == WHITE else -1
+		for column in range(8):
+			if columns[color][column] > 1:
+				middlegame += sign * DOUBLED_PAWN[0] * (columns[color][column] - 1)
+				endgame += sign * DOUBLED_PAWN[1] * (columns[color][column] - 1)
+
+	for color, column, row in pawns:
+		sign = 1 if color == WHITE else -1
+		left = column - 1
+		right = column + 1
+		own = columns[color]
+		if (left < 0 or not own[left]) and (right > 7 or not own[right]):
+			middlegame += sign * ISOLATED_PAWN[0]
+			endgame += sign * ISOLATED_PAWN[1]
+		# passed if no opponent pawn stands ahead of it on its column or the columns beside it
+		enemy = backs[color ^ BLACK]
+		if color == WHITE:
+			passed = enemy[column] <= row and (left < 0 or enemy[left] <= row) and (right > 7 or enemy[right] <= row)
+			advanced = row - 1
+		else:
+			passed = enemy[column] >= row and (left < 0 or enemy[left] >= row) and (right > 7 or enemy[right] >= row)
+			advanced = 6 - row
+		if passed:
+			middlegame += sign * PASSED_PAWN[advanced][0]
+			endgame += sign * PASSED_PAWN[advanced][1]
+	return middlegame, endgame
+
+
+def king_shelter(board):
+	"""
+	Return the middlegame score of the pawns sheltering each king and the open columns around it, positive for white.
+
+	Depends only on where the pawns and kings stand, so it is cached with the pawn structure.
+	"""
+	squares = board.squares
+	score = 0
+	for player, color, forward in (('white', WHITE, 8), ('black', BLACK, -8)):
+		king = board.kings[player]
+		if king == -1:
+			continue
+		sign = 1 if color == WHITE else -1
+		column = king % 8
+		pawn = PAWN | color
+		for side in (column - 1, column, column + 1):
+			if not 0 <= side < 8:
+				continue
+			if pawn not in squares[side::8]:
+				score += sign * OPEN_FILE_NEAR_KING
+			for distance in (1, 2):
+				target = king - column + side + distance * forward
+				if 0 <= target < 64 and squares[target] == pawn:
+					score += sign * SHIELD_PAWN[distance - 1]
+	return score
+
+
+def king_attackers(board):
+	"""Return the middlegame score of the opponent pieces close to each king, positive for white."""
+	squares = board.squares
+	score = 0
+	for player, sign in (('white', 1), ('black', -1)):
+		king = board.kings[player]
+		if king == -1:
+			continue
+		zone = KING_ZONES[king]
+		for index in board.by_color[opponent(player)]:
+			if index in zone and squares[index] & 7 != PAWN and squares[index] & 7 != KING:
+				score += sign * KING_ATTACKER
+	return score
+
+
+def king_safety(board):
+	"""Return the middlegame king safety score of board, positive for white: king_shelter and king_attackers together."""
+	return king_shelter(board) + king_attackers(board)
+
+
+# pawn structure and king shelter scores by pawn key and king squares, emptied when it holds PAWN_TABLE_SIZE entries
+PAWN_TABLE_SIZE = 1 << 14
+_pawn_table = {}
+
+
+def _pawn_scores(board):
+	"""Return the (middlegame, endgame) pawn structure and king shelter scores of board, looked up in _pawn_table."""
+	key = (board.pawn_key, board.kings['white'], board.kings['black'])
+	scores = _pawn_table.get(key)
+	if scores is None:
+		if len(_pawn_table) >= PAWN_TABLE_SIZE:
+			_pawn_table.clear()
+		middlegame, endgame = pawn_structure(board)
+		scores = _pawn_table[key] = (middlegame + king_shelter(board), endgame)
+	return scores
+
+
+def evaluate(board, player):
+	"""
+	Return the static evaluation of board in centipawns, from the point of view of player.
+
+	The material and piece-square scores kept by board, and the pawn structure and king safety scores, are blended
+	between their middlegame and endgame values by the game phase of the pieces left on the board. Positions with the
+	same pawns and kings share their pawn structure and king shelter scores through a cache.
+
+	Args:
+		board: chessboard.
+		player: 'white' or 'black'.
+
+	Returns:
+		An integer, positive if player stands better.
+	"""
+	pawns_middlegame, pawns_endgame = _pawn_scores(board)
+	middlegame = board.middlegame + pawns_middlegame + king_attackers(board)
+	endgame = board.endgame + pawns_endgame
+	phase = min(board.phase, PHASE_TOTAL)
+	blend = middlegame * phase + endgame * (PHASE_TOTAL - phase)
+	# rounded toward zero, so that a position scores the same for either color with the board flipped
+	score = blend // PHASE_TOTAL if blend >= 0 else -(-blend // PHASE_TOTAL)
+	return score if player == 'white' else -score
@@ -0,0 +1,252 @@
+import argparse
+import functools
+import importlib
+import json
+import sys
+import time
+import tracemalloc
+import types
+
+
+# functions counted and timed by default, as (module, name) pairs; a name with a dot is a method of a class
+TARGETS = (
+	('pieces', 'Pawn.get_moves'),
+	('pieces', 'Rook.get_moves'),
+	('pieces', 'Knight.get_moves'),
+	('pieces', 'Bishop.get_moves'),
+	('pieces', 'Queen.get_moves'),
+	('pieces', 'King.get_moves'),
+	('pieces', 'Piece.valid_move'),
+	('pieces', 'King.check'),
+	('pieces', 'King._castle'),
+	# the rules no longer copy boards, but code that still does shows up here
+	('copy', 'deepcopy'),
+	('utils', 'can_move'),
+	('chess', 'display_board'),
+)
+
+
+class Stats:
+	"""Counts, time and memory of the calls to one instrumented function."""
+
+	__slots__ = ('calls', 'seconds', 'max_seconds', 'bytes')
+
+	def __init__(self):
+		self.calls = 0
+		self.seconds = 0.0
+		self.max_seconds = 0.0
+		self.bytes = 0
+
+	def to_dict(self):
+		"""Return the stats as a dict of plain numbers, with the mean time and memory per call."""
+		return {
+			'calls': self.calls,
+			'seconds': self.seconds,
+			'mean_us': self.seconds / self.calls * 1e6 if self.calls else 0.0,
+			'max_us': self.max_seconds * 1e6,
+			'bytes': self.bytes,
+			'bytes_per_call': self.bytes / self.calls if self.calls else 0.0,
+		}
+
+
+class Profiler:
+	"""
+	Counts and times the calls to the functions of the rules engine by wrapping them, while enabled.
+
+	Enabling replaces each target with a wrapper, in its class or in every loaded module that imported it, and disabling
+	puts the originals back, so the engine runs at full speed while no profiler is enabled. Only one profiler can be
+	enabled at a time. Times are inclusive: a call's time includes the instrumented functions it calls. A function that
+	calls itself, as deepcopy does for every object it copies, is counted once for its outermost call.
+
+	With memory set, tracemalloc also measures the peak memory allocated during each call, which slows the engine
+	down several times over, so the times of such a run are only good for comparing with each other.
+	"""
+
+	def __init__(self, targets=TARGETS, memory=False):
+		"""
+		targets: (module, name) pairs of the functions to instrument; a target whose module cannot be imported is skipped.
+		memory: whether to measure the memory allocated per call with tracemalloc.
+		"""
+		self.targets = targets
+		self.memory = memory
+		self.stats = {}
+		self.seconds = 0.0
+		self._patches = []
+		self._started = None
+		self._tracing = False
+		# peak traced memory seen so far by each instrumented call in progress
+		self._peaks = []
+
+	def enable(self):
+		"""(Mutating) Start counting, wrapping the targets."""
+		global _active
+		if _active is self:
+			return
+		if _active is not None:
+			raise RuntimeError('another Profiler is enabled')
+		_active = self
+		if self.memory and not tracemalloc.is_tracing():
+			tracemalloc.start()
+			self._tracing = True
+		for module_name, name in self.targets:
+			try:
+				module = importlib.import_module(module_name)
+			except ImportError:
+				continue
+			self._patch(module, name)
+		self._started = time.perf_counter()
+
+	def disable(self):
+		"""(Mutating) Stop counting, putting back the original functions."""
+		global _active
+		if _active is not self:
+			return
+		self.seconds += time.perf_counter() - self._started
+		for owner, name, original, inherited in reversed(self._patches):
+			if inherited:
+				delattr(owner, name)
+			else:
+				setattr(owner, name, original)
+		self._patches = []
+		if self._tracing:
+			tracemalloc.stop()
+			self._tracing = False
+		_active = None
+
+	def __enter__(self):
+		self.enable()
+		return self
+
+	def __exit__(self, *exception):
+		self.disable()
+
+	def reset(self):
+		"""(Mutating) Clear the stats, for example between games."""
+		for stats in self.stats.values():
+			stats.__init__()
+		self.seconds = 0.0
+		if _active is self:
+			self._started = time.perf_counter()
+
+	def _patch(self, module, name):
+		"""Wrap the function name of module, a method if name has a dot, wherever it can be called from."""
+		if '.' in name:
+			class_name, attribute = name.split('.')
+			owner = getattr(module, class_name)
+			inherited = attribute not in owner.__dict__
+			original = getattr(owner, attribute)
+			setattr(owner, attribute, self._wrap(name, original))
+			self._patches.append((owner, attribute, original, inherited))
+			return
+		original = getattr(module, name)
+		wrapper = self._wrap(name, original)
+		# modules that imported the function with from ... import * hold their own reference to it; modules still
+		# waiting to be loaded lazily, such as pygame, are left alone, as looking inside them would load them
+		for other in list(sys.modules.values()):
+			if type(other) == types.ModuleType and getattr(other, name, None) is original:
+				setattr(other, name, wrapper)
+				self._patches.append((other, name, original, False))
+
+	def _wrap(self, name, function):
+		"""Return a wrapper of function that adds each call to the stats of name."""
+		stats = self.stats.setdefault(name, Stats())
+		clock = time.perf_counter
+		# calls of the function in progress; the calls it makes to itself are not counted
+		depth = [0]
+		if not self.memory:
+			@functools.wraps(function)
+			def wrapper(*args, **kwargs):
+				if depth[0]:
+					return function(*args, **kwargs)
+				depth[0] += 1
+				begin = clock()
+				try:
+					return function(*args, **kwargs)
+				finally:
+					elapsed = clock() - begin
+					depth[0] -= 1
+					stats.calls += 1
+					stats.seconds += elapsed
+					if elapsed > stats.max_seconds:
+						stats.max_seconds = elapsed
+			return wrapper
+
+		peaks = self._peaks
+
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			if depth[0]:
+				return function(*args, **kwargs)
+			depth[0] += 1
+			current, peak = tracemalloc.get_traced_memory()
+			if peaks:
+				peaks[-1] = max(peaks[-1], peak)
+			peaks.append(current)
+			tracemalloc.reset_peak()
+			begin = clock()
+			try:
+				return function(*args, **kwargs)
+			finally:
+				elapsed = clock() - begin
+				depth[0] -= 1
+				peak = max(peaks.pop(), tracemalloc.get_traced_memory()[1])
+				if peaks:
+					peaks[-1] = max(peaks[-1], peak)
+				stats.calls += 1
+				stats.seconds += elapsed
+				stats.bytes += peak - current
+				if elapsed > stats.max_seconds:
+					stats.max_seconds = elapsed
+		return wrapper
+
+	def report(self):
+		"""Return the stats as a dict that can be written as JSON: the seconds spent enabled, and each function's stats."""
+		seconds = self.seconds + (time.perf_counter() - self._started if _active is self else 0.0)
+		return {'seconds': seconds, 'memory': self.memory, 'functions': {name: stats.to_dict() for name, stats in self.stats.items() if stats.calls}}
+
+	def format_report(self):
+		"""Return the stats as a text table, slowest total time first."""
+		report = self.report()
+		lines = ['function'.ljust(20) + 'calls'.rjust(11) + 'total ms'.rjust(13) + 'mean us'.rjust(11) + 'max us'.rjust(11) + 'bytes/call'.rjust(13)]
+		for name, stats in sorted(report['functions'].items(), key=lambda item: -item[1]['seconds']):
+			bytes_per_call = format(stats['bytes_per_call'], '.0f') if self.memory else '-'
+			lines.append(name.ljust(20) + str(stats['calls']).rjust(11) + format(stats['seconds'] * 1000, '13.2f') + format(stats['mean_us'], '11.2f') + format(stats['max_us'], '11.2f') + bytes_per_call.rjust(13))
+		lines.append('enabled for ' + format(report['seconds'], '.3f') + 's')
+		return '\n'.join(lines)
+
+
+# the enabled Profiler, or None
+_active = None
+
+
+def main():
+	"""Replay the games of a PGN file with the engine instrumented, and print where the time went."""
+	import pgn
+	parser = argparse.ArgumentParser(description='Count and time calls to the rules engine while replaying the games of a PGN file.')
+	parser.add_argument('file', help='PGN file')
+	parser.add_argument('-m', '--memory', action='store_true', help='also measure the memory allocated per call, with tracemalloc')
+	parser.add_argument('-g', '--per-game', action='store_true', help='report each game separately')
+	parser.add_argument('-j', '--json', help='write the report (a list of reports with --per-game) to this JSON file')
+	args = parser.parse_args()
+
+	profiler = Profiler(memory=args.memory)
+	reports = []
+	with profiler:
+		for game in pgn.read_games(args.file):
+			result = pgn.replay_game(game)
+			if args.per_game:
+				print('game ' + str(game.number) + ' (' + game.tags.get('White', '?') + ' - ' + game.tags.get('Black', '?') + ')  ' + str(result.plies) + ' plies')
+				print(profiler.format_report())
+				reports.append(dict(profiler.report(), game=game.number))
+				profiler.reset()
+	if not args.per_game:
+		print(profiler.format_report())
+		reports = profiler.report()
+	if args.json:
+		with open(args.json, 'w') as file:
+			json.dump(reports, file, indent=1)
+	return 0
+
+
+if __name__ == '__main__':
+	raise SystemExit(main())
@@ -0,0 +1,169 @@
+from pieces import *
+from utils import apply_castling
+import struct
+
+# a packed position: the occupancy bitboard (bit n set if square number n holds a piece), the codes of the pieces on the
+# occupied squares in increasing square order, two to a byte with the lower square in the low four bits, the state
+# byte, the halfmove clock and the fullmove number, all little-endian
+LAYOUT = struct.Struct('<Q16sBBH')
+SIZE = LAYOUT.size
+# piece kind marking the pawn that has just advanced two squares, when the player to move may capture it en passant
+PASSED_PAWN = 7
+# state byte: the castling rights bits, and SIDE_BLACK if black is to move
+SIDE_BLACK = 16
+
+
+def encode(board):
+	"""
+	Pack a position into SIZE bytes.
+
+	Args:
+		board: chessboard. The player to move, castling rights, en passant square and clocks are taken from its state.
+
+	Returns:
+		A bytes object of length SIZE. Packed positions can be joined into one bytes object for decode_array.
+
+	Raises:
+		ValueError: if board has more than 32 pieces, or clocks too large to pack.
+	"""
+	state = board.state
+	passed = -1
+	if state.en_passant != -1:
+		passed = state.en_passant - 8 if state.side == 'white' else state.en_passant + 8
+	occupied = 0
+	codes = []
+	for square, code in enumerate(board.squares):
+		if code != EMPTY:
+			occupied |= 1 << square
+			codes.append(code | PASSED_PAWN if square == passed else code)
+	if len(codes) > 32:
+		raise ValueError('cannot pack more than 32 pieces')
+	if state.halfmove > 255 or state.fullmove > 65535:
+		raise ValueError('cannot pack halfmove clock ' + str(state.halfmove) + ' and fullmove number ' + str(state.fullmove))
+	codes.append(EMPTY)
+	nibbles = bytes(codes[index] | codes[index + 1] << 4 for index in range(0, len(codes) - 1, 2))
+	side = SIDE_BLACK if state.side == 'black' else 0
+	return LAYOUT.pack(occupied, nibbles, state.castling | side, state.halfmove, state.fullmove)
+
+
+def decode(data):
+	"""
+	Unpack a position packed by encode.
+
+	The King and Rook moved flags are set from the castling rights with apply_castling, as from_fen sets them, so a
+	right whose King or Rook is missing or of the wrong color is dropped.
+
+	Args:
+		data: bytes-like object of length SIZE.
+
+	Returns:
+		A (board, player) tuple, where player is 'white' or 'black', the player to move.
+
+	Raises:
+		ValueError: if data is not SIZE bytes long.
+	"""
+	if len(data) != SIZE:
+		raise ValueError('packed position needs ' + str(SIZE) + ' bytes, not ' + str(len(data)))
+	occupied, nibbles, flags, halfmove, fullmove = LAYOUT.unpack(data)
+	board = Board()
+	index = 0
+	for square in range(64):
+		if not occupied >> square & 1:
+			continue
+		code = nibbles[index // 2] >> 4 * (index % 2) & 15
+		index += 1
+		color = 'black' if code & BLACK else 'white'
+		kind = code & 7
+		location = NAMES[square]
+		if kind == PASSED_PAWN:
+			kind = PAWN
+			board.state.en_passant = square + 8 if color == 'black' else square - 8
+		if kind in (ROOK, KING):
+			board[location] = PIECE_CLASSES[kind](color, location, board, True)
+		else:
+			board[location] = PIECE_CLASSES[kind](color, location, board)
+
+	apply_castling(board, flags & 15)
+	board.state.halfmove = halfmove
+	board.state.fullmove = fullmove
+	player = 'black' if flags & SIDE_BLACK else 'white'
+	rehash(board, player)
+	return board, player
+
+
+def _decode_array_python(data, count):
+	"""Unpack count packed positions without NumPy, into the lists decode_array returns."""
+	arrays = {'squares': [], 'side': [], 'castling': [], 'en_passant': [], 'halfmove': [], 'fullmove': []}
+	for offset in range(0, count * SIZE, SIZE):
+		occupied, nibbles, flags, halfmove, fullmove = LAYOUT.unpack_from(data, offset)
+		squares = [EMPTY] * 64
+		en_passant = -1
+		index = 0
+		for square in range(64):
+			if occupied >> square & 1:
+				code = nibbles[index // 2] >> 4 * (index % 2) & 15
+				index += 1
+				if code & 7 == PASSED_PAWN:
+					code ^= PASSED_PAWN ^ PAWN
+					en_passant = square + 8 if code & BLACK else square - 8
+				squares[square] = code
+		arrays['squares'].append(squares)
+		arrays['side'].append(1 if flags & SIDE_BLACK else 0)
+		arrays['castling'].append(flags & 15)
+		arrays['en_passant'].append(en_passant)
+		arrays['halfmove'].append(halfmove)
+		arrays['fullmove'].append(fullmove)
+	return arrays
+
+
+def decode_array(data):
+	"""
+	Unpack many packed positions at once into arrays, without building boards.
+
+	With NumPy installed every position is unpacked by the same few array operations; without it, the positions are
+	unpacked one by one into lists.
+
+	Args:
+		data: bytes-like object holding packed positions one after another, or a NumPy uint8 array of shape (N, SIZE).
+
+	Returns:
+		A dict of arrays (or lists) with one entry per position: 'squares', the (N, 64) int8 piece codes by square
+		number, as in Board.squares; 'side', 0 if white is to move and 1 if black is; 'castling', the castling rights;
+		'en_passant', the en passant square number or -1; 'halfmove' and 'fullmove', the clocks.
+
+	Raises:
+		ValueError: if the length of data is not a multiple of SIZE.
+	"""
+	if len(memoryview(data).cast('B')) % SIZE:
+		raise ValueError('packed positions take ' + str(SIZE) + ' bytes each')
+	count = len(memoryview(data).cast('B')) // SIZE
+	try:
+		# NumPy is optional, and slow to import, so it is only loaded here
+		import numpy
+	except ImportError:
+		return _decode_array_python(data, count)
+
+	packed = numpy.frombuffer(data, numpy.uint8).reshape(count, SIZE)
+	occupied = numpy.unpackbits(packed[:, :8], axis=1, bitorder='little').astype(bool)
+	nibbles = numpy.empty((count, 32), numpy.uint8)
+	nibbles[:, 0::2] = packed[:, 8:24] & 15
+	nibbles[:, 1::2] = packed[:, 8:24] >> 4
+	# the code of the nth occupied square is the nth nibble
+	order = numpy.maximum(numpy.cumsum(occupied, axis=1, dtype=numpy.int8) - 1, 0)
+	squares = numpy.where(occupied, numpy.take_along_axis(nibbles, order, axis=1), 0).astype(numpy.int8)
+
+	passed = squares & 7 == PASSED_PAWN
+	square = passed.argmax(axis=1)
+	black = squares[numpy.arange(count), square] & BLACK != 0
+	en_passant = numpy.where(passed.any(axis=1), numpy.where(black, square + 8, square - 8), -1).astype(numpy.int8)
+	squares[passed] ^= PASSED_PAWN ^ PAWN
+
+	flags = packed[:, 24]
+	return {
+		'squares': squares,
+		'side': (flags & SIDE_BLACK != 0).astype(numpy.uint8),
+		'castling': flags & 15,
+		'en_passant': en_passant,
+		'halfmove': packed[:, 25].copy(),
+		'fullmove': packed[:, 26].astype(numpy.uint16) | packed[:, 27].astype(numpy.uint16) << 8,
+	}
@@ -0,0 +1,162 @@
+from utils import *
+from multiprocessing import Pool
+import argparse
+import bitboard
+import time
+
+
+PROMOTIONS = ('Queen', 'Rook', 'Bishop', 'Knight')
+
+# published perft positions: (name, FEN, leaf counts at depths 1, 2, ...)
+POSITIONS = [
+	('initial', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1', [20, 400, 8902, 197281, 4865609]),
+	('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1', [48, 2039, 97862, 4085603]),
+	('position 3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', [14, 191, 2812, 43238, 674624]),
+	('position 4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', [6, 264, 9467, 422333]),
+	('position 5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', [44, 1486, 62379, 2103487]),
+	('position 6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10', [46, 2079, 89890, 3894594]),
+]
+
+
+def _promotions(board, start, end):
+	"""Return the pieces the move from start to end may promote to, or (None,) if it is not a promotion."""
+	if type(board[start]) == Pawn and end[1] in '18':
+		return PROMOTIONS
+	return (None,)
+
+
+def _move_perft(board, player, start, end, promotion, depth):
+	"""Return the number of leaf nodes depth - 1 moves below the move from start to end."""
+	undo = make_move(board, start, end)
+	if promotion is not None:
+		promote(board, promotion, player, end)
+	nodes = perft(board, opponent(player), depth - 1)
+	unmake_move(board, undo)
+	return nodes
+
+
+def perft(board, player, depth):
+	"""
+	Count the leaf nodes of the tree of legal moves from a position.
+
+	Args:
+		board: chessboard.
+		player: 'white' or 'black', the player to move.
+		depth: number of moves deep to search.
+
+	Returns:
+		The number of move sequences of length depth, counting each choice of promotion as a separate move.
+	"""
+	if depth == 0:
+		return 1
+	moves = generate_legal_moves(board, player)
+	if depth == 1:
+		return sum(len(_promotions(board, start, end)) for start, end in moves)
+	nodes = 0
+	for start, end in moves:
+		for promotion in _promotions(board, start, end):
+			nodes += _move_perft(board, player, start, end, promotion, depth)
+	return nodes
+
+
+def _bitboard_move_perft(position, move, depth):
+	"""Return the number of leaf nodes depth - 1 moves below move in a bitboard Position."""
+	return bitboard.perft(position.make_move(move), depth - 1)
+
+
+def divide(board, player, depth, workers=1, backend='pieces'):
+	"""
+	Count the leaf nodes below each legal move from a position.
+
+	Args:
+		board: chessboard.
+		player: 'white' or 'black', the player to move.
+		depth: number of moves deep to search, at least 1.
+		workers: number of processes to split the moves across.
+		backend: 'pieces' to count with the chessboard, or 'bitboard' to count with a bitboard.Position of it.
+
+	Returns:
+		A dict from each move, such as 'e2e4' or 'e7e8q', to its number of leaf nodes.
+	"""
+	tasks = []
+	moves = []
+	if backend == 'bitboard':
+		function = _bitboard_move_perft
+		position = bitboard.from_board(board, player)
+		for move in position.legal_moves():
+			start, end, promotion = move
+			tasks.append((position, move, depth))
+			moves.append(NAMES[start] + NAMES[end] + (PROMOTION_LETTERS[PIECE_CLASSES[promotion].__name__] if promotion else ''))
+	else:
+		function = _move_perft
+		for start, end in generate_legal_moves(board, player):
+			for promotion in _promotions(board, start, end):
+				tasks.append((board, player, start, end, promotion, depth))
+				moves.append(start + end + PROMOTION_LETTERS.get(promotion, ''))
+	if workers > 1:
+		with Pool(workers) as pool:
+			counts = pool.starmap(function, tasks)
+	else:
+		counts = [function(*task) for task in tasks]
+	return dict(zip(moves, counts))
+
+
+def _positions(args):
+	"""Yield the (name, board, player, expected counts) of the positions to run, reading an EPD file lazily."""
+	if args.suite:
+		for name, fen, counts in POSITIONS:
+			board, player = from_fen(fen)
+			yield name, board, player, counts[:args.depth]
+	elif args.epd:
+		for board, player, operations in read_epd(args.epd):
+			counts = []
+			while 'D' + str(len(counts) + 1) in operations and len(counts) < args.depth:
+				counts.append(int(operations['D' + str(len(counts) + 1)]))
+			yield operations.get('id', to_fen(board)), board, player, counts
+	else:
+		board, player = from_fen(args.fen)
+		yield args.fen, board, player, []
+
+
+def main():
+	"""Run perft from the command line and report node counts, elapsed time and nodes per second."""
+	parser = argparse.ArgumentParser(description='Count the leaf nodes of the legal move tree of a chess position.')
+	parser.add_argument('fen', nargs='?', default=POSITIONS[0][1], help='FEN record of the position (default: the starting position)')
+	parser.add_argument('-d', '--depth', type=int, default=3, help='number of moves deep to search (default: 3)')
+	parser.add_argument('--divide', action='store_true', help='report the leaf nodes below each legal move')
+	parser.add_argument('-w', '--workers', type=int, default=1, help='number of processes to split root moves across (default: 1)')
+	parser.add_argument('--suite', action='store_true', help='check the published perft positions up to depth instead')
+	parser.add_argument('--backend', choices=('pieces', 'bitboard'), default='pieces', help='move generator to count with (default: pieces)')
+	parser.add_argument('--epd', help='check the positions of an EPD file, with expected counts in D1, D2, ... operations, up to depth instead')
+	args = parser.parse_args()
+
+	checking = args.suite or args.epd is not None
+	failed = False
+	for name, board, player, counts in _positions(args):
+		depth = len(counts) if checking else args.depth
+		if depth == 0:
+			continue
+		begin = time.perf_counter()
+		if args.divide or args.workers > 1:
+			moves = divide(board, player, depth, args.workers, args.backend)
+			nodes = sum(moves.values())
+		elif args.backend == 'bitboard':
+			moves = {}
+			nodes = bitboard.perft(bitboard.from_board(board, player), depth)
+		else:
+			moves = {}
+			nodes = perft(board, player, depth)
+		elapsed = time.perf_counter() - begin
+		if args.divide:
+			for move, count in sorted(moves.items()):
+				print(move + ': ' + str(count))
+		status = ''
+		if checking:
+			status = '  ok' if nodes == counts[-1] else '  FAILED (expected ' + str(counts[-1]) + ')'
+			failed = failed or nodes != counts[-1]
+		print(name + '  depth ' + str(depth) + '  nodes ' + str(nodes) + '  time ' + format(elapsed, '.3f') + 's  nps ' + str(int(nodes / elapsed) if elapsed else 0) + status)
+	return 1 if failed else 0
+
+
+if __name__ == '__main__':
+	raise SystemExit(main())
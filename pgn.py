@@ -0,0 +1,309 @@
+from utils import *
+import argparse
+import re
+import threading
+import time
+
+
+SAN_PIECES = {'N': Knight, 'B': Bishop, 'R': Rook, 'Q': Queen, 'K': King}
+SAN_PROMOTIONS = {'Q': 'Queen', 'R': 'Rook', 'B': 'Bishop', 'N': 'Knight'}
+# piece letter, file and rank the piece moves from, capture, location moved to, promotion
+SAN = re.compile(r'([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=?([NBRQ]))?$')
+# one token after any white space: a tag pair, the start of a comment or a variation, the end of a variation, a numeric
+# annotation, a result, a move number, or a move
+TOKEN = re.compile(r'\s*(?:\[\s*(\w+)\s*"((?:[^"\\]|\\.)*)"\s*\]|([{;()])|\$\d+|(1-0|0-1|1/2-1/2|\*)|\d+\.+|([^\s\[\]{};()$.]+))')
+
+
+class Game:
+	"""A game read from a PGN file: its tag pairs, its moves in SAN, and its result."""
+
+	def __init__(self, number, tags, moves, result):
+		"""
+		number: position of the game in its file, starting at 1.
+		tags: dict from tag names, such as 'White' or 'FEN', to their values.
+		moves: list of the moves of the game in SAN, such as 'e4' or 'Nbd7', leaving out variations.
+		result: '1-0', '0-1', '1/2-1/2' or '*'.
+		"""
+		self.number = number
+		self.tags = tags
+		self.moves = moves
+		self.result = result
+
+
+class Replay:
+	"""Outcome of replaying a Game with the rules of pieces.py."""
+
+	def __init__(self, number, tags, result, plies, error, fen, ending):
+		"""
+		number: position of the game in its file, starting at 1.
+		tags: the game's tag pairs.
+		result: the game's result, as given in its file.
+		plies: number of moves replayed.
+		error: None, or a description of the first move that could not be played, such as "12... Nf3: no legal move".
+		fen: FEN record of the position after the last move replayed.
+		ending: 'checkmate' or 'stalemate' if the final position has no legal move, otherwise None.
+		"""
+		self.number = number
+		self.tags = tags
+		self.result = result
+		self.plies = plies
+		self.error = error
+		self.fen = fen
+		self.ending = ending
+
+
+def tokenize(lines):
+	"""
+	Yield the tokens of PGN text one at a time, reading it line by line.
+
+	Comments, numeric annotations, move numbers and escape lines are left out.
+
+	Args:
+		lines: iterable of lines of PGN text, such as an open file.
+
+	Yields:
+		(kind, value) tuples: ('tag', (name, value)), ('move', SAN), ('result', result), or ('(', None) and (')', None)
+		around variations.
+	"""
+	comment = False
+	for line in lines:
+		if comment:
+			end = line.find('}')
+			if end == -1:
+				continue
+			line = line[end + 1:]
+			comment = False
+		if line.startswith('%'):
+			continue
+		position = 0
+		while position < len(line):
+			match = TOKEN.match(line, position)
+			if match is None:
+				# a stray character, such as a lone period
+				position = line.find(' ', position + 1)
+				if position == -1:
+					break
+				continue
+			position = match.end()
+			name, value, symbol, result, move = match.groups()
+			if name is not None:
+				yield 'tag', (name, value.replace('\\"', '"').replace('\\\\', '\\'))
+			elif symbol == '{':
+				end = line.find('}', position)
+				if end == -1:
+					comment = True
+					break
+				position = end + 1
+			elif symbol == ';':
+				break
+			elif symbol is not None:
+				yield symbol, None
+			elif result is not None:
+				yield 'result', result
+			elif move is not None:
+				yield 'move', move
+
+
+def read_games(source):
+	"""
+	Yield the games of a PGN file one at a time, reading the file as they are used, so only one game is held at once.
+
+	Moves in variations are left out.
+
+	Args:
+		source: path of the file, or an open text file or other iterable of lines.
+
+	Yields:
+		Game objects, in the order of the file.
+	"""
+	if type(source) == str:
+		with open(source, encoding='utf-8', errors='replace') as file:
+			yield from read_games(file)
+		return
+	number = 1
+	tags = {}
+	moves = []
+	depth = 0
+	for kind, value in tokenize(source):
+		if kind == 'tag':
+			if moves:
+				# a game missing its result
+				yield Game(number, tags, moves, tags.get('Result', '*'))
+				number, tags, moves, depth = number + 1, {}, [], 0
+			tags[value[0]] = value[1]
+		elif kind == '(':
+			depth += 1
+		elif kind == ')':
+			depth = max(depth - 1, 0)
+		elif depth:
+			continue
+		elif kind == 'move':
+			moves.append(value)
+		elif kind == 'result':
+			yield Game(number, tags, moves, value)
+			number, tags, moves, depth = number + 1, {}, [], 0
+	if tags or moves:
+		yield Game(number, tags, moves, tags.get('Result', '*'))
+
+
+def resolve_san(board, player, san):
+	"""
+	Return the legal move written in SAN.
+
+	Args:
+		board: chessboard.
+		player: 'white' or 'black', the player to move.
+		san: move in standard algebraic notation, such as 'e4', 'Nbd7', 'exd6', 'e8=Q+' or 'O-O'.
+
+	Returns:
+		A (start, end, promotion) tuple, where promotion is None or the piece a pawn promotes to, such as 'Queen'.
+
+	Raises:
+		ValueError: if san is not written correctly, or does not name exactly one legal move. Captures must be written
+			with x and other moves without it, pawn captures must give the file they are made from, and castling must be
+			written O-O or O-O-O.
+	"""
+	text = san.rstrip('+#!?')
+	if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+		start = NAMES[board.kings[player]]
+		end = ('c' if len(text) == 5 else 'g') + start[1]
+		if (start, end) not in generate_legal_moves(board, player) or start[0] != 'e':
+			raise ValueError(san + ': no legal move')
+		return start, end, None
+
+	match = SAN.match(text)
+	if match is None:
+		raise ValueError(san + ': not a move')
+	letter, file, rank, capture, end, promotion = match.groups()
+	kind = SAN_PIECES[letter] if letter else Pawn
+	if kind == Pawn and capture is not None and file is None:
+		raise ValueError(san + ': pawn capture without the file it is made from')
+	starts = [start for start, target in generate_legal_moves(board, player) if target == end and type(board[start]) == kind and (file is None or start[0] == file) and (rank is None or start[1] == rank)]
+	if kind == Pawn:
+		# a pawn advances along its file, and captures diagonally
+		starts = [start for start in starts if (start[0] == end[0]) == (capture is None)]
+	if not starts:
+		raise ValueError(san + ': no legal move')
+	if len(starts) > 1:
+		raise ValueError(san + ': ambiguous, could be played from ' + ' or '.join(starts))
+	start = starts[0]
+	if kind == King and abs(ord(start[0]) - ord(end[0])) == 2:
+		raise ValueError(san + ': castling is written O-O or O-O-O')
+	takes = board[end] != 'empty' or (kind == Pawn and start[0] != end[0])
+	if takes != (capture is not None):
+		raise ValueError(san + (': capture written without x' if takes else ': x with nothing to capture'))
+	if (kind == Pawn and end[1] in '18') != (promotion is not None):
+		raise ValueError(san + (': missing the piece to promote to' if promotion is None else ': not a promotion'))
+	return start, end, SAN_PROMOTIONS.get(promotion)
+
+
+def replay_game(game):
+	"""
+	Play through the moves of a game, stopping at the first one that is not legal.
+
+	The game starts from the position of its FEN tag if it has one, otherwise from the starting position.
+
+	Args:
+		game: a Game.
+
+	Returns:
+		A Replay.
+	"""
+	try:
+		if 'FEN' in game.tags:
+			board, player = from_fen(game.tags['FEN'])
+		else:
+			board, player = starting_board(), 'white'
+	except ValueError as error:
+		return Replay(game.number, game.tags, game.result, 0, 'FEN tag: ' + str(error), None, None)
+
+	plies = 0
+	error = None
+	for san in game.moves:
+		try:
+			start, end, promotion = resolve_san(board, player, san)
+		except ValueError as exception:
+			error = str(board.state.fullmove) + ('. ' if player == 'white' else '... ') + str(exception)
+			break
+		make_move(board, start, end)
+		if promotion is not None:
+			promote(board, promotion, player, end)
+		player = opponent(player)
+		plies += 1
+
+	ending = None
+	if not has_legal_move(board, player):
+		ending = 'checkmate' if is_square_attacked(board, board.kings[player], opponent(player)) else 'stalemate'
+	return Replay(game.number, game.tags, game.result, plies, error, to_fen(board), ending)
+
+
+def _limit(games, slots, stop):
+	"""Yield games, waiting for a free slot before each one, until stop is set."""
+	for game in games:
+		while not slots.acquire(timeout=0.1):
+			if stop.is_set():
+				return
+		yield game
+
+
+def replay(source, workers=1, chunksize=32):
+	"""
+	Replay every game of a PGN file, optionally across a pool of processes.
+
+	Games are read as they are sent to the workers, in chunks of chunksize, and at most two chunks per worker are
+	waiting to be replayed or collected at once, so memory use does not grow with the size of the file.
+
+	Args:
+		source: path of the PGN file, or an open text file or other iterable of lines.
+		workers: number of processes to replay games with.
+		chunksize: number of games sent to a worker at a time.
+
+	Yields:
+		A Replay for each game, in the order they finish, which with several workers may differ from the file's.
+	"""
+	games = read_games(source)
+	if workers <= 1:
+		for game in games:
+			yield replay_game(game)
+		return
+
+	from multiprocessing import Pool
+	slots = threading.Semaphore(2 * workers * chunksize)
+	stop = threading.Event()
+	with Pool(workers) as pool:
+		try:
+			for result in pool.imap_unordered(replay_game, _limit(games, slots, stop), chunksize):
+				slots.release()
+				yield result
+		finally:
+			# let the pool's task thread finish, so that the pool can be shut down if the caller stops early
+			stop.set()
+
+
+def main():
+	"""Replay the games of a PGN file from the command line, and report the games with illegal moves and the games per second."""
+	parser = argparse.ArgumentParser(description='Check the moves of the games of a PGN file and replay them.')
+	parser.add_argument('file', help='PGN file')
+	parser.add_argument('-w', '--workers', type=int, default=1, help='number of processes to replay games with (default: 1)')
+	parser.add_argument('-c', '--chunksize', type=int, default=32, help='number of games sent to a process at a time (default: 32)')
+	parser.add_argument('-v', '--verbose', action='store_true', help='print the result and final position of every game')
+	args = parser.parse_args()
+
+	games = 0
+	errors = 0
+	begin = time.perf_counter()
+	for result in replay(args.file, args.workers, args.chunksize):
+		games += 1
+		name = 'game ' + str(result.number) + ' (' + result.tags.get('White', '?') + ' - ' + result.tags.get('Black', '?') + ')'
+		if result.error is not None:
+			errors += 1
+			print(name + '  error at ' + result.error)
+		elif args.verbose:
+			print(name + '  ' + result.result + ('  ' + result.ending if result.ending else '') + '  ' + result.fen)
+	elapsed = time.perf_counter() - begin
+	print('games ' + str(games) + '  errors ' + str(errors) + '  time ' + format(elapsed, '.3f') + 's  games/s ' + str(int(games / elapsed) if elapsed else 0))
+	return 1 if errors else 0
+
+
+if __name__ == '__main__':
+	raise SystemExit(main())
@@ -1,4 +1,146 @@
-from copy import deepcopy
+from board import *
+
+
+class Undo:
+	"""Record of a move made in place by make_move, holding what unmake_move needs to restore the board."""
+
+	__slots__ = ('piece', 'start', 'end', 'captured', 'captured_location', 'flag', 'rook', 'key', 'state')
+
+	def __init__(self, piece, start, end, captured):
+		"""
+		piece: the piece that moved.
+		start: location the piece moved from.
+		end: location the piece moved to.
+		captured: the piece captured by the move, or 'empty'.
+		"""
+		self.piece = piece
+		self.start = start
+		self.end = end
+		self.captured = captured
+		self.captured_location = end
+		self.flag = None
+		self.rook = None
+		self.key = piece.board.key
+		self.state = piece.board.state
+
+
+def make_move(board, start, end):
+	"""
+	(Mutating) Move the piece at start to end in place, without checking if the move is legal.
+
+	Args:
+		board: chessboard.
+		start: location of the piece to move.
+		end: location to move the piece to.
+
+	Returns:
+		An Undo record that unmake_move uses to restore the board.
+	"""
+	return board[start]._make(end)
+
+
+def unmake_move(board, undo):
+	"""
+	(Mutating) Take back a move made by make_move.
+
+	Args:
+		board: chessboard.
+		undo: the Undo record returned by make_move. Moves must be taken back in the reverse order they were made.
+	"""
+	piece = undo.piece
+	board[undo.end] = 'empty'
+	if undo.captured != 'empty':
+		board[undo.captured_location] = undo.captured
+	board[undo.start] = piece
+	piece.location = undo.start
+	if undo.rook is not None:
+		rook, rook_start, rook_end, moved = undo.rook
+		board[rook_end] = 'empty'
+		board[rook_start] = rook
+		rook.location = rook_start
+		rook.moved = moved
+	if undo.flag is not None:
+		if type(piece) == Pawn:
+			piece.promoted = undo.flag
+		else:
+			piece.moved = undo.flag
+	board.key = undo.key
+	board.state = undo.state
+
+
+# (castling right, king location, rook location, color)
+CASTLING_SQUARES = (
+	(WHITE_KINGSIDE, 'e1', 'h1', 'white'),
+	(WHITE_QUEENSIDE, 'e1', 'a1', 'white'),
+	(BLACK_KINGSIDE, 'e8', 'h8', 'black'),
+	(BLACK_QUEENSIDE, 'e8', 'a8', 'black'),
+)
+# castling moves of each color: (castling right, king location, king destination, locations that must be empty,
+# locations the king passes that must not be attacked)
+CASTLES = {
+	'white': (
+		(WHITE_QUEENSIDE, 'e1', 'c1', ('b1', 'c1', 'd1'), ('c1', 'd1')),
+		(WHITE_KINGSIDE, 'e1', 'g1', ('f1', 'g1'), ('f1', 'g1')),
+	),
+	'black': (
+		(BLACK_QUEENSIDE, 'e8', 'c8', ('b8', 'c8', 'd8'), ('c8', 'd8')),
+		(BLACK_KINGSIDE, 'e8', 'g8', ('f8', 'g8'), ('f8', 'g8')),
+	),
+}
+
+
+def castling_rights(board):
+	"""Return the castling rights of board, a combination of the castling rights bits, from the King and Rook moved flags."""
+	rights = 0
+	for right, king, rook, color in CASTLING_SQUARES:
+		if type(board[king]) == King and board[king].color == color and not board[king].moved:
+			if type(board[rook]) == Rook and board[rook].color == color and not board[rook].moved:
+				rights |= right
+	return rights
+
+
+def en_passant_square(board, location, player):
+	"""
+	Return the square number player may capture en passant on after an opponent's pawn advanced two squares to location.
+
+	Returns:
+		The square the pawn passed over, or -1 if no pawn of player stands next to location to capture it.
+	"""
+	index = SQUARES[location]
+	pawn = PAWN | COLORS[player]
+	for neighbour in (index - 1, index + 1):
+		if neighbour // 8 == index // 8 and board.squares[neighbour] == pawn:
+			return index - 8 if player == 'black' else index + 8
+	return -1
+
+
+def zobrist_key(board, player):
+	"""
+	Return the Zobrist key of a position, computed from scratch.
+
+	Args:
+		board: chessboard.
+		player: 'white' or 'black', the player to move.
+
+	Returns:
+		A 64-bit integer, equal to board.key when it has been kept up to date by make_move.
+	"""
+	key = 0
+	for index, code in enumerate(board.squares):
+		key ^= ZOBRIST_PIECES[code][index]
+	key ^= ZOBRIST_CASTLING[board.state.castling]
+	if board.state.en_passant != -1:
+		key ^= ZOBRIST_EN_PASSANT[board.state.en_passant % 8]
+	if player == 'black':
+		key ^= ZOBRIST_SIDE
+	return key
+
+
+def rehash(board, player):
+	"""(Mutating) Set board's player to move, castling rights from the King and Rook moved flags, and key from scratch, after setting up a position."""
+	board.state.side = player
+	board.state.castling = castling_rights(board)
+	board.key = zobrist_key(board, player)
 
 
 class Piece:
@@ -14,6 +156,12 @@ class Piece:
 		self.location = location
 		self.board = board
 
+	def _sync_castling(self):
+		"""(Mutating) Update the castling rights of the piece's board after its moved flag changed, if it stands on the board."""
+		index = SQUARES[self.location]
+		if self.board.pieces[index] is self:
+			self.board.sync_castling(index)
+
 	def get_column(self):
 		"""Return the column the piece is located in."""
 		return self.location[0]
@@ -22,174 +170,196 @@ class Piece:
 		"""Return the row the piece is located in."""
 		return self.location[1]
 
-	def _left_moves(self):
-		"""Return possible moves to the left (decreasing column values) of the piece's location."""
-		column = chr(ord(self.get_column()) - 1)
-		row = self.get_row()
-		move = column + row
+	def _slide_moves(self, rays):
+		"""Return possible moves along each of rays, sequences of squares leading away from the piece's location."""
+		squares = self.board.squares
+		color = COLORS[self.color]
 		moves = []
-		while move in self.board and self.board[move] == 'empty':
-			moves.append(move)
-			column = chr(ord(column) - 1)
-			move = column + row
-		if move in self.board and self.board[move].color != self.color:
-			moves.append(move)
+		for ray in rays:
+			for target in ray:
+				if squares[target] == EMPTY:
+					moves.append(NAMES[target])
+				else:
+					if squares[target] & BLACK != color:
+						moves.append(NAMES[target])
+					break
 		return moves
 
+	def _step_moves(self, targets):
+		"""Return possible single step moves from the piece's location to each of targets."""
+		squares = self.board.squares
+		color = COLORS[self.color]
+		return [NAMES[target] for target in targets if squares[target] == EMPTY or squares[target] & BLACK != color]
+
+	def _iter_slide_moves(self, rays):
+		"""Yield possible moves along each of rays one at a time, like _slide_moves."""
+		squares = self.board.squares
+		color = COLORS[self.color]
+		for ray in rays:
+			for target in ray:
+				if squares[target] == EMPTY:
+					yield NAMES[target]
+				else:
+					if squares[target] & BLACK != color:
+						yield NAMES[target]
+					break
+
+	def _iter_step_moves(self, targets):
+		"""Yield possible single step moves one at a time, like _step_moves."""
+		squares = self.board.squares
+		color = COLORS[self.color]
+		for target in targets:
+			if squares[target] == EMPTY or squares[target] & BLACK != color:
+				yield NAMES[target]
+
+	def iter_moves(self):
+		"""Yield the possible moves the piece may make one at a time, so that callers can stop at the first they need."""
+		return iter(self.get_moves())
+
+	def _left_moves(self):
+		"""Return possible moves to the left (decreasing column values) of the piece's location."""
+		return self._slide_moves((RAYS[LEFT][SQUARES[self.location]],))
+
 	def _right_moves(self):
 		"""Return possible moves to the right (increasing column values) of the piece's location."""
-		column = chr(ord(self.get_column()) + 1)
-		row = self.get_row()
-		move = column + row
-		moves = []
-		while move in self.board and self.board[move] == 'empty':
-			moves.append(move)
-			column = chr(ord(column) + 1)
-			move = column + row
-		if move in self.board and self.board[move].color != self.color:
-			moves.append(move)
-		return moves
+		return self._slide_moves((RAYS[RIGHT][SQUARES[self.location]],))
 
 	def _up_moves(self):
 		"""Return possible moves up (increasing row values) from the piece's location."""
-		column = self.get_column()
-		row = str(int(self.get_row()) + 1)
-		move = column + row
-		moves = []
-		while move in self.board and self.board[move] == 'empty':
-			moves.append(move)
-			row = str(int(row) + 1)
-			move = column + row
-		if move in self.board and self.board[move].color != self.color:
-			moves.append(move)
-		return moves
+		return self._slide_moves((RAYS[UP][SQUARES[self.location]],))
 
 	def _down_moves(self):
 		"""Return possible moves down (decreasing row values) from the piece's location."""
-		column = self.get_column()
-		row = str(int(self.get_row()) - 1)
-		move = column + row
-		moves = []
-		while move in self.board and self.board[move] == 'empty':
-			moves.append(move)
-			row = str(int(row) - 1)
-			move = column + row
-		if move in self.board and self.board[move].color != self.color:
-			moves.append(move)
-		return moves
+		return self._slide_moves((RAYS[DOWN][SQUARES[self.location]],))
 
 	def _left_up_moves(self):
 		"""Return possible moves diagonal (decreasing column, increasing row) from the piece's location."""
-		column = chr(ord(self.get_column()) - 1)
-		row = str(int(self.get_row()) + 1)
-		move = column + row
-		moves = []
-		while move in self.board and self.board[move] == 'empty':
-			moves.append(move)
-			column = chr(ord(column) - 1)
-			row = str(int(row) + 1)
-			move = column + row
-		if move in self.board and self.board[move].color != self.color:
-			moves.append(move)
-		return moves
+		return self._slide_moves((RAYS[LEFT_UP][SQUARES[self.location]],))
 
 	def _right_up_moves(self):
 		"""Return possible moves diagonal (increasing column, increasing row) from the piece's location."""
-		column = chr(ord(self.get_column()) + 1)
-		row = str(int(self.get_row()) + 1)
-		move = column + row
-		moves = []
-		while move in self.board and self.board[move] == 'empty':
-			moves.append(move)
-			column = chr(ord(column) + 1)
-			row = str(int(row) + 1)
-			move = column + row
-		if move in self.board and self.board[move].color != self.color:
-			moves.append(move)
-		return moves
+		return self._slide_moves((RAYS[RIGHT_UP][SQUARES[self.location]],))
 
 	def _left_down_moves(self):
 		"""Return possible moves diagonal (decreasing column, decreasing row) from the piece's location."""
-		column = chr(ord(self.get_column()) - 1)
-		row = str(int(self.get_row()) - 1)
-		move = column + row
-		moves = []
-		while move in self.board and self.board[move] == 'empty':
-			moves.append(move)
-			column = chr(ord(column) - 1)
-			row = str(int(row) - 1)
-			move = column + row
-		if move in self.board and self.board[move].color != self.color:
-			moves.append(move)
-		return moves
+		return self._slide_moves((RAYS[LEFT_DOWN][SQUARES[self.location]],))
 
 	def _right_down_moves(self):
 		"""Return possible moves diagonal (increasing column, decreasing row) from the piece's location."""
-		column = chr(ord(self.get_column()) + 1)
-		row = str(int(self.get_row()) - 1)
-		move = column + row
-		moves = []
-		while move in self.board and self.board[move] == 'empty':
-			moves.append(move)
-			column = chr(ord(column) + 1)
-			row = str(int(row) - 1)
-			move = column + row
-		if move in self.board and self.board[move].color != self.color:
-			moves.append(move)
-		return moves
+		return self._slide_moves((RAYS[RIGHT_DOWN][SQUARES[self.location]],))
 
 	def king_position(self):
-		"""Return the location of the king in the piece's board with the piece's color."""
-		for position in self.board.keys():
-			if type(self.board[position]) == King and self.board[position].color == self.color:
-				return position
+		"""Return the location of the king in the piece's board with the piece's color, or None if there is none."""
+		king = self.board.kings[self.color]
+		return NAMES[king] if king != -1 else None
 
 	def valid_move(self, end):
 		"""Return if it is legal to move the piece to end."""
-		if end not in self.get_moves():
-			return False
-		copy = deepcopy(self.board)
-		piece = copy[self.location]
-		copy[self.location] = 'empty'
-		copy[end] = piece
-		piece.location = end
-		king_position = piece.king_position()
-		if copy[king_position].check(king_position):
+		if end not in self.iter_moves():
 			return False
-		return True
+		undo = self._make(end)
+		check = is_square_attacked(self.board, self.board.kings[self.color], 'black' if self.color == 'white' else 'white')
+		unmake_move(self.board, undo)
+		return not check
+
+	def _make(self, end):
+		"""(Mutating) Move the piece to end without checking if the move is legal, and return its Undo record."""
+		board = self.board
+		undo = Undo(self, self.location, end, board[end])
+		state = board.state = board.state.copy()
+		castling = state.castling & CASTLING_MASKS[SQUARES[self.location]] & CASTLING_MASKS[SQUARES[end]]
+		board[self.location] = 'empty'
+		board[end] = self
+		self.location = end
+
+		board.key ^= ZOBRIST_SIDE ^ ZOBRIST_CASTLING[state.castling] ^ ZOBRIST_CASTLING[castling]
+		if state.en_passant != -1:
+			board.key ^= ZOBRIST_EN_PASSANT[state.en_passant % 8]
+			state.en_passant = -1
+		state.castling = castling
+		state.halfmove = 0 if undo.captured != 'empty' else state.halfmove + 1
+		if self.color == 'black':
+			state.fullmove += 1
+		state.side = 'black' if self.color == 'white' else 'white'
+		return undo
 
 	def make_move(self, end):
 		"""(Mutating) Move the piece to end."""
 		assert self.valid_move(end), 'cannot make invalid move'
-
-		self.board[self.location] = 'empty'
-		self.board[end] = self
-		self.location = end
-
-		pawns = [pawn for pawn in self.board.values() if pawn != 'empty' and pawn.color == self.color and type(pawn) == Pawn]
-		for pawn in pawns:
-			pawn.en_passant_left = False
-			pawn.en_passant_right = False
+		return self._make(end)
 
 
 class Pawn(Piece):
 
+	kind = PAWN
+
 	def __init__(self, color, location, board, en_passant_left=False, en_passant_right=False, promoted=False):
 		"""
 		color: 'white' or 'black'.
 		location: location of piece in the board.
 		board: the chessboard that contains the piece.
-		en_passant_left: boolean representing if the pawn may capture en passant to the left.
-		en_passant_left: boolean representing if the pawn may capture en passant to the right.
+		en_passant_left: boolean representing if the pawn may capture en passant to the left. Setting it also makes
+			color the player to move.
+		en_passant_right: boolean representing if the pawn may capture en passant to the right, likewise.
 		promoted: boolean representing if the pawn has reached the end of the board.
 		"""
 		self.color = color
 		self.location = location
 		self.board = board
-		self.en_passant_left = en_passant_left
-		self.en_passant_right = en_passant_right
+		if en_passant_left:
+			self.en_passant_left = True
+		if en_passant_right:
+			self.en_passant_right = True
 		self.promoted = promoted
 
+	def _en_passant(self, side):
+		"""Return if the pawn may capture en passant to side, 0 for left or 1 for right, according to its board's state."""
+		state = self.board.state
+		return state.en_passant != -1 and state.side == self.color and PAWN_CAPTURES[self.color][SQUARES[self.location]][side] == state.en_passant
+
+	def _set_en_passant(self, side, value):
+		"""
+		(Mutating) Set or clear the en passant square of the pawn's board to the pawn's diagonal on side, 0 for left or 1
+		for right, keeping the board's key up to date.
+
+		Only the player to move may capture en passant, so setting it also makes the pawn's color the player to move.
+		"""
+		board = self.board
+		state = board.state
+		target = PAWN_CAPTURES[self.color][SQUARES[self.location]][side]
+		en_passant = state.en_passant
+		if value and target != -1:
+			en_passant = target
+			if state.side != self.color:
+				state.side = self.color
+				board.key ^= ZOBRIST_SIDE
+		elif en_passant == target:
+			en_passant = -1
+		if en_passant != state.en_passant:
+			if state.en_passant != -1:
+				board.key ^= ZOBRIST_EN_PASSANT[state.en_passant % 8]
+			if en_passant != -1:
+				board.key ^= ZOBRIST_EN_PASSANT[en_passant % 8]
+			state.en_passant = en_passant
+
+	@property
+	def en_passant_left(self):
+		"""Boolean representing if the pawn may capture en passant to the left."""
+		return self._en_passant(0)
+
+	@en_passant_left.setter
+	def en_passant_left(self, value):
+		self._set_en_passant(0, value)
+
+	@property
+	def en_passant_right(self):
+		"""Boolean representing if the pawn may capture en passant to the right."""
+		return self._en_passant(1)
+
+	@en_passant_right.setter
+	def en_passant_right(self, value):
+		self._set_en_passant(1, value)
+
 	def has_moved(self):
 		"""Return if the pawn has made any moves."""
 		if self.color == 'white':
@@ -199,52 +369,65 @@ class Pawn(Piece):
 
 	def get_moves(self):
 		"""Return possible moves the pawn may make."""
-		if self.color == 'white':
-			forward = self.get_column() + str(int(self.get_row()) + 1)
-			forward2 = self.get_column() + '4'
-			left_diagonal = chr(ord(self.get_column()) - 1) + str(int(self.get_row()) + 1)
-			right_diagonal = chr(ord(self.get_column()) + 1) + str(int(self.get_row()) + 1)
-		else:
-			forward = self.get_column() + str(int(self.get_row()) - 1)
-			forward2 = self.get_column() + '5'
-			left_diagonal = chr(ord(self.get_column()) - 1) + str(int(self.get_row()) - 1)
-			right_diagonal = chr(ord(self.get_column()) + 1) + str(int(self.get_row()) - 1)
+		squares = self.board.squares
+		index = SQUARES[self.location]
+		forward, forward2 = PAWN_ADVANCES[self.color][index]
+		left_diagonal, right_diagonal = PAWN_CAPTURES[self.color][index]
+		opponent = BLACK if self.color == 'white' else WHITE
+		state = self.board.state
+		en_passant = state.en_passant if state.side == self.color else -1
 
 		moves = []
-		if forward in self.board and self.board[forward] == 'empty':
-			moves.append(forward)
-		if forward2 in self.board and self.board[forward2] == 'empty' and not self.has_moved():
-			moves.append(forward2)
-		if left_diagonal in self.board and self.board[left_diagonal] != 'empty' and self.board[left_diagonal].color != self.color:
-			moves.append(left_diagonal)
-		if right_diagonal in self.board and self.board[right_diagonal] != 'empty' and self.board[right_diagonal].color != self.color:
-			moves.append(right_diagonal)
-		if self.en_passant_left:
-			moves.append(left_diagonal)
-		if self.en_passant_right:
-			moves.append(right_diagonal)
+		if forward != -1 and squares[forward] == EMPTY:
+			moves.append(NAMES[forward])
+			if forward2 != -1 and squares[forward2] == EMPTY:
+				moves.append(NAMES[forward2])
+		if left_diagonal != -1 and ((squares[left_diagonal] != EMPTY and squares[left_diagonal] & BLACK == opponent) or left_diagonal == en_passant):
+			moves.append(NAMES[left_diagonal])
+		if right_diagonal != -1 and ((squares[right_diagonal] != EMPTY and squares[right_diagonal] & BLACK == opponent) or right_diagonal == en_passant):
+			moves.append(NAMES[right_diagonal])
 		return moves
 
-	def make_move(self, end):
-		"""(Mutating) Move the pawn to end."""
+	def iter_moves(self):
+		"""Yield possible moves the pawn may make one at a time, captures first."""
+		squares = self.board.squares
+		index = SQUARES[self.location]
+		opponent = BLACK if self.color == 'white' else WHITE
+		state = self.board.state
+		en_passant = state.en_passant if state.side == self.color else -1
+		for diagonal in PAWN_CAPTURES[self.color][index]:
+			if diagonal != -1 and ((squares[diagonal] != EMPTY and squares[diagonal] & BLACK == opponent) or diagonal == en_passant):
+				yield NAMES[diagonal]
+		forward, forward2 = PAWN_ADVANCES[self.color][index]
+		if forward != -1 and squares[forward] == EMPTY:
+			yield NAMES[forward]
+			if forward2 != -1 and squares[forward2] == EMPTY:
+				yield NAMES[forward2]
+
+	def _make(self, end):
+		"""(Mutating) Move the pawn to end without checking if the move is legal, and return its Undo record."""
 		start = self.location
-		old_end = self.board[end]
-		Piece.make_move(self, end)
+		undo = Piece._make(self, end)
+		undo.flag = self.promoted
+		state = self.board.state
+		state.halfmove = 0
 		if (self.color == 'white' and self.get_row() == '8') or (self.color == 'black' and self.get_row() == '1'):
 			self.promoted = True
 		if (self.color == 'white' and start[1] == '2' and end[1] == '4') or (self.color == 'black' and start[1] == '7' and end[1] == '5'):
-			left = chr(ord(end[0]) - 1) + end[1]
-			right = chr(ord(end[0]) + 1) + end[1]
-			if left in self.board and type(self.board[left]) == Pawn and self.board[left].color != self.color:
-				self.board[left].en_passant_right = True
-			if right in self.board and type(self.board[right]) == Pawn and self.board[right].color != self.color:
-				self.board[right].en_passant_left = True
-		if start[0] != end[0] and old_end == 'empty':
-			self.board[end[0] + start[1]] = 'empty'
+			state.en_passant = en_passant_square(self.board, end, state.side)
+			if state.en_passant != -1:
+				self.board.key ^= ZOBRIST_EN_PASSANT[state.en_passant % 8]
+		if start[0] != end[0] and undo.captured == 'empty':
+			undo.captured_location = end[0] + start[1]
+			undo.captured = self.board[undo.captured_location]
+			self.board[undo.captured_location] = 'empty'
+		return undo
 
 
 class Rook(Piece):
 
+	kind = ROOK
+
 	def __init__(self, color, location, board, moved=False):
 		"""
 		color: 'white' or 'black'.
@@ -257,137 +440,159 @@ class Rook(Piece):
 		self.board = board
 		self.moved = moved
 
+	@property
+	def moved(self):
+		"""Boolean, representing if the rook has made any moves. Setting it updates the castling rights of the board."""
+		return self._moved
+
+	@moved.setter
+	def moved(self, value):
+		self._moved = value
+		self._sync_castling()
+
 	def has_moved(self):
 		"""Return if the rook has made any moves."""
-		return self.moved
+		return self._moved
 
 	def get_moves(self):
 		"""Return possible moves the rook may make."""
-		return self._left_moves() + self._right_moves() + self._up_moves() + self._down_moves()
+		return self._slide_moves(ROOK_RAYS[SQUARES[self.location]])
 
-	def make_move(self, end):
-		"""(Mutating) Move the rook to end."""
-		Piece.make_move(self, end)
+	def iter_moves(self):
+		"""Yield possible moves the rook may make one at a time."""
+		return self._iter_slide_moves(ROOK_RAYS[SQUARES[self.location]])
+
+	def _make(self, end):
+		"""(Mutating) Move the rook to end without checking if the move is legal, and return its Undo record."""
+		undo = Piece._make(self, end)
+		undo.flag = self.moved
 		self.moved = True
+		return undo
 
 
 class Knight(Piece):
 
+	kind = KNIGHT
+
 	def get_moves(self):
 		"""Return possible moves the knight may make."""
-		moves = [
-		chr(ord(self.get_column()) + 2) + str(int(self.get_row()) - 1),
-		chr(ord(self.get_column()) + 2) + str(int(self.get_row()) + 1),
-		chr(ord(self.get_column()) - 2) + str(int(self.get_row()) + 1),
-		chr(ord(self.get_column()) - 2) + str(int(self.get_row()) - 1),
-		chr(ord(self.get_column()) + 1) + str(int(self.get_row()) - 2),
-		chr(ord(self.get_column()) + 1) + str(int(self.get_row()) + 2),
-		chr(ord(self.get_column()) - 1) + str(int(self.get_row()) - 2),
-		chr(ord(self.get_column()) - 1) + str(int(self.get_row()) + 2),
-		]
-		return [move for move in moves if (move in self.board and (self.board[move] == 'empty' or self.board[move].color != self.color))]
+		return self._step_moves(KNIGHT_TARGETS[SQUARES[self.location]])
+
+	def iter_moves(self):
+		"""Yield possible moves the knight may make one at a time."""
+		return self._iter_step_moves(KNIGHT_TARGETS[SQUARES[self.location]])
 
 
 class Bishop(Piece):
 
+	kind = BISHOP
+
 	def get_moves(self):
 		"""Return possible moves the bishop may make."""
-		return self._left_up_moves() + self._right_up_moves() + self._left_down_moves() + self._right_down_moves()
+		return self._slide_moves(BISHOP_RAYS[SQUARES[self.location]])
+
+	def iter_moves(self):
+		"""Yield possible moves the bishop may make one at a time."""
+		return self._iter_slide_moves(BISHOP_RAYS[SQUARES[self.location]])
 
 
 class Queen(Piece):
 
+	kind = QUEEN
+
 	def get_moves(self):
 		"""Return possible moves the queen may make."""
-		return self._left_moves() + self._right_moves() + self._up_moves() + self._down_moves() + self._left_up_moves() + self._right_up_moves() + self._left_down_moves() + self._right_down_moves()
+		return self._slide_moves(QUEEN_RAYS[SQUARES[self.location]])
+
+	def iter_moves(self):
+		"""Yield possible moves the queen may make one at a time."""
+		return self._iter_slide_moves(QUEEN_RAYS[SQUARES[self.location]])
 
 
 class King(Piece):
 
+	kind = KING
+
 	def __init__(self, color, location, board, moved=False):
 		"""
 		color: 'white' or 'black'.
 		location: location of piece in the board.
 		board: the chessboard that contains the piece.
-		moved: boolean, representing if the rook has made any moves.
+		moved: boolean, representing if the king has made any moves.
 		"""
 		self.color = color
 		self.location = location
 		self.board = board
 		self.moved = moved
 
+	@property
+	def moved(self):
+		"""Boolean, representing if the king has made any moves. Setting it updates the castling rights of the board."""
+		return self._moved
+
+	@moved.setter
+	def moved(self, value):
+		self._moved = value
+		self._sync_castling()
+
 	def has_moved(self):
 		"""Return if the king has made any moves."""
-		return self.moved
+		return self._moved
 
 	def check(self, location):
 		"""Return if the king would be in check at location."""
-		copy = deepcopy(self.board)
-		copy[location] = King(self.color, location, copy)
-		opponent_pieces = [opponent for opponent in copy.values() if opponent != 'empty' and opponent.color != self.color]
-		for opponent in opponent_pieces:
-			if type(opponent) == King:
-				if location in opponent.standard_moves():
-					return True
-			elif location in opponent.get_moves():
-				return True
-		return False
+		squares = self.board.squares
+		start = SQUARES[self.location]
+		code = squares[start]
+		squares[start] = EMPTY
+		check = is_square_attacked(self.board, SQUARES[location], 'black' if self.color == 'white' else 'white')
+		squares[start] = code
+		return check
 
 	def _castle(self):
-		"""Return the legal castling moves the king may make."""
+		"""Return the legal castling moves the king may make, using the castling rights of its board's state."""
 		moves = []
-		if self.color == 'white':
-			if not self.has_moved() and type(self.board['a1']) == Rook and not self.board['a1'].has_moved():
-				if self.board['b1'] == 'empty' and self.board['c1'] == 'empty' and self.board['d1'] == 'empty':
-					if not self.check(self.location) and not self.check('c1') and not self.check('d1'):
-						moves.append('c1')
-			if not self.has_moved() and type(self.board['h1']) == Rook and not self.board['h1'].has_moved():
-				if self.board['f1'] == 'empty' and self.board['g1'] == 'empty':
-					if not self.check(self.location) and not self.check('f1') and not self.check('g1'):
-						moves.append('g1')
-		else:
-			if not self.has_moved() and type(self.board['a8']) == Rook and not self.board['a8'].has_moved():
-				if self.board['b8'] == 'empty' and self.board['c8'] == 'empty' and self.board['d8'] == 'empty':
-					if not self.check(self.location) and not self.check('c8') and not self.check('d8'):
-						moves.append('c8')
-			if not self.has_moved() and type(self.board['h8']) == Rook and not self.board['h8'].has_moved():
-				if self.board['f8'] == 'empty' and self.board['g8'] == 'empty':
-					if not self.check(self.location) and not self.check('f8') and not self.check('g8'):
-						moves.append('g8')
+		castling = self.board.state.castling
+		for right, start, end, between, passed in CASTLES[self.color]:
+			if castling & right and self.location == start and all(self.board[location] == 'empty' for location in between):
+				if not self.check(self.location) and not any(self.check(location) for location in passed):
+					moves.append(end)
 		return moves
 
 	def standard_moves(self):
 		"""Return possible moves the king may make, excluding castling moves."""
-		moves = [
-		chr(ord(self.get_column()) - 1) + str(int(self.get_row()) - 1),
-		chr(ord(self.get_column()) - 1) + self.get_row(),
-		chr(ord(self.get_column()) - 1) + str(int(self.get_row()) + 1),
-		self.get_column() + str(int(self.get_row()) - 1),
-		self.get_column() + str(int(self.get_row()) + 1),
-		chr(ord(self.get_column()) + 1) + str(int(self.get_row()) -1),
-		chr(ord(self.get_column()) + 1) + self.get_row(),
-		chr(ord(self.get_column()) + 1) + str(int(self.get_row()) + 1),
-		]
-		return [move for move in moves if (move in self.board and (self.board[move] == 'empty' or self.board[move].color != self.color))]
+		return self._step_moves(KING_TARGETS[SQUARES[self.location]])
 
 	def get_moves(self):
 		"""Return possible moves the king may make."""
 		return self.standard_moves() + self._castle()
 
-	def make_move(self, end):
-		"""(Mutating) Move the king to end."""
-		Piece.make_move(self, end)
-
-		if not self.moved and end == 'c1':
-			self.board['a1'] = 'empty'
-			self.board['d1'] = Rook('white', 'd1', self.board, True)
-		if not self.moved and end == 'g1':
-			self.board['h1'] = 'empty'
-			self.board['f1'] = Rook('white', 'f1', self.board, True)
-		if not self.moved and end == 'c8':
-			self.board['a8'] = 'empty'
-			self.board['d8'] = Rook('black', 'd8', self.board, True)
-		if not self.moved and end == 'g8':
-			self.board['h8'] = 'empty'
-			self.board['f8'] = Rook('black', 'f8', self.board, True)
+	def iter_standard_moves(self):
+		"""Yield possible moves the king may make one at a time, excluding castling moves."""
+		return self._iter_step_moves(KING_TARGETS[SQUARES[self.location]])
+
+	def iter_moves(self):
+		"""Yield possible moves the king may make one at a time, castling moves last."""
+		yield from self.iter_standard_moves()
+		yield from self._castle()
+
+	def _make(self, end):
+		"""(Mutating) Move the king to end without checking if the move is legal, and return its Undo record."""
+		start = self.location
+		undo = Piece._make(self, end)
+		undo.flag = self.moved
+
+		if not self.moved and start[0] == 'e' and end[0] in 'cg':
+			rook_start = ('a' if end[0] == 'c' else 'h') + end[1]
+			rook_end = ('d' if end[0] == 'c' else 'f') + end[1]
+			rook = self.board[rook_start]
+			undo.rook = (rook, rook_start, rook_end, rook.moved)
+			self.board[rook_start] = 'empty'
+			self.board[rook_end] = rook
+			rook.location = rook_end
+			rook.moved = True
 		self.moved = True
+		return undo
+
+
+PIECE_CLASSES = {PAWN: Pawn, KNIGHT: Knight, BISHOP: Bishop, ROOK: Rook, QUEEN: Queen, KING: King}
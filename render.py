@@ -0,0 +1,278 @@
+from utils import *
+import importlib.util
+import packed
+import io
+import os
+import sys
+
+
+def lazy_import(name):
+	"""
+	Import a module that is only loaded the first time one of its attributes is used.
+
+	Args:
+		name: name of the module, such as 'pygame'.
+
+	Returns:
+		The module, which is also entered in sys.modules, so later imports of it get the same object.
+	"""
+	if name in sys.modules:
+		return sys.modules[name]
+	spec = importlib.util.find_spec(name)
+	if spec is None:
+		raise ImportError('No module named ' + repr(name), name=name)
+	spec.loader = importlib.util.LazyLoader(spec.loader)
+	module = importlib.util.module_from_spec(spec)
+	sys.modules[name] = module
+	spec.loader.exec_module(module)
+	return module
+
+
+# loading pygame takes most of the time of importing this module, so wait until something is drawn
+pygame = lazy_import('pygame')
+
+
+SIZE = 600
+LIGHT = 210, 180, 140
+DARK = 139, 69, 19
+YELLOW = 255, 215, 0
+GREEN = 154, 205, 50
+
+# images found at:
+# https://commons.wikimedia.org/wiki/Category:PNG_chess_pieces/Standard_transparent
+IMAGE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images')
+IMAGES = {
+	(Pawn, 'white'): 'WP.png',
+	(Rook, 'white'): 'WR.png',
+	(Knight, 'white'): 'WN.png',
+	(Bishop, 'white'): 'WB.png',
+	(Queen, 'white'): 'WQ.png',
+	(King, 'white'): 'WK.png',
+	(Pawn, 'black'): 'BP.png',
+	(Rook, 'black'): 'BR.png',
+	(Knight, 'black'): 'BN.png',
+	(Bishop, 'black'): 'BB.png',
+	(Queen, 'black'): 'BQ.png',
+	(King, 'black'): 'BK.png',
+}
+# fraction of a square's width a piece covers
+PIECE_SCALE = 0.8
+
+
+def start_display():
+	"""
+	Make sure a display is open, so that surfaces can be converted to its pixel format.
+
+	If no window has been opened, the display is started with the SDL dummy video driver and a 1x1 mode, which draws
+	nothing on screen. SDL is also kept from catching SIGTERM, so that worker processes drawing off screen can still be
+	terminated.
+	"""
+	if pygame.display.get_init() and pygame.display.get_surface() is not None:
+		return
+	os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+	os.environ.setdefault('SDL_NO_SIGNAL_HANDLERS', '1')
+	pygame.display.init()
+	pygame.display.set_mode((1, 1))
+
+
+class SpriteAtlas:
+	"""The twelve piece images packed side by side into one surface, scaled once to fit the squares of a board size."""
+
+	def __init__(self, size):
+		"""
+		size: size of the board the pieces are drawn on.
+		"""
+		self.size = size
+		self.sprite_size = round(size / 8 * PIECE_SCALE)
+		self.rects = {}
+		atlas = pygame.Surface((self.sprite_size * len(IMAGES), self.sprite_size), pygame.SRCALPHA)
+		for index, (piece, filename) in enumerate(IMAGES.items()):
+			image = pygame.image.load(os.path.join(IMAGE_DIRECTORY, filename))
+			atlas.blit(pygame.transform.smoothscale(image, (self.sprite_size, self.sprite_size)), (index * self.sprite_size, 0))
+			self.rects[piece] = pygame.Rect(index * self.sprite_size, 0, self.sprite_size, self.sprite_size)
+		self.atlas = atlas.convert_alpha()
+
+	def blit(self, surface, piece, center):
+		"""Draw piece, a Piece or a (piece class, color) pair, on surface centered on the point center."""
+		key = piece if type(piece) == tuple else (type(piece), piece.color)
+		surface.blit(self.atlas, (center[0] - self.sprite_size / 2, center[1] - self.sprite_size / 2), self.rects[key])
+
+
+_atlas = None
+_background = None
+
+
+def sprites(size=SIZE):
+	"""Return the SpriteAtlas for a board size, building it again only when the size changes."""
+	global _atlas
+	if _atlas is None or _atlas.size != size:
+		start_display()
+		_atlas = SpriteAtlas(size)
+	return _atlas
+
+
+def background(size=SIZE):
+	"""Return a surface with the empty board drawn on it, drawing it again only when the size changes."""
+	global _background
+	if _background is None or _background.get_width() != size:
+		start_display()
+		_background = pygame.Surface((size, size)).convert()
+		for location in NAMES:
+			column = ord(location[0]) - ord('a')
+			row = 8 - int(location[1])
+			pygame.draw.rect(_background, LIGHT if (column + row) % 2 == 0 else DARK, square_rect(location, size))
+	return _background
+
+
+def square_rect(location, size=SIZE):
+	"""Return the pygame.Rect of a board of size pixels covered by location."""
+	column = ord(location[0]) - ord('a')
+	row = 8 - int(location[1])
+	left = round(column * size / 8)
+	top = round(row * size / 8)
+	return pygame.Rect(left, top, round((column + 1) * size / 8) - left, round((row + 1) * size / 8) - top)
+
+
+def draw_square(surface, board, location, highlight=None, size=SIZE, clear=True):
+	"""
+	Draw one square of board, with its piece, on surface.
+
+	Args:
+		surface: pygame.Surface to draw on, such as the Pygame window.
+		board: chessboard.
+		location: location of the square.
+		highlight: color to highlight the square with, or None.
+		size: size of the board on surface.
+		clear: whether to draw the empty square first; False if the background has just been drawn.
+
+	Returns:
+		The pygame.Rect drawn over.
+	"""
+	rect = square_rect(location, size)
+	if clear:
+		surface.blit(background(size), rect, rect)
+	if highlight is not None:
+		border = size / 8 / 15
+		pygame.draw.rect(surface, highlight, [rect.x + border, rect.y + border, rect.width - 2 * border, rect.height - 2 * border])
+	if board[location] != 'empty':
+		sprites(size).blit(surface, board[location], rect.center)
+	return rect
+
+
+def render(board, highlights=None, size=SIZE):
+	"""
+	Draw board on a new off-screen surface.
+
+	Args:
+		board: chessboard.
+		highlights: dict from locations to the colors to highlight them with, or None.
+		size: width and height of the image in pixels.
+
+	Returns:
+		A pygame.Surface of size by size pixels.
+	"""
+	surface = background(size).copy()
+	for location in NAMES:
+		highlight = highlights.get(location) if highlights else None
+		if highlight is not None or board[location] != 'empty':
+			draw_square(surface, board, location, highlight, size, False)
+	return surface
+
+
+def render_png(board, highlights=None, size=SIZE):
+	"""
+	Draw board as a PNG image.
+
+	Args:
+		board: chessboard.
+		highlights: dict from locations to the colors to highlight them with, or None.
+		size: width and height of the image in pixels.
+
+	Returns:
+		The bytes of the PNG file.
+	"""
+	buffer = io.BytesIO()
+	pygame.image.save(render(board, highlights, size), buffer, 'png')
+	return buffer.getvalue()
+
+
+def _start_worker(size):
+	"""Open the dummy display and load the sprites once in a new worker process."""
+	start_display()
+	sprites(size)
+	background(size)
+
+
+def _render_task(task):
+	"""Render one (board, highlights, size) task in a worker process, where board may be a packed position."""
+	board, highlights, size = task
+	if type(board) == bytes:
+		board = packed.decode(board)[0]
+	return render_png(board, highlights, size)
+
+
+def _pack(board):
+	"""Return board packed for a worker process, or board itself if it has more than 32 pieces or clocks too large to pack."""
+	try:
+		return packed.encode(board)
+	except ValueError:
+		return board
+
+
+def render_batch(boards, highlights=None, size=SIZE, workers=1, chunksize=16):
+	"""
+	Draw many boards as PNG images, optionally across a pool of processes.
+
+	Each worker process opens the dummy display and loads the sprites once, then reuses them for every board it draws.
+	Boards are sent to the workers packed, in packed.SIZE bytes each, or whole if they cannot be packed.
+
+	Args:
+		boards: iterable of chessboards.
+		highlights: iterable of highlight dicts (or None) matching boards, or None for no highlights.
+		size: width and height of the images in pixels.
+		workers: number of processes to draw with.
+		chunksize: number of boards sent to a worker at a time.
+
+	Yields:
+		The bytes of each board's PNG file, in the order of boards.
+	"""
+	if highlights is None:
+		tasks = ((board, None, size) for board in boards)
+	else:
+		tasks = ((board, highlight, size) for board, highlight in zip(boards, highlights))
+	if workers > 1:
+		# multiprocessing takes longer to import than the rest of this module, and is only needed here
+		from multiprocessing import Pool
+		tasks = ((_pack(board), highlight, size) for board, highlight, size in tasks)
+		with Pool(workers, _start_worker, (size,)) as pool:
+			for image in pool.imap(_render_task, tasks, chunksize):
+				yield image
+			pool.close()
+			pool.join()
+	else:
+		for task in tasks:
+			yield _render_task(task)
+
+
+def main():
+	"""Draw the positions in a file of FEN records, one per line, as numbered PNG files."""
+	import argparse
+	parser = argparse.ArgumentParser(description='Draw chess positions as PNG images without opening a window.')
+	parser.add_argument('file', help='file of FEN records, one per line')
+	parser.add_argument('-o', '--output', default='.', help='directory to write the images to (default: .)')
+	parser.add_argument('-s', '--size', type=int, default=SIZE, help='width and height of the images in pixels (default: ' + str(SIZE) + ')')
+	parser.add_argument('-w', '--workers', type=int, default=1, help='number of processes to draw with (default: 1)')
+	args = parser.parse_args()
+
+	with open(args.file) as positions:
+		fens = [line.strip() for line in positions if line.strip()]
+	os.makedirs(args.output, exist_ok=True)
+	boards = (from_fen(fen)[0] for fen in fens)
+	for number, image in enumerate(render_batch(boards, size=args.size, workers=args.workers), 1):
+		with open(os.path.join(args.output, str(number).zfill(len(str(len(fens)))) + '.png'), 'wb') as file:
+			file.write(image)
+	return 0
+
+
+if __name__ == '__main__':
+	raise SystemExit(main())
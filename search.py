@@ -0,0 +1,492 @@
+from utils import *
+from evaluation import evaluate
+from multiprocessing import Event, Process, Queue, shared_memory
+from queue import Empty
+import argparse
+import time
+
+
+INFINITY = 1000000
+MATE = 100000
+MAX_PLY = 128
+PROMOTIONS = ('Queen', 'Knight', 'Rook', 'Bishop')
+VALUES = [0, 100, 320, 330, 500, 900, 0, 0, 0, 100, 320, 330, 500, 900, 0, 0]
+PROMOTION_VALUES = {None: 0, 'Queen': 900, 'Rook': 500, 'Bishop': 330, 'Knight': 320}
+
+# transposition table entry bounds
+EXACT = 0
+LOWER = 1
+UPPER = 2
+# seconds parallel_search waits for a result before checking that its processes are still running
+POLL_SECONDS = 0.1
+
+
+class SearchAborted(Exception):
+	"""Raised inside a search when its node or time budget runs out."""
+
+
+class TranspositionTable:
+	"""Fixed-size table of search results keyed by Zobrist key, replacing entries that were searched less deeply."""
+
+	def __init__(self, size=1 << 16):
+		"""
+		size: number of entries, rounded down to a power of two.
+		"""
+		self.mask = (1 << (size.bit_length() - 1)) - 1
+		self.entries = [None] * (self.mask + 1)
+
+	def probe(self, key):
+		"""Return the (depth, score, bound, move) entry stored for key, or None."""
+		entry = self.entries[key & self.mask]
+		if entry is not None and entry[0] == key:
+			return entry[1:]
+		return None
+
+	def store(self, key, depth, score, bound, move):
+		"""Store a search result for key, unless the slot holds a deeper result for the same key."""
+		index = key & self.mask
+		entry = self.entries[index]
+		if entry is None or entry[0] != key or entry[1] <= depth:
+			self.entries[index] = (key, depth, score, bound, move)
+
+	def clear(self):
+		"""Remove all entries."""
+		self.entries = [None] * (self.mask + 1)
+
+
+class SharedTranspositionTable:
+	"""
+	Transposition table stored in a shared memory block, so that searches in several processes can share it.
+
+	Each entry is two 64-bit words, the key XORed with the packed data and the packed data itself. Entries are written
+	without locks: an entry torn by two processes writing at once no longer matches its key, and is treated as empty.
+	"""
+
+	PROMOTIONS = (None, 'Queen', 'Rook', 'Bishop', 'Knight')
+
+	def __init__(self, size=1 << 16, name=None):
+		"""
+		size: number of entries, rounded down to a power of two.
+		name: name of an existing table's shared memory block to attach to, or None to create a new block. The process
+		that creates the block frees it with close(unlink=True).
+		"""
+		self.mask = (1 << (size.bit_length() - 1)) - 1
+		if name is None:
+			self.memory = shared_memory.SharedMemory(create=True, size=16 * (self.mask + 1))
+			self.memory.buf[:] = bytes(16 * (self.mask + 1))
+		else:
+			self.memory = shared_memory.SharedMemory(name=name)
+		self.name = self.memory.name
+		self.words = self.memory.buf.cast('Q')
+
+	def _pack(self, depth, score, bound, move):
+		"""Return a search result packed into a 64-bit word."""
+		data = depth & 255 | bound << 8 | (score + INFINITY) << 10
+		if move is not None:
+			start, end, promotion = move
+			data |= (SQUARES[start] | SQUARES[end] << 6 | self.PROMOTIONS.index(promotion) << 12 | 1 << 15) << 32
+		return data
+
+	def _unpack(self, data):
+		"""Return the (depth, score, bound, move) entry packed into a 64-bit word."""
+		move = None
+		packed = data >> 32
+		if packed & 1 << 15:
+			move = (NAMES[packed & 63], NAMES[packed >> 6 & 63], self.PROMOTIONS[packed >> 12 & 7])
+		return (data & 255, (data >> 10 & (1 << 22) - 1) - INFINITY, data >> 8 & 3, move)
+
+	def probe(self, key):
+		"""Return the (depth, score, bound, move) entry stored for key, or None."""
+		index = 2 * (key & self.mask)
+		data = self.words[index + 1]
+		if self.words[index] ^ data != key or data == 0:
+			return None
+		return self._unpack(data)
+
+	def store(self, key, depth, score, bound, move):
+		"""Store a search result for key, unless the slot holds a deeper result for the same key."""
+		index = 2 * (key & self.mask)
+		data = self.words[index + 1]
+		if self.words[index] ^ data == key and data & 255 > depth:
+			return
+		data = self._pack(depth, score, bound, move)
+		self.words[index] = key ^ data
+		self.words[index + 1] = data
+
+	def clear(self):
+		"""Remove all entries."""
+		self.memory.buf[:] = bytes(16 * (self.mask + 1))
+
+	def close(self, unlink=False):
+		"""Detach from the shared memory block, and free it if unlink is true."""
+		self.words.release()
+		self.memory.close()
+		if unlink:
+			self.memory.unlink()
+
+
+class SearchResult:
+	"""Outcome of a search: the best move found and how it was found."""
+
+	def __init__(self, move, score, depth, pv, nodes, elapsed):
+		"""
+		move: best move, a (start, end, promotion) tuple, where promotion is None or the piece a pawn promotes to.
+		score: score of the move in centipawns for the player to move; mates score near MATE.
+		depth: depth of the last completed iteration.
+		pv: principal variation, the list of moves expected to be played from the position.
+		nodes: number of positions searched.
+		elapsed: search time in seconds.
+		"""
+		self.move = move
+		self.score = score
+		self.depth = depth
+		self.pv = pv
+		self.nodes = nodes
+		self.elapsed = elapsed
+
+
+def in_check(board, player):
+	"""Return if player's king is in check."""
+	return is_square_attacked(board, board.kings[player], opponent(player))
+
+
+def expand_moves(board, player, captures_only=False):
+	"""
+	Return player's legal moves as (start, end, promotion) tuples, listing each choice of promotion separately.
+
+	With captures_only, only captures and promotions are returned, as generate_legal_moves finds them.
+	"""
+	moves = []
+	for start, end in generate_legal_moves(board, player, captures_only):
+		if board[start].kind == PAWN and end[1] in '18':
+			for promotion in PROMOTIONS:
+				moves.append((start, end, promotion))
+		else:
+			moves.append((start, end, None))
+	return moves
+
+
+class Searcher:
+	"""
+	Negamax alpha-beta search with iterative deepening, a transposition table, quiescence search, and move ordering
+	by transposition table move, MVV-LVA captures, killer moves and the history heuristic.
+	"""
+
+	def __init__(self, board, player, table=None, time_limit=None, node_limit=None):
+		"""
+		board: chessboard to search. It is changed during the search and restored afterwards.
+		player: 'white' or 'black', the player to move.
+		table: TranspositionTable to use, so that it can be kept between searches.
+		time_limit: seconds to search for, or None.
+		node_limit: number of positions to search, or None.
+		"""
+		self.board = board
+		self.player = player
+		self.table = table if table is not None else TranspositionTable()
+		self.time_limit = time_limit
+		self.node_limit = node_limit
+		self.nodes = 0
+		self.deadline = None
+		self.stack = []
+		self.path = []
+		self.pv = [[] for ply in range(MAX_PLY + 1)]
+		self.killers = [[None, None] for ply in range(MAX_PLY + 1)]
+		self.history = {}
+		self.stop = None
+
+	def _count(self):
+		"""Count a searched position, and raise SearchAborted when the budget has run out."""
+		self.nodes += 1
+		if self.node_limit is not None and self.nodes > self.node_limit:
+			raise SearchAborted()
+		if self.nodes & 1023 == 0:
+			if self.deadline is not None and time.perf_counter() > self.deadline:
+				raise SearchAborted()
+			if self.stop is not None and self.stop.is_set():
+				raise SearchAborted()
+
+	def _make(self, move, player):
+		"""(Mutating) Make move on the board, pushing its undo record."""
+		start, end, promotion = move
+		self.path.append(self.board.key)
+		self.stack.append(make_move(self.board, start, end))
+		if promotion is not None:
+			promote(self.board, promotion, player, end)
+
+	def _unmake(self):
+		"""(Mutating) Take back the last move made by _make."""
+		unmake_move(self.board, self.stack.pop())
+		self.path.pop()
+
+	def _is_capture(self, move):
+		"""Return if move captures a piece, including en passant, or promotes a pawn."""
+		start, end, promotion = move
+		squares = self.board.squares
+		return squares[SQUARES[end]] != EMPTY or promotion is not None or (squares[SQUARES[start]] & 7 == PAWN and start[0] != end[0])
+
+	def _order(self, moves, ply, best):
+		"""Return moves sorted best first: the transposition table move, captures by MVV-LVA, killers, then by history."""
+		squares = self.board.squares
+		killers = self.killers[ply]
+		scores = {}
+		for move in moves:
+			start, end, promotion = move
+			if move == best:
+				scores[move] = 1 << 30
+			elif self._is_capture(move):
+				scores[move] = (1 << 20) + 16 * (VALUES[squares[SQUARES[end]]] + PROMOTION_VALUES[promotion]) - VALUES[squares[SQUARES[start]]] // 100
+			elif move == killers[0] or move == killers[1]:
+				scores[move] = 1 << 19
+			else:
+				scores[move] = self.history.get((start, end), 0)
+		return sorted(moves, key=scores.__getitem__, reverse=True)
+
+	def _quiescence(self, player, alpha, beta, ply):
+		"""
+		Return the score of the position searching only captures and promotions, so that leaves are quiet.
+
+		A player in check cannot stand pat, so every move out of check is searched instead, and a position with none
+		scores as mate.
+		"""
+		self._count()
+		self.pv[ply] = []
+		if ply < MAX_PLY and in_check(self.board, player):
+			moves = expand_moves(self.board, player)
+			if not moves:
+				return -MATE + ply
+		else:
+			score = evaluate(self.board, player)
+			if score >= beta or ply >= MAX_PLY:
+				return score
+			if score > alpha:
+				alpha = score
+			moves = expand_moves(self.board, player, True)
+		for move in self._order(moves, ply, None):
+			self._make(move, player)
+			score = -self._quiescence(opponent(player), -beta, -alpha, ply + 1)
+			self._unmake()
+			if score >= beta:
+				return score
+			if score > alpha:
+				alpha = score
+				self.pv[ply] = [move] + self.pv[ply + 1]
+		return alpha
+
+	def _negamax(self, player, depth, alpha, beta, ply):
+		"""Return the score of the position for player, searching depth moves deep within the window (alpha, beta)."""
+		board = self.board
+		self.pv[ply] = []
+		if ply and board.key in self.path:
+			return 0
+		check = in_check(board, player)
+		if check and ply < MAX_PLY // 2:
+			depth += 1
+		if depth <= 0 or ply >= MAX_PLY:
+			return self._quiescence(player, alpha, beta, ply)
+		self._count()
+
+		best_move = None
+		entry = self.table.probe(board.key)
+		if entry is not None:
+			entry_depth, score, bound, best_move = entry
+			if ply and entry_depth >= depth:
+				if score > MATE - MAX_PLY:
+					score -= ply
+				elif score < -MATE + MAX_PLY:
+					score += ply
+				if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+					return score
+
+		moves = expand_moves(board, player)
+		if not moves:
+			return -MATE + ply if check else 0
+
+		original_alpha = alpha
+		best = -INFINITY
+		for move in self._order(moves, ply, best_move):
+			self._make(move, player)
+			score = -self._negamax(opponent(player), depth - 1, -beta, -alpha, ply + 1)
+			self._unmake()
+			if score > best:
+				best = score
+				best_move = move
+				if score > alpha:
+					alpha = score
+					self.pv[ply] = [move] + self.pv[ply + 1]
+					if alpha >= beta:
+						if not self._is_capture(move):
+							if move != self.killers[ply][0]:
+								self.killers[ply] = [move, self.killers[ply][0]]
+							self.history[move[:2]] = self.history.get(move[:2], 0) + depth * depth
+						break
+
+		bound = UPPER if best <= original_alpha else LOWER if best >= beta else EXACT
+		stored = best + ply if best > MATE - MAX_PLY else best - ply if best < -MATE + MAX_PLY else best
+		self.table.store(board.key, depth, stored, bound, best_move)
+		return best
+
+	def run(self, max_depth=MAX_PLY, start_depth=1):
+		"""
+		Search the position by iterative deepening from start_depth until max_depth is reached or the budget runs out.
+
+		Returns:
+			A SearchResult for the deepest completed iteration. If no iteration completed, the move is the first move in search order.
+		"""
+		begin = time.perf_counter()
+		if self.time_limit is not None:
+			self.deadline = begin + self.time_limit
+		moves = self._order(expand_moves(self.board, self.player), 0, None)
+		if not moves:
+			return SearchResult(None, -MATE if in_check(self.board, self.player) else 0, 0, [], 0, 0.0)
+		result = SearchResult(moves[0], 0, 0, [moves[0]], 0, 0.0)
+		for depth in range(start_depth, max_depth + 1):
+			try:
+				score = self._negamax(self.player, depth, -INFINITY, INFINITY, 0)
+			except SearchAborted:
+				while self.stack:
+					self._unmake()
+				break
+			pv = list(self.pv[0])
+			result = SearchResult(pv[0], score, depth, pv, self.nodes, time.perf_counter() - begin)
+			if abs(score) > MATE - MAX_PLY:
+				break
+		result.nodes = self.nodes
+		result.elapsed = time.perf_counter() - begin
+		return result
+
+
+def _search_worker(board, player, index, table_name, table_size, depth, time_limit, node_limit, stop, results):
+	"""Run one process of a parallel search, sharing the transposition table named table_name, and put its result on results."""
+	table = SharedTranspositionTable(table_size, table_name)
+	searcher = Searcher(board, player, table, time_limit, node_limit)
+	searcher.stop = stop
+	if index == 0:
+		result = searcher.run(depth)
+		stop.set()
+	else:
+		# helpers search past the main depth, half of them one ply ahead, so that they fill the table with different results
+		result = searcher.run(MAX_PLY, 1 + index % 2)
+	results.put((index, result.move, result.score, result.depth, result.pv, result.nodes))
+	table.close()
+
+
+def parallel_search(board, player, workers, depth=MAX_PLY, time_limit=None, node_limit=None, table_size=1 << 18):
+	"""
+	Return the best move for player found by several processes searching the position together (Lazy SMP).
+
+	Every process searches the whole position, sharing one SharedTranspositionTable; the first process decides the depth,
+	and the others stop when it finishes.
+
+	Args:
+		board: chessboard.
+		player: 'white' or 'black'.
+		workers: number of processes.
+		depth: maximum number of moves deep to search.
+		time_limit: seconds to search for, or None.
+		node_limit: total number of positions to search across all processes, or None.
+		table_size: number of entries in the shared transposition table.
+
+	Returns:
+		A SearchResult from the process with the deepest completed iteration, preferring the first process, with the
+		nodes of all processes.
+
+	Raises:
+		RuntimeError: if a process exits without a result, for example when it runs out of memory. The other processes
+			are stopped, and the shared table is removed, before it is raised.
+	"""
+	begin = time.perf_counter()
+	table = SharedTranspositionTable(table_size)
+	stop = Event()
+	results = Queue()
+	limit = None if node_limit is None else max(1, node_limit // workers)
+	processes = [Process(target=_search_worker, args=(board, player, index, table.name, table_size, depth, time_limit, limit, stop, results)) for index in range(workers)]
+	finished = []
+	try:
+		for process in processes:
+			process.start()
+		while len(finished) < workers:
+			try:
+				finished.append(results.get(timeout=POLL_SECONDS))
+			except Empty:
+				# a process that put its result exits with code 0, and its result is then waiting in the queue
+				for index, process in enumerate(processes):
+					if process.exitcode not in (None, 0):
+						raise RuntimeError('search process ' + str(index) + ' exited with code ' + str(process.exitcode)) from None
+	finally:
+		stop.set()
+		for process in processes:
+			if process.pid is not None:
+				process.join(POLL_SECONDS if len(finished) < workers else None)
+				if process.is_alive():
+					process.terminate()
+					process.join()
+		table.close(unlink=True)
+	finished.sort()
+
+	index, move, score, reached, pv, nodes = max(finished, key=lambda result: (result[3], -result[0]))
+	return SearchResult(move, score, reached, pv, sum(result[5] for result in finished), time.perf_counter() - begin)
+
+
+def search(board, player, depth=MAX_PLY, time_limit=None, node_limit=None, table=None, workers=1):
+	"""
+	Return the best move for player found within a depth, time or node budget.
+
+	Args:
+		board: chessboard. It is restored to its original position before returning.
+		player: 'white' or 'black'.
+		depth: maximum number of moves deep to search.
+		time_limit: seconds to search for, or None.
+		node_limit: number of positions to search, or None.
+		table: TranspositionTable to reuse between searches, or None for a new one. Not used when workers is more than 1.
+		workers: number of processes to search with; see parallel_search.
+
+	Returns:
+		A SearchResult with the best move, its score and the principal variation.
+	"""
+	if workers > 1:
+		return parallel_search(board, player, workers, depth, time_limit, node_limit)
+	return Searcher(board, player, table, time_limit, node_limit).run(depth)
+
+
+def compare(board, player, workers, depth=None, node_limit=None):
+	"""
+	Search a position in one process and then in workers processes with the same depth or node budget.
+
+	Returns:
+		A (single, parallel, speedup) tuple of the two SearchResults and the ratio of their search times.
+	"""
+	single = search(board, player, depth or MAX_PLY, node_limit=node_limit)
+	parallel = search(board, player, depth or MAX_PLY, node_limit=node_limit, workers=workers)
+	return single, parallel, single.elapsed / parallel.elapsed
+
+
+def _report(result):
+	"""Return a one line summary of a SearchResult."""
+	return 'depth ' + str(result.depth) + '  score ' + str(result.score) + '  nodes ' + str(result.nodes) + '  time ' + format(result.elapsed, '.3f') + 's  nps ' + str(int(result.nodes / result.elapsed) if result.elapsed else 0)
+
+
+def main():
+	"""Search a position from the command line and print the result of the deepest completed iteration, and its principal variation."""
+	parser = argparse.ArgumentParser(description='Find the best move in a chess position.')
+	parser.add_argument('fen', nargs='?', default='rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1', help='FEN record of the position (default: the starting position)')
+	parser.add_argument('-d', '--depth', type=int, default=MAX_PLY, help='maximum depth to search')
+	parser.add_argument('-t', '--time', type=float, default=5.0, help='seconds to search for (default: 5)')
+	parser.add_argument('-n', '--nodes', type=int, default=None, help='number of positions to search')
+	parser.add_argument('-w', '--workers', type=int, default=1, help='number of processes to search with (default: 1)')
+	parser.add_argument('--compare', action='store_true', help='search with one process and with --workers processes on the same depth or node budget, and report the speedup')
+	args = parser.parse_args()
+
+	board, player = from_fen(args.fen)
+	if args.compare:
+		single, result, speedup = compare(board, player, args.workers, args.depth if args.depth != MAX_PLY else None, args.nodes)
+		print('1 process    ' + _report(single))
+		print(str(args.workers) + ' processes  ' + _report(result))
+		print('speedup ' + format(speedup, '.2f'))
+	else:
+		result = search(board, player, args.depth, args.time, args.nodes, workers=args.workers)
+		print(_report(result))
+	print('pv ' + ' '.join(start + end + PROMOTION_LETTERS.get(promotion, '') for start, end, promotion in result.pv))
+
+
+if __name__ == '__main__':
+	main()
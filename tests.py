@@ -1,5 +1,28 @@
 from utils import *
+import bench
+import bitboard
+import copy
+import evaluation
+import instrument
+import os
+import packed
+import perft
+import pgn
+import random
+import search
+import subprocess
+import sys
 import unittest
+import utils
+
+try:
+	import render
+except ImportError:
+	render = None
+try:
+	import batch
+except ImportError:
+	batch = None
 
 
 class TestPawn(unittest.TestCase):
@@ -422,5 +445,1121 @@ class TestEnPassant(unittest.TestCase):
 		self.assertTrue(pawn.valid_move('f6'))
 
 
+class TestBoard(unittest.TestCase):
+
+	def test_board(self):
+		board = starting_board()
+		self.assertEqual(len(board), 64)
+		self.assertTrue('e4' in board)
+		self.assertFalse('i9' in board)
+		self.assertEqual(board['e4'], 'empty')
+		self.assertEqual(board.squares[SQUARES['e1']], KING | WHITE)
+		self.assertEqual(board.squares[SQUARES['d8']], QUEEN | BLACK)
+		self.assertEqual(board.squares[SQUARES['e4']], EMPTY)
+		self.assertEqual(len([piece for piece in board.values() if piece != 'empty']), 32)
+
+		board['e2'].make_move('e4')
+		self.assertEqual(board.squares[SQUARES['e2']], EMPTY)
+		self.assertEqual(board.squares[SQUARES['e4']], PAWN | WHITE)
+		self.assertIs(board['e4'], board.pieces[SQUARES['e4']])
+
+	def test_blocked_pawn(self):
+		board = starting_board()
+		board['b1'].make_move('c3')
+		self.assertEqual(set(board['c2'].get_moves()), set())
+		self.assertFalse(board['c2'].valid_move('c4'))
+
+
+class TestTables(unittest.TestCase):
+
+	def test_tables(self):
+		names = lambda squares: set(NAMES[square] for square in squares)
+		self.assertEqual(names(KNIGHT_TARGETS[SQUARES['a1']]), set(['b3', 'c2']))
+		self.assertEqual(names(KNIGHT_TARGETS[SQUARES['e4']]), set(['d2', 'f2', 'c3', 'g3', 'c5', 'g5', 'd6', 'f6']))
+		self.assertEqual(names(KING_TARGETS[SQUARES['h8']]), set(['g8', 'g7', 'h7']))
+		self.assertEqual([NAMES[square] for square in RAYS[LEFT_DOWN][SQUARES['d4']]], ['c3', 'b2', 'a1'])
+		self.assertEqual([NAMES[square] for square in RAYS[UP][SQUARES['e6']]], ['e7', 'e8'])
+		self.assertEqual(RAYS[RIGHT][SQUARES['h3']], ())
+		self.assertEqual(sum(len(ray) for ray in QUEEN_RAYS[SQUARES['d4']]), 27)
+		self.assertEqual(PAWN_ADVANCES['white'][SQUARES['e2']], (SQUARES['e3'], SQUARES['e4']))
+		self.assertEqual(PAWN_ADVANCES['black'][SQUARES['e6']], (SQUARES['e5'], -1))
+		self.assertEqual(PAWN_CAPTURES['black'][SQUARES['a7']], (-1, SQUARES['b6']))
+
+
+class TestAttacks(unittest.TestCase):
+
+	def test_is_square_attacked(self):
+		board = starting_board()
+		self.assertTrue(is_square_attacked(board, 'f3', 'white'))
+		self.assertTrue(is_square_attacked(board, 'e3', 'white'))
+		self.assertFalse(is_square_attacked(board, 'e4', 'white'))
+		self.assertTrue(is_square_attacked(board, 'f6', 'black'))
+		self.assertFalse(is_square_attacked(board, 'e5', 'black'))
+
+		board['e2'].make_move('e4')
+		board['e7'].make_move('e5')
+		self.assertTrue(is_square_attacked(board, 'h5', 'white'))
+		self.assertTrue(is_square_attacked(board, 'a6', 'white'))
+		self.assertTrue(is_square_attacked(board, SQUARES['a3'], 'black'))
+		self.assertFalse(is_square_attacked(board, 'd5', 'black'))
+		board['d1'].make_move('h5')
+		self.assertTrue(is_square_attacked(board, 'f7', 'white'))
+		self.assertFalse(is_square_attacked(board, 'e8', 'white'))
+
+	def test_checkmate(self):
+		board = starting_board()
+		board['e2'].make_move('e4')
+		board['f7'].make_move('f5')
+		board['e4'].make_move('f5')
+		board['g7'].make_move('g5')
+		board['d1'].make_move('h5')
+		self.assertEqual(set(board['e8'].get_moves()), set(['f7']))
+		self.assertTrue(board['e8'].check('f7'))
+		self.assertFalse(board['e8'].valid_move('f7'))
+		self.assertFalse(can_move('black', board))
+
+
+def legal_moves(board, player):
+	"""Return the set of legal (start, end) moves for player, found with get_moves and valid_move."""
+	return set((location, move) for location, piece in board.items() if piece != 'empty' and piece.color == player for move in piece.get_moves() if piece.valid_move(move))
+
+
+class TestBitboard(unittest.TestCase):
+
+	def assertSameMoves(self, board, player):
+		position = bitboard.from_board(board, player)
+		self.assertEqual(set((NAMES[start], NAMES[end]) for start, end, promotion in position.legal_moves()), legal_moves(board, player))
+		self.assertEqual(position.count_legal_moves(), len(position.legal_moves()))
+		legal = []
+		for move in position.pseudo_legal_moves():
+			after = position.make_move(move)
+			if not after.attacked(after.bitboards[6 * position.side + 5].bit_length() - 1, after.side, after.occupancy(0) | after.occupancy(1)):
+				legal.append(move)
+		self.assertEqual(sorted(position.legal_moves()), sorted(legal))
+		copy, copy_player = bitboard.to_board(position)
+		self.assertEqual(copy_player, player)
+		self.assertEqual(copy.squares, board.squares)
+		self.assertEqual(legal_moves(copy, player), legal_moves(board, player))
+
+	def test_special_moves(self):
+		board = starting_board()
+		for start, end in [('e2', 'e4'), ('d7', 'd5'), ('e4', 'e5'), ('f7', 'f5'), ('g1', 'f3'), ('g8', 'f6'), ('f1', 'c4'), ('d5', 'c4'), ('e5', 'f6')]:
+			self.assertSameMoves(board, board[start].color)
+			board[start].make_move(end)
+		self.assertSameMoves(board, 'black')
+		position = bitboard.from_board(board, 'black')
+		self.assertEqual(position.en_passant, -1)
+		self.assertEqual(position.castling, bitboard.WHITE_KINGSIDE | bitboard.WHITE_QUEENSIDE | bitboard.BLACK_KINGSIDE | bitboard.BLACK_QUEENSIDE)
+
+		board['c4'].make_move('c3')
+		self.assertTrue((SQUARES['e1'], SQUARES['g1'], 0) in bitboard.from_board(board, 'white').legal_moves())
+		board['f6'].make_move('g7')
+		board['c3'].make_move('b2')
+		promotions = [move for move in bitboard.from_board(board, 'white').legal_moves() if move[0] == SQUARES['g7']]
+		self.assertEqual(len(promotions), 12)
+		self.assertSameMoves(board, 'white')
+
+	def test_random_games(self):
+		for seed in range(3):
+			generator = random.Random(seed)
+			board = starting_board()
+			player = 'white'
+			for ply in range(80):
+				self.assertSameMoves(board, player)
+				moves = sorted(legal_moves(board, player))
+				if not moves:
+					break
+				start, end = generator.choice(moves)
+				board[start].make_move(end)
+				if type(board[end]) == Pawn and board[end].promoted:
+					promote(board, generator.choice(['Queen', 'Rook', 'Bishop', 'Knight']), player, end)
+				player = opponent(player)
+
+
+	def test_perft(self):
+		depths = {'initial': 3, 'kiwipete': 3, 'position 3': 4, 'position 4': 3, 'position 5': 3, 'position 6': 2}
+		for name, fen, counts in perft.POSITIONS:
+			board, player = from_fen(fen)
+			position = bitboard.from_board(board, player)
+			for depth in range(1, depths[name] + 1):
+				self.assertEqual(bitboard.perft(position, depth), counts[depth - 1], name)
+
+	def test_pins_and_checks(self):
+		# a pinned rook may only slide along the pin, and a double check leaves only king moves
+		board, player = from_fen('4k3/4r3/8/8/8/8/4R3/4K3 w - - 0 1')
+		moves = bitboard.from_board(board, player).legal_moves()
+		self.assertEqual(set(NAMES[end] for start, end, promotion in moves if NAMES[start] == 'e2'), set(['e3', 'e4', 'e5', 'e6', 'e7']))
+		board, player = from_fen('4k3/8/8/8/1b6/8/Q7/r3K3 w - - 0 1')
+		self.assertTrue(all(NAMES[start] == 'e1' for start, end, promotion in bitboard.from_board(board, player).legal_moves()))
+		# the en passant capture would expose the king along the row
+		board, player = from_fen('8/8/8/K2pP2r/8/8/8/7k w - d6 0 1')
+		self.assertFalse((SQUARES['e5'], SQUARES['d6'], 0) in bitboard.from_board(board, player).legal_moves())
+
+
+class TestLegalMoves(unittest.TestCase):
+
+	def test_starting_board(self):
+		board = starting_board()
+		self.assertEqual(len(generate_legal_moves(board, 'white')), 20)
+		self.assertEqual(set(generate_legal_moves(board, 'black')), legal_moves(board, 'black'))
+
+	def test_pin_and_check(self):
+		board = Board()
+		board['e1'] = King('white', 'e1', board, True)
+		board['e2'] = Rook('white', 'e2', board, True)
+		board['d2'] = Knight('white', 'd2', board)
+		board['c3'] = Bishop('black', 'c3', board)
+		board['e8'] = Rook('black', 'e8', board, True)
+		board['h8'] = King('black', 'h8', board, True)
+		moves = set(generate_legal_moves(board, 'white'))
+		self.assertEqual(moves, legal_moves(board, 'white'))
+		self.assertEqual(set(end for start, end in moves if start == 'e2'), set(['e3', 'e4', 'e5', 'e6', 'e7', 'e8']))
+		self.assertEqual(set(end for start, end in moves if start == 'd2'), set())
+
+		board['h4'] = Queen('black', 'h4', board)
+		moves = set(generate_legal_moves(board, 'white'))
+		self.assertEqual(moves, legal_moves(board, 'white'))
+		self.assertEqual(moves, set([('e1', 'd1'), ('e1', 'f1')]))
+
+		board['e8'] = 'empty'
+		self.assertTrue(('e2', 'f2') in generate_legal_moves(board, 'white'))
+		board['f3'] = Knight('black', 'f3', board)
+		moves = set(generate_legal_moves(board, 'white'))
+		self.assertEqual(moves, legal_moves(board, 'white'))
+		self.assertTrue(all(start == 'e1' for start, end in moves))
+
+	def test_en_passant_discovered_check(self):
+		board = Board()
+		board['a5'] = King('white', 'a5', board, True)
+		board['e5'] = Pawn('white', 'e5', board, True)
+		board['d5'] = Pawn('black', 'd5', board)
+		board['h5'] = Rook('black', 'h5', board, True)
+		board['h8'] = King('black', 'h8', board, True)
+		self.assertFalse(('e5', 'd6') in generate_legal_moves(board, 'white'))
+		self.assertFalse(board['e5'].valid_move('d6'))
+		board['h5'] = 'empty'
+		self.assertTrue(('e5', 'd6') in generate_legal_moves(board, 'white'))
+
+	def test_random_games(self):
+		for seed in range(3):
+			generator = random.Random(seed)
+			board = starting_board()
+			player = 'white'
+			for ply in range(80):
+				moves = generate_legal_moves(board, player)
+				self.assertEqual(set(moves), legal_moves(board, player))
+				self.assertEqual(sorted(iter_legal_moves(board, player)), sorted(moves))
+				self.assertEqual(has_legal_move(board, player), len(moves) > 0)
+				captures = [(start, end) for start, end in moves if board[end] != 'empty' or (type(board[start]) == Pawn and (start[0] != end[0] or end[1] in '18'))]
+				self.assertEqual(sorted(generate_legal_moves(board, player, captures_only=True)), sorted(captures))
+				if not moves:
+					break
+				start, end = generator.choice(sorted(moves))
+				board[start].make_move(end)
+				if type(board[end]) == Pawn and board[end].promoted:
+					promote(board, generator.choice(['Queen', 'Rook', 'Bishop', 'Knight']), player, end)
+				player = opponent(player)
+
+	def test_has_legal_move(self):
+		board, player = from_fen('rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3')
+		self.assertFalse(has_legal_move(board, player))
+		board, player = from_fen('7k/5Q2/6K1/8/8/8/8/8 b - - 0 1')
+		self.assertFalse(has_legal_move(board, player))
+		board, player = from_fen('7k/8/5Q2/6K1/8/8/8/8 b - - 0 1')
+		self.assertTrue(has_legal_move(board, player))
+		self.assertEqual(next(iter_legal_moves(board, player)), ('h8', 'g8'))
+		# king moves, then every capture, then the quiet moves
+		board, player = from_fen('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1')
+		moves = list(iter_legal_moves(board, player))
+		self.assertEqual(moves[:4], [('e1', 'd1'), ('e1', 'f1'), ('e1', 'c1'), ('e1', 'g1')])
+		captures = [board[end] != 'empty' for start, end in moves[4:]]
+		self.assertEqual(captures, sorted(captures, reverse=True))
+		self.assertEqual(captures.count(True), 8)
+
+	def test_iter_moves(self):
+		board, player = from_fen('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1')
+		for piece in board.values():
+			if piece != 'empty':
+				self.assertEqual(sorted(piece.iter_moves()), sorted(piece.get_moves()))
+		self.assertEqual(list(board['d5'].iter_moves()), ['e6', 'd6'])
+
+
+class TestPerft(unittest.TestCase):
+
+	def test_positions(self):
+		depths = {'initial': 3, 'kiwipete': 2, 'position 3': 3, 'position 4': 3, 'position 5': 2, 'position 6': 2}
+		for name, fen, counts in perft.POSITIONS:
+			board, player = from_fen(fen)
+			before = snapshot(board)
+			for depth in range(1, depths[name] + 1):
+				self.assertEqual(perft.perft(board, player, depth), counts[depth - 1], name)
+			self.assertEqual(snapshot(board), before)
+
+	def test_divide(self):
+		board, player = from_fen(perft.POSITIONS[4][1])
+		moves = perft.divide(board, player, 2)
+		self.assertEqual(len(moves), 44)
+		self.assertEqual(sum(moves.values()), 1486)
+		self.assertEqual(set(move for move in moves if move.startswith('d7c8')), set(['d7c8q', 'd7c8r', 'd7c8b', 'd7c8n']))
+		self.assertEqual(perft.divide(board, player, 2, backend='bitboard'), moves)
+
+
+class TestZobrist(unittest.TestCase):
+
+	def test_transposition(self):
+		board = starting_board()
+		start = board.key
+		self.assertEqual(start, zobrist_key(board, 'white'))
+		for location, move in [('g1', 'f3'), ('g8', 'f6'), ('f3', 'g1'), ('f6', 'g8')]:
+			board[location].make_move(move)
+		self.assertEqual(board.key, start)
+
+		first = starting_board()
+		for location, move in [('e2', 'e4'), ('e7', 'e5'), ('g1', 'f3')]:
+			first[location].make_move(move)
+		second = starting_board()
+		for location, move in [('g1', 'f3'), ('e7', 'e5'), ('e2', 'e4')]:
+			second[location].make_move(move)
+		self.assertEqual(first.key, second.key)
+		self.assertNotEqual(first.key, start)
+
+	def test_castling_and_en_passant(self):
+		board = starting_board()
+		for location, move in [('g1', 'f3'), ('g8', 'f6'), ('h1', 'g1'), ('h8', 'g8'), ('g1', 'h1'), ('g8', 'h8')]:
+			board[location].make_move(move)
+		self.assertNotEqual(board.key, starting_board().key)
+		self.assertEqual(board.state.castling, WHITE_QUEENSIDE | BLACK_QUEENSIDE)
+
+		board, player = from_fen('4k3/8/8/8/3p4/8/4P3/4K3 w - - 0 1')
+		other, other_player = from_fen('4k3/8/8/8/3pP3/8/8/4K3 b - e3 0 1')
+		board['e2'].make_move('e4')
+		self.assertEqual(board.state.en_passant, SQUARES['e3'])
+		self.assertEqual(board.key, other.key)
+		self.assertEqual(board.key, zobrist_key(board, 'black'))
+
+	def test_random_games(self):
+		for seed in range(3):
+			generator = random.Random(seed)
+			board = starting_board()
+			player = 'white'
+			for ply in range(100):
+				moves = sorted(generate_legal_moves(board, player))
+				if not moves:
+					break
+				key = board.key
+				for start, end in moves:
+					unmake_move(board, make_move(board, start, end))
+					self.assertEqual(board.key, key)
+				start, end = generator.choice(moves)
+				board[start].make_move(end)
+				if type(board[end]) == Pawn and board[end].promoted:
+					promote(board, generator.choice(['Queen', 'Rook', 'Bishop', 'Knight']), player, end)
+				player = opponent(player)
+				self.assertEqual(board.key, zobrist_key(board, player))
+
+
+class TestSearch(unittest.TestCase):
+
+	def test_mate_in_one(self):
+		board, player = from_fen('r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4')
+		before = snapshot(board)
+		key = board.key
+		result = search.search(board, player, depth=3)
+		self.assertEqual(result.move, ('h5', 'f7', None))
+		self.assertEqual(result.score, search.MATE - 1)
+		self.assertEqual(snapshot(board), before)
+		self.assertEqual(board.key, key)
+
+	def test_quiescence_in_check(self):
+		# a player in check may not stand pat, so quiescence finds the mate that the material count hides
+		board, player = from_fen('r1bqkb1r/pppp1Qpp/2n2n2/4p3/2B1P3/8/PPPP1PPP/RNB1K1NR b KQkq - 0 4')
+		searcher = search.Searcher(board, player)
+		self.assertEqual(searcher._quiescence(player, -search.MATE, search.MATE, 1), -search.MATE + 1)
+		board, player = from_fen('4k3/8/8/8/8/8/4q3/R3K3 w - - 0 1')
+		searcher = search.Searcher(board, player)
+		self.assertTrue(searcher._quiescence(player, -search.MATE, search.MATE, 0) > -search.MATE + 1)
+
+	def test_mate_in_two(self):
+		board, player = from_fen('2r3k1/5ppp/8/8/8/8/3R1PPP/3R2K1 w - - 0 1')
+		result = search.search(board, player, depth=4)
+		self.assertEqual(result.score, search.MATE - 3)
+		self.assertEqual(result.pv, [('d2', 'd8', None), ('c8', 'd8', None), ('d1', 'd8', None)])
+
+	def test_wins_material(self):
+		board, player = from_fen('4k3/8/8/3q4/8/8/3R4/3RK3 w - - 0 1')
+		result = search.search(board, player, depth=2)
+		self.assertEqual(result.move, ('d2', 'd5', None))
+		self.assertTrue(result.score > 400)
+
+	def test_promotion(self):
+		board, player = from_fen('8/4P1k1/8/8/8/8/8/4K3 w - - 0 1')
+		result = search.search(board, player, depth=2)
+		self.assertEqual(result.move, ('e7', 'e8', 'Queen'))
+		self.assertEqual(type(board['e7']), Pawn)
+
+	def test_budget(self):
+		board = starting_board()
+		before = snapshot(board)
+		table = search.TranspositionTable(1 << 12)
+		result = search.search(board, 'white', node_limit=2000, table=table)
+		self.assertTrue(result.nodes <= 2001)
+		self.assertTrue(result.depth >= 1)
+		self.assertTrue(result.move in search.expand_moves(board, 'white'))
+		self.assertEqual(result.pv[0], result.move)
+		self.assertEqual(snapshot(board), before)
+		self.assertIsNotNone(table.probe(board.key))
+
+		result = search.search(board, 'white', time_limit=0.2)
+		self.assertTrue(result.elapsed < 1.0)
+		self.assertEqual(snapshot(board), before)
+
+
+def exit_worker(*args):
+	"""Stand in for search._search_worker that dies without putting a result, as a process killed for memory would."""
+	os._exit(3)
+
+
+class TestParallelSearch(unittest.TestCase):
+
+	def test_shared_table(self):
+		table = search.SharedTranspositionTable(1 << 8)
+		try:
+			other = search.SharedTranspositionTable(1 << 8, table.name)
+			key = starting_board().key
+			self.assertIsNone(table.probe(key))
+			table.store(key, 5, -search.MATE + 3, search.UPPER, ('e7', 'e8', 'Knight'))
+			self.assertEqual(other.probe(key), (5, -search.MATE + 3, search.UPPER, ('e7', 'e8', 'Knight')))
+			other.store(key, 3, 12, search.EXACT, None)
+			self.assertEqual(table.probe(key), (5, -search.MATE + 3, search.UPPER, ('e7', 'e8', 'Knight')))
+			other.store(key, 6, 12, search.EXACT, ('g1', 'f3', None))
+			self.assertEqual(table.probe(key), (6, 12, search.EXACT, ('g1', 'f3', None)))
+
+			index = 2 * (key & table.mask)
+			table.words[index + 1] ^= 1 << 40
+			self.assertIsNone(other.probe(key))
+			other.close()
+		finally:
+			table.close(unlink=True)
+
+	def test_parallel_search(self):
+		board, player = from_fen('2r3k1/5ppp/8/8/8/8/3R1PPP/3R2K1 w - - 0 1')
+		before = snapshot(board)
+		result = search.search(board, player, depth=4, workers=2)
+		self.assertEqual(result.move, ('d2', 'd8', None))
+		self.assertEqual(result.score, search.MATE - 3)
+		self.assertEqual(snapshot(board), before)
+
+	def test_worker_dies(self):
+		names = []
+		table_class = search.SharedTranspositionTable
+		worker = search._search_worker
+
+		class Table(table_class):
+			def __init__(self, size, name=None):
+				table_class.__init__(self, size, name)
+				names.append(self.name)
+
+		search.SharedTranspositionTable = Table
+		search._search_worker = exit_worker
+		try:
+			with self.assertRaises(RuntimeError):
+				search.parallel_search(starting_board(), 'white', 2, depth=2, table_size=1 << 8)
+		finally:
+			search.SharedTranspositionTable = table_class
+			search._search_worker = worker
+		with self.assertRaises(FileNotFoundError):
+			search.shared_memory.SharedMemory(names[0])
+
+
+def snapshot(board):
+	"""Return a comparable summary of every square in board, including piece flags."""
+	summary = {}
+	for position, piece in board.items():
+		if piece == 'empty':
+			summary[position] = 'empty'
+		else:
+			summary[position] = (type(piece), piece.color, piece.location, getattr(piece, 'moved', None), getattr(piece, 'promoted', None), getattr(piece, 'en_passant_left', None), getattr(piece, 'en_passant_right', None))
+	return summary
+
+
+class TestMakeUnmake(unittest.TestCase):
+
+	def test_capture(self):
+		board = starting_board()
+		board['e2'].make_move('e4')
+		board['d7'].make_move('d5')
+		before = snapshot(board)
+		undo = make_move(board, 'e4', 'd5')
+		self.assertEqual(type(board['d5']), Pawn)
+		self.assertEqual(board['d5'].color, 'white')
+		unmake_move(board, undo)
+		self.assertEqual(snapshot(board), before)
+
+	def test_en_passant(self):
+		board = starting_board()
+		board['e2'].make_move('e4')
+		board['a7'].make_move('a6')
+		board['e4'].make_move('e5')
+		board['d7'].make_move('d5')
+		before = snapshot(board)
+		undo = make_move(board, 'e5', 'd6')
+		self.assertEqual(board['d5'], 'empty')
+		self.assertFalse(board['d6'].en_passant_left)
+		unmake_move(board, undo)
+		self.assertEqual(snapshot(board), before)
+		self.assertTrue(board['e5'].en_passant_left)
+
+	def test_castle(self):
+		board = starting_board()
+		board['e2'].make_move('e4')
+		board['e7'].make_move('e5')
+		board['g1'].make_move('f3')
+		board['g8'].make_move('f6')
+		board['f1'].make_move('c4')
+		board['f8'].make_move('c5')
+		before = snapshot(board)
+		undo = make_move(board, 'e1', 'g1')
+		self.assertEqual(type(board['f1']), Rook)
+		self.assertEqual(board['h1'], 'empty')
+		unmake_move(board, undo)
+		self.assertEqual(snapshot(board), before)
+		self.assertFalse(board['e1'].has_moved())
+		self.assertFalse(board['h1'].has_moved())
+
+	def test_promotion_flag(self):
+		board = starting_board()
+		for start, end in [('c2', 'c4'), ('a7', 'a5'), ('c4', 'c5'), ('a5', 'a4'), ('c5', 'c6'), ('a4', 'a3'), ('c6', 'b7'), ('a3', 'b2')]:
+			board[start].make_move(end)
+		before = snapshot(board)
+		undo = make_move(board, 'b7', 'a8')
+		self.assertTrue(board['a8'].promoted)
+		unmake_move(board, undo)
+		self.assertEqual(snapshot(board), before)
+
+	def test_stack(self):
+		board = starting_board()
+		before = snapshot(board)
+		history = []
+		for start, end in [('e2', 'e4'), ('d7', 'd5'), ('e4', 'd5'), ('d8', 'd5'), ('b1', 'c3')]:
+			history.append(make_move(board, start, end))
+		while history:
+			unmake_move(board, history.pop())
+		self.assertEqual(snapshot(board), before)
+
+
+@unittest.skipIf(render is None, 'pygame is not installed')
+class TestRender(unittest.TestCase):
+
+	def test_png(self):
+		board = starting_board()
+		image = render.render_png(board, {'e2': render.YELLOW}, 200)
+		self.assertEqual(image[:8], b'\x89PNG\r\n\x1a\n')
+		surface = render.render(board, {'e2': render.YELLOW}, 200)
+		self.assertEqual(surface.get_size(), (200, 200))
+		# the highlight shows around the pawn, and empty squares keep the board colors
+		self.assertEqual(tuple(surface.get_at((102, 152)))[:3], render.YELLOW)
+		self.assertEqual(tuple(surface.get_at((2, 77)))[:3], render.DARK)
+
+	def test_sprites_cached(self):
+		self.assertIs(render.sprites(160), render.sprites(160))
+		self.assertEqual(render.sprites(240).sprite_size, 24)
+
+	def test_batch(self):
+		boards = [starting_board(), from_fen(perft.POSITIONS[1][1])[0]]
+		images = list(render.render_batch(boards * 3, size=120, workers=2, chunksize=2))
+		self.assertEqual(len(images), 6)
+		self.assertEqual(images[0], render.render_png(boards[0], size=120))
+		self.assertEqual(images[1], images[3])
+		self.assertNotEqual(images[0], images[1])
+
+	def test_batch_unpackable(self):
+		# too late in the game, or with too many pieces, to be packed for the workers
+		late, player = from_fen('4k3/8/8/8/8/8/8/R3K3 w Q - 300 200')
+		crowded = starting_board()
+		for location in ('a3', 'b3', 'c3', 'd3'):
+			crowded[location] = Queen('white', location, crowded)
+		boards = [late, crowded, starting_board()]
+		images = list(render.render_batch(boards, size=120, workers=2))
+		self.assertEqual(images, [render.render_png(board, size=120) for board in boards])
+
+
+class TestGameState(unittest.TestCase):
+
+	def test_moves(self):
+		board = starting_board()
+		self.assertEqual(board.state, GameState('white', 15, -1, 0, 1))
+		board['g1'].make_move('f3')
+		self.assertEqual(board.state, GameState('black', 15, -1, 1, 1))
+		board['e7'].make_move('e5')
+		self.assertEqual(board.state, GameState('white', 15, -1, 0, 2))
+		board['h1'].make_move('g1')
+		self.assertEqual(board.state, GameState('black', BLACK_KINGSIDE | BLACK_QUEENSIDE | WHITE_QUEENSIDE, -1, 1, 2))
+		board['e5'].make_move('e4')
+		board['d2'].make_move('d4')
+		self.assertEqual(board.state.en_passant, SQUARES['d3'])
+		self.assertTrue(board['e4'].en_passant_left)
+		self.assertFalse(board['e4'].en_passant_right)
+		self.assertEqual(board['e4'].get_moves(), ['e3', 'd3', 'f3'])
+
+	def test_unmake(self):
+		board, player = from_fen('r3k2r/8/8/8/8/1n6/8/R3K2R b KQkq - 5 20')
+		state = board.state.copy()
+		undo = make_move(board, 'b3', 'd4')
+		unmake_move(board, undo)
+		self.assertEqual(board.state, state)
+		# capturing a rook takes away its castling right
+		make_move(board, 'b3', 'a1')
+		self.assertEqual(board.state, GameState('white', WHITE_KINGSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE, -1, 0, 21))
+		self.assertEqual(board['e1']._castle(), ['g1'])
+		self.assertEqual(state.castling, 15)
+
+	def test_fen(self):
+		board, player = from_fen('4k3/8/8/8/3pP3/8/8/4K3 b - e3 7 31')
+		self.assertEqual(board.state, GameState('black', 0, SQUARES['e3'], 7, 31))
+		board, player = from_fen('4k3/8/8/8/4P3/8/8/4K3 b - e3 0 1')
+		self.assertEqual(board.state.en_passant, -1)
+
+	def test_board_by_hand(self):
+		board = Board()
+		board['e1'] = King('white', 'e1', board)
+		board['h1'] = Rook('white', 'h1', board)
+		board['e8'] = King('black', 'e8', board)
+		self.assertEqual(board.state.castling, WHITE_KINGSIDE)
+		self.assertIn('g1', board['e1'].get_moves())
+		self.assertTrue(board['e1'].valid_move('g1'))
+		self.assertEqual(board.key, zobrist_key(board, 'white'))
+		board['h1'].moved = True
+		self.assertNotIn('g1', board['e1'].get_moves())
+		self.assertEqual(board.key, zobrist_key(board, 'white'))
+
+		board = Board()
+		board['e1'] = King('white', 'e1', board)
+		board['e8'] = King('black', 'e8', board)
+		board['d4'] = Pawn('white', 'd4', board)
+		board['e4'] = Pawn('black', 'e4', board, en_passant_left=True)
+		self.assertTrue(board['e4'].en_passant_left)
+		self.assertEqual(board.state.side, 'black')
+		self.assertEqual(board['e4'].get_moves(), ['e3', 'd3'])
+		self.assertEqual(board.key, zobrist_key(board, 'black'))
+		make_move(board, 'e4', 'd3')
+		self.assertEqual(board['d4'], 'empty')
+		board, player = from_fen('4k3/8/8/8/3pP3/8/8/4K3 b - e3 0 1')
+		board['d4'].en_passant_right = False
+		self.assertEqual(board['d4'].get_moves(), ['d3'])
+		self.assertEqual(board.key, zobrist_key(board, 'black'))
+
+
+class TestPieceTracking(unittest.TestCase):
+
+	def check(self, board):
+		for color in COLORS:
+			self.assertEqual(board.by_color[color], dict((index, piece) for index, piece in enumerate(board.pieces) if piece != 'empty' and piece.color == color))
+			self.assertEqual(board.pieces[board.kings[color]].kind, KING)
+			self.assertEqual(board.pieces[board.kings[color]].color, color)
+
+	def test_starting_board(self):
+		board = starting_board()
+		self.check(board)
+		self.assertEqual(len(board.by_color['white']), 16)
+		self.assertEqual(board['a2'].king_position(), 'e1')
+		self.assertEqual(board['h7'].king_position(), 'e8')
+
+	def test_moves(self):
+		board = starting_board()
+		for start, end in [('e2', 'e4'), ('d7', 'd5'), ('e4', 'd5'), ('e7', 'e6'), ('f1', 'b5'), ('e8', 'e7'), ('g1', 'f3'), ('e6', 'd5'), ('e1', 'g1')]:
+			board[start].make_move(end)
+			self.check(board)
+		self.assertEqual(board.kings, {'white': SQUARES['g1'], 'black': SQUARES['e7']})
+		self.assertEqual(len(board.by_color['black']), 15)
+		undo = make_move(board, 'b5', 'e8')
+		unmake_move(board, undo)
+		self.check(board)
+		self.assertEqual(board['f3'].king_position(), 'g1')
+
+	def test_promotion(self):
+		board, player = from_fen('8/4P1k1/8/8/8/8/8/K7 w - - 0 1')
+		board['e7'].make_move('e8')
+		promote(board, 'Queen', 'white', 'e8')
+		self.check(board)
+		self.assertEqual(type(board.by_color['white'][SQUARES['e8']]), Queen)
+
+
+class TestFen(unittest.TestCase):
+
+	def test_round_trip(self):
+		for name, fen, counts in perft.POSITIONS:
+			board, player = from_fen(fen)
+			self.assertEqual(to_fen(board), fen)
+		board = starting_board()
+		board['e2'].make_move('e4')
+		self.assertEqual(to_fen(board), 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1')
+		for start, end in [('d7', 'd5'), ('e4', 'e5'), ('f7', 'f5')]:
+			board[start].make_move(end)
+		self.assertEqual(to_fen(board), 'rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3')
+
+	def test_flags(self):
+		board, player = from_fen('r3k2r/8/8/3pP3/8/8/8/R3K2R w Kq d6 0 1')
+		self.assertEqual(player, 'white')
+		self.assertFalse(board['e1'].moved)
+		self.assertFalse(board['h1'].moved)
+		self.assertTrue(board['a1'].moved)
+		self.assertTrue(board['h8'].moved)
+		self.assertFalse(board['a8'].moved)
+		self.assertTrue(board['e5'].en_passant_left)
+		self.assertEqual(sorted(board['e1'].get_moves()), ['d1', 'd2', 'e2', 'f1', 'f2', 'g1'])
+
+	def test_invalid(self):
+		for fen in ['rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w KQkq - 0 1', 'rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+				'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQ1BNR w - - 0 1',
+				'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBN1 w KQkq - 0 1', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - e3 0 1',
+				'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - zero 1', 'rnbqkbnx/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - -']:
+			with self.assertRaises(ValueError):
+				from_fen(fen)
+
+	def test_epd(self):
+		board, player, operations = parse_epd('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - bm Rxf4; id "position 3";')
+		self.assertEqual(operations, {'bm': 'Rxf4', 'id': 'position 3'})
+		self.assertEqual(type(board['b4']), Rook)
+		board, player, operations = parse_epd('4k3/8/8/8/8/8/8/4K3 b - - 12 40 ;D1 5 ;D2 25')
+		self.assertEqual((player, board.state.halfmove, board.state.fullmove), ('black', 12, 40))
+		self.assertEqual(operations, {'D1': '5', 'D2': '25'})
+
+	def test_read_epd(self):
+		read = []
+		def lines():
+			for line in ['# positions', perft.POSITIONS[0][1], '', perft.POSITIONS[1][1] + ' ;D1 48', 'not a record']:
+				read.append(line)
+				yield line
+		records = read_epd(lines())
+		board, player, operations = next(records)
+		self.assertEqual(to_fen(board), perft.POSITIONS[0][1])
+		# records are read only as they are used
+		self.assertEqual(len(read), 2)
+		board, player, operations = next(records)
+		self.assertEqual(operations, {'D1': '48'})
+		with self.assertRaisesRegex(ValueError, 'line 5'):
+			next(records)
+
+
+OPERA_GAME = """[Event "Paris"]
+[White "Morphy"]
+[Black "Duke Karl / Count Isouard"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 d6 3. d4 Bg4 {This is a weak move
+already.} 4. dxe5 Bxf3 5. Qxf3 dxe5 6. Bc4 Nf6 7. Qb3 Qe7
+8. Nc3 c6 9. Bg5 b5 10. Nxb5 cxb5 11. Bxb5+ Nbd7 12. O-O-O Rd8
+13. Rxd7 Rxd7 14. Rd1 Qe6 15. Bxd7+ Nxd7 16. Qb8+ Nxb8 17. Rd8# 1-0
+
+"""
+
+
+class TestPgn(unittest.TestCase):
+
+	def test_tokenize(self):
+		tokens = list(pgn.tokenize(['[White "A \\"B\\""]\n', '1. e4 $1 {a comment\n', 'over lines} e5; rest of line\n', '2. Nf3 (2. f4 exf4) 2... Nc6 1/2-1/2\n']))
+		self.assertEqual(tokens, [('tag', ('White', 'A "B"')), ('move', 'e4'), ('move', 'e5'), ('move', 'Nf3'), ('(', None), ('move', 'f4'), ('move', 'exf4'), (')', None), ('move', 'Nc6'), ('result', '1/2-1/2')])
+
+	def test_read_games(self):
+		games = list(pgn.read_games((OPERA_GAME + '[White "B"]\n1. d4 (1. e4 e5) d5 *\n[White "C"]\n1. c4').splitlines()))
+		self.assertEqual([game.number for game in games], [1, 2, 3])
+		self.assertEqual(len(games[0].moves), 33)
+		self.assertEqual(games[0].tags['Black'], 'Duke Karl / Count Isouard')
+		self.assertEqual((games[1].moves, games[1].result), (['d4', 'd5'], '*'))
+		self.assertEqual((games[2].moves, games[2].result), (['c4'], '*'))
+
+	def test_resolve_san(self):
+		board, player = from_fen('r3k2r/1P6/8/8/8/2N3N1/8/R3K2R w KQkq - 0 1')
+		self.assertEqual(pgn.resolve_san(board, player, 'Nge4'), ('g3', 'e4', None))
+		self.assertEqual(pgn.resolve_san(board, player, 'O-O-O'), ('e1', 'c1', None))
+		self.assertEqual(pgn.resolve_san(board, player, 'bxa8=N+'), ('b7', 'a8', 'Knight'))
+		self.assertEqual(pgn.resolve_san(board, player, 'Rxa8'), ('a1', 'a8', None))
+		for san in ['Ne4', 'b8', 'bxa8', 'Nd5=Q', 'Ke3', 'Zz9']:
+			with self.assertRaises(ValueError):
+				pgn.resolve_san(board, player, san)
+
+		board, player = from_fen('4k3/8/8/3p4/8/2P2p2/3N4/R3K2R w K - 0 1')
+		self.assertEqual(pgn.resolve_san(board, player, 'Nxf3'), ('d2', 'f3', None))
+		self.assertEqual(pgn.resolve_san(board, player, 'c4'), ('c3', 'c4', None))
+		self.assertEqual(pgn.resolve_san(board, player, 'O-O'), ('e1', 'g1', None))
+		errors = {
+			'Nxe4': 'x with nothing to capture',
+			'Rxa7': 'x with nothing to capture',
+			'Nf3': 'capture written without x',
+			'Kg1': 'castling is written O-O or O-O-O',
+		}
+		for san, message in errors.items():
+			with self.assertRaisesRegex(ValueError, message):
+				pgn.resolve_san(board, player, san)
+		board, player = from_fen('4k3/8/8/8/3p4/2P5/8/4K3 w - - 0 1')
+		self.assertEqual(pgn.resolve_san(board, player, 'cxd4'), ('c3', 'd4', None))
+		with self.assertRaisesRegex(ValueError, 'no legal move'):
+			pgn.resolve_san(board, player, 'd4')
+		with self.assertRaisesRegex(ValueError, 'without the file'):
+			pgn.resolve_san(board, player, 'xd4')
+
+	def test_replay(self):
+		result = pgn.replay_game(next(pgn.read_games(OPERA_GAME.splitlines())))
+		self.assertEqual((result.error, result.plies, result.ending, result.result), (None, 33, 'checkmate', '1-0'))
+		self.assertEqual(result.fen, '1n1Rkb1r/p4ppp/4q3/4p1B1/4P3/8/PPP2PPP/2K5 b k - 1 17')
+		game = pgn.Game(1, {'FEN': '7k/8/6K1/8/8/8/8/5Q2 w - - 0 1'}, ['Qf7', 'Kh7'], '*')
+		result = pgn.replay_game(game)
+		self.assertEqual((result.plies, result.ending), (1, 'stalemate'))
+		self.assertEqual(result.error, '1... Kh7: no legal move')
+
+	def test_parallel(self):
+		text = (OPERA_GAME + '1. e4 e5 2. Ke3 *\n\n') * 25
+		read = []
+		def lines():
+			for line in text.splitlines():
+				read.append(line)
+				yield line
+		replays = pgn.replay(lines(), workers=2, chunksize=1)
+		first = next(replays)
+		# games are only read as fast as their results are collected
+		self.assertLess(len(read), len(text.splitlines()) // 2)
+		results = [first] + list(replays)
+		self.assertEqual(sorted(result.number for result in results), list(range(1, 51)))
+		self.assertEqual(sum(1 for result in results if result.error), 25)
+		replays = pgn.replay(text.splitlines(), workers=2, chunksize=4)
+		next(replays)
+		replays.close()
+
+
+class TestPacked(unittest.TestCase):
+
+	def assertRoundTrip(self, board, player):
+		data = packed.encode(board)
+		self.assertEqual(len(data), packed.SIZE)
+		copy, copy_player = packed.decode(data)
+		self.assertEqual(copy_player, player)
+		self.assertEqual(to_fen(copy), to_fen(board))
+		self.assertEqual((copy.squares, copy.state, copy.key), (board.squares, board.state, board.key))
+		self.assertEqual(legal_moves(copy, player), legal_moves(board, player))
+		self.assertEqual(packed.encode(copy), data)
+		return data
+
+	def test_round_trip(self):
+		self.assertRoundTrip(starting_board(), 'white')
+		for fen in ['rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3', 'r3k2r/8/8/8/3pP3/8/8/R3K2R b Kq e3 0 40', '8/8/8/8/8/8/8/k6K w - - 99 300']:
+			self.assertRoundTrip(*from_fen(fen))
+		board = starting_board()
+		for start, end in [('e2', 'e4'), ('d7', 'd5'), ('e4', 'e5'), ('f7', 'f5')]:
+			board[start].make_move(end)
+		data = self.assertRoundTrip(board, 'white')
+		self.assertEqual(packed.decode(data)[0].state.en_passant, SQUARES['f6'])
+
+	def test_decode_array(self):
+		boards = []
+		generator = random.Random(7)
+		board = starting_board()
+		player = 'white'
+		for ply in range(60):
+			boards.append((board.squares[:], board.state.copy(), packed.encode(board)))
+			moves = sorted(generate_legal_moves(board, player))
+			if not moves:
+				break
+			start, end = generator.choice(moves)
+			make_move(board, start, end)
+			player = opponent(player)
+		data = b''.join(data for squares, state, data in boards)
+		arrays = packed.decode_array(data)
+		python = packed._decode_array_python(data, len(boards))
+		for index, (squares, state, data) in enumerate(boards):
+			for values in (arrays, python):
+				self.assertEqual(list(values['squares'][index]), squares)
+				self.assertEqual(values['side'][index], 0 if state.side == 'white' else 1)
+				self.assertEqual((values['castling'][index], values['en_passant'][index]), (state.castling, state.en_passant))
+				self.assertEqual((values['halfmove'][index], values['fullmove'][index]), (state.halfmove, state.fullmove))
+
+	def test_invalid(self):
+		with self.assertRaises(ValueError):
+			packed.decode(packed.encode(starting_board())[:-1])
+		with self.assertRaises(ValueError):
+			packed.decode_array(b'\0' * (packed.SIZE + 1))
+		board = starting_board()
+		board.state.halfmove = 256
+		with self.assertRaises(ValueError):
+			packed.encode(board)
+
+	def test_castling_rook_color(self):
+		# a record claiming white may castle kingside with a black rook on h1
+		board, player = from_fen('4k3/8/8/8/8/8/8/4K2r w - - 0 1')
+		data = bytearray(packed.encode(board))
+		data[24] |= WHITE_KINGSIDE
+		board, player = packed.decode(bytes(data))
+		self.assertEqual(board.state.castling, 0)
+		self.assertTrue(board['e1'].moved)
+		self.assertNotIn('g1', board['e1'].get_moves())
+
+
+class TestMoveCache(unittest.TestCase):
+
+	def test_lookup(self):
+		cache = MoveCache()
+		board = starting_board()
+		moves, status = cache.lookup(board, 'white')
+		self.assertEqual((set(moves), status), (set(generate_legal_moves(board, 'white')), None))
+		self.assertIs(cache.legal_moves(board, 'white'), moves)
+		self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+		undo = make_move(board, 'e2', 'e4')
+		self.assertEqual(set(cache.legal_moves(board, 'black')), set(generate_legal_moves(board, 'black')))
+		self.assertEqual(cache.misses, 2)
+		unmake_move(board, undo)
+		self.assertIs(cache.legal_moves(board, 'white'), moves)
+		self.assertEqual(cache.stats()['hits'], 2)
+
+	def test_promote_and_status(self):
+		cache = MoveCache()
+		board, player = from_fen('7k/P7/8/8/8/8/8/K7 w - - 0 1')
+		make_move(board, 'a7', 'a8')
+		promote(board, 'Queen', 'white', 'a8')
+		self.assertEqual(cache.status(board, 'black'), 'check')
+		self.assertEqual(set(cache.legal_moves(board, 'black')), set([('h8', 'h7'), ('h8', 'g7')]))
+		board, player = from_fen('7k/P7/8/8/8/8/8/K7 w - - 0 1')
+		make_move(board, 'a7', 'a8')
+		promote(board, 'Rook', 'white', 'a8')
+		self.assertEqual(cache.status(board, 'black'), 'check')
+		self.assertEqual(cache.misses, 3)
+		# the status alone is found without listing the moves
+		self.assertIsNone(cache.entries[(board.key, 'black')][0])
+		self.assertEqual(cache.status(from_fen('7k/5Q2/6K1/8/8/8/8/8 b - - 0 1')[0], 'black'), 'stalemate')
+		self.assertEqual(cache.status(from_fen('7k/6Q1/6K1/8/8/8/8/8 b - - 0 1')[0], 'black'), 'checkmate')
+		self.assertTrue(can_move('white', starting_board()))
+
+	def test_eviction(self):
+		cache = MoveCache(max_bytes=3000)
+		board = starting_board()
+		first = cache.legal_moves(board, 'white')
+		undo = make_move(board, 'e2', 'e4')
+		cache.legal_moves(board, 'black')
+		unmake_move(board, undo)
+		make_move(board, 'd2', 'd4')
+		cache.legal_moves(board, 'black')
+		self.assertLessEqual(cache.bytes, 3000)
+		self.assertEqual((len(cache.entries), cache.evictions), (1, 2))
+		unmake_move(board, undo)
+		self.assertIsNot(cache.legal_moves(starting_board(), 'white'), first)
+		cache.clear()
+		self.assertEqual(cache.stats(), {'entries': 0, 'bytes': 0, 'max_bytes': 3000, 'hits': 0, 'misses': 0, 'evictions': 0})
+
+
+class TestInstrument(unittest.TestCase):
+
+	def test_counts(self):
+		original = Pawn.get_moves
+		board = starting_board()
+		MOVE_CACHE.clear()
+		with instrument.Profiler() as profiler:
+			self.assertIsNot(Pawn.get_moves, original)
+			generate_legal_moves(board, 'white')
+			can_move('white', board)
+			board['e2'].valid_move('e4')
+			with self.assertRaises(RuntimeError):
+				instrument.Profiler().enable()
+		self.assertIs(Pawn.get_moves, original)
+		self.assertNotIn('valid_move', Pawn.__dict__)
+		self.assertIs(can_move, utils.can_move)
+		self.assertEqual(can_move.__name__, 'can_move')
+		report = profiler.report()
+		# by generate_legal_moves; can_move stops at the first legal move, found with iter_moves
+		self.assertEqual(report['functions']['Pawn.get_moves']['calls'], 8)
+		self.assertEqual(report['functions']['Knight.get_moves']['calls'], 2)
+		self.assertEqual(report['functions']['can_move']['calls'], 1)
+		self.assertEqual(report['functions']['Piece.valid_move']['calls'], 1)
+		self.assertNotIn('display_board', report['functions'])
+		self.assertIn('Pawn.get_moves', profiler.format_report())
+
+		profiler.reset()
+		with profiler:
+			board['d2'].get_moves()
+		self.assertEqual(profiler.report()['functions']['Pawn.get_moves']['calls'], 1)
+		self.assertEqual(list(profiler.report()['functions']), ['Pawn.get_moves'])
+
+	def test_recursion(self):
+		for memory in (False, True):
+			with instrument.Profiler([('copy', 'deepcopy')], memory) as profiler:
+				copy.deepcopy(starting_board())
+			self.assertEqual(profiler.report()['functions']['deepcopy']['calls'], 1)
+
+	def test_memory(self):
+		with instrument.Profiler([('pieces', 'Queen.get_moves'), ('utils', 'generate_legal_moves')], memory=True) as profiler:
+			board, player = from_fen('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1')
+			generate_legal_moves(board, player)
+		functions = profiler.report()['functions']
+		self.assertGreater(functions['Queen.get_moves']['bytes'], 0)
+		self.assertGreaterEqual(functions['generate_legal_moves']['bytes'], functions['Queen.get_moves']['bytes'])
+
+
+class TestBench(unittest.TestCase):
+
+	def test_measure(self):
+		calls = []
+		result = bench.measure(lambda: calls.append(1), repeats=5, warmup=2, min_time=0.0001)
+		# calibrating takes 1 + 2 + ... + number calls, then every repeat, warmup included, takes number calls
+		self.assertEqual(len(calls), 2 * result['number'] - 1 + 7 * result['number'])
+		self.assertEqual(result['repeats'], 5)
+		self.assertLessEqual(result['min_us'], result['median_us'])
+		self.assertLessEqual(result['median_us'], result['p95_us'])
+
+	def test_run_and_compare(self):
+		results = bench.run('endgame/', repeats=2, warmup=0, min_time=0.0001, display=False)
+		self.assertEqual(set(results['benchmarks']), set(['endgame/Pawn.get_moves', 'endgame/Rook.get_moves', 'endgame/King.get_moves', 'endgame/valid_move', 'endgame/King.check', 'endgame/can_move', 'endgame/can_move cached']))
+		baseline = {'benchmarks': {name: dict(result) for name, result in results['benchmarks'].items()}}
+		baseline['benchmarks']['endgame/King.check']['median_us'] = results['benchmarks']['endgame/King.check']['median_us'] / 2
+		del baseline['benchmarks']['endgame/valid_move']
+		rows = bench.compare(results, baseline, 0.5)
+		self.assertEqual(len(rows), 6)
+		self.assertEqual([row[0] for row in rows if row[4]], ['endgame/King.check'])
+
+	@unittest.skipIf(render is None, 'pygame is not installed')
+	def test_display(self):
+		import chess
+		screen = chess.screen
+		results = bench.run('endgame/display_board', repeats=1, warmup=0, min_time=0.0001)
+		self.assertEqual(list(results['benchmarks']), ['endgame/display_board'])
+		self.assertIs(chess.screen, screen)
+
+
+def mirror(fen):
+	"""Return the FEN record of the position with the board flipped and the colors swapped."""
+	rows, player, castling, en_passant = fen.split()[:4]
+	rows = '/'.join(reversed(rows.swapcase().split('/')))
+	castling = ''.join(sorted(castling.swapcase())) if castling != '-' else '-'
+	en_passant = en_passant[0] + str(9 - int(en_passant[1])) if en_passant != '-' else '-'
+	return ' '.join([rows, 'b' if player == 'w' else 'w', castling, en_passant])
+
+
+class TestEvaluation(unittest.TestCase):
+
+	def test_symmetry(self):
+		self.assertEqual(evaluation.evaluate(starting_board(), 'white'), 0)
+		for name, fen, counts in perft.POSITIONS:
+			board, player = from_fen(fen)
+			flipped, flipped_player = from_fen(mirror(fen))
+			self.assertEqual(evaluation.evaluate(flipped, flipped_player), evaluation.evaluate(board, player))
+			self.assertEqual(evaluation.evaluate(board, 'white'), -evaluation.evaluate(board, 'black'))
+
+	def test_incremental(self):
+		for seed in range(3):
+			generator = random.Random(seed)
+			board = starting_board()
+			player = 'white'
+			for ply in range(120):
+				self.assertTrue(evaluation.verify(board))
+				moves = sorted(generate_legal_moves(board, player))
+				if not moves:
+					break
+				start, end = generator.choice(moves)
+				scores = (board.middlegame, board.endgame, board.phase, board.pawn_key)
+				undo = make_move(board, start, end)
+				unmake_move(board, undo)
+				self.assertEqual((board.middlegame, board.endgame, board.phase, board.pawn_key), scores)
+				make_move(board, start, end)
+				if type(board[end]) == Pawn and board[end].promoted:
+					promote(board, generator.choice(['Queen', 'Rook', 'Bishop', 'Knight']), player, end)
+				player = opponent(player)
+
+	def test_terms(self):
+		board, player = from_fen('4k3/8/8/8/8/8/8/4K3 w - - 0 1')
+		self.assertEqual((board.phase, evaluation.pawn_structure(board)), (0, (0, 0)))
+		board['e1'].make_move('d1')
+		self.assertTrue(evaluation.verify(board))
+		# a passed pawn on the fifth row, isolated, and doubled black pawns, one of them isolated too
+		board, player = from_fen('4k3/8/8/3P4/8/6p1/6p1/4K3 w - - 0 1')
+		middlegame, endgame = evaluation.pawn_structure(board)
+		passed = evaluation.PASSED_PAWN
+		self.assertEqual(middlegame, passed[3][0] + evaluation.ISOLATED_PAWN[0] - (evaluation.DOUBLED_PAWN[0] + 2 * evaluation.ISOLATED_PAWN[0] + passed[4][0] + passed[5][0]))
+		self.assertEqual(endgame, passed[3][1] + evaluation.ISOLATED_PAWN[1] - (evaluation.DOUBLED_PAWN[1] + 2 * evaluation.ISOLATED_PAWN[1] + passed[4][1] + passed[5][1]))
+		sheltered = from_fen('r4rk1/5ppp/8/8/8/8/5PPP/R4RK1 w - - 0 1')[0]
+		exposed = from_fen('r4rk1/5ppp/8/8/8/8/PPP5/R4RK1 w - - 0 1')[0]
+		self.assertGreater(evaluation.king_safety(sheltered), evaluation.king_safety(exposed))
+		self.assertIs(search.evaluate, evaluation.evaluate)
+
+
+@unittest.skipIf(batch is None, 'numpy is not installed')
+class TestBatch(unittest.TestCase):
+
+	def positions(self):
+		"""Return (board, player) pairs from the perft positions and a few random games."""
+		positions = [from_fen(fen) for name, fen, counts in perft.POSITIONS]
+		generator = random.Random(11)
+		for game in range(4):
+			board = starting_board()
+			player = 'white'
+			for ply in range(generator.randrange(40, 120)):
+				moves = sorted(generate_legal_moves(board, player))
+				if not moves:
+					break
+				start, end = generator.choice(moves)
+				make_move(board, start, end)
+				if type(board[end]) == Pawn and board[end].promoted:
+					promote(board, 'Queen', player, end)
+				player = opponent(player)
+				if ply % 10 == 0:
+					positions.append(from_fen(to_fen(board)))
+		return positions
+
+	def test_evaluate(self):
+		positions = self.positions()
+		array = batch.to_array(board for board, player in positions)
+		self.assertEqual((array.shape, array.dtype), ((len(positions), 64), batch.numpy.int8))
+		side = [0 if player == 'white' else 1 for board, player in positions]
+		expected = [evaluation.evaluate(board, player) for board, player in positions]
+		self.assertEqual(list(batch.evaluate(array, side)), expected)
+		self.assertEqual(list(batch.evaluate(batch.to_planes(array), side)), expected)
+		data = b''.join(packed.encode(board) for board, player in positions)
+		arrays = packed.decode_array(data)
+		self.assertEqual(list(batch.evaluate(arrays['squares'], arrays['side'])), expected)
+
+	def test_features(self):
+		positions = self.positions()
+		values = batch.features(batch.to_array(board for board, player in positions))
+		for index, (board, player) in enumerate(positions):
+			self.assertEqual((values['middlegame'][index], values['endgame'][index], values['phase'][index]), evaluation.piece_scores(board))
+			self.assertEqual((values['pawn_middlegame'][index], values['pawn_endgame'][index]), evaluation.pawn_structure(board))
+			self.assertEqual(values['king_shelter'][index] + values['king_attackers'][index], evaluation.king_safety(board))
+			for column, color in enumerate(['white', 'black']):
+				pieces = board.by_color[color].values()
+				mobility = sum(len(piece.standard_moves() if piece.kind == KING else piece.get_moves()) for piece in pieces if piece.kind != PAWN)
+				self.assertEqual(values['mobility'][index][column], mobility)
+				self.assertEqual(values['counts'][index][6 * column], len([piece for piece in pieces if piece.kind == PAWN]))
+
+		board, player = from_fen('4k3/8/8/3P4/8/6p1/6p1/4K3 w - - 0 1')
+		values = batch.features(batch.to_array([board]))
+		self.assertEqual((list(values['doubled'][0]), list(values['isolated'][0]), list(values['passed'][0])), ([0, 1], [1, 2], [1, 2]))
+
+	def test_planes(self):
+		array = batch.to_array([starting_board()])
+		planes = batch.to_planes(array)
+		self.assertEqual(planes.shape, (1, 12, 8, 8))
+		self.assertEqual(list(planes[0, 0, 1]), [1] * 8)
+		self.assertEqual(planes[0, 11, 7, 4], 1)
+		self.assertTrue((batch.from_planes(planes) == array).all())
+		with self.assertRaises(ValueError):
+			batch.evaluate(array.reshape(1, 8, 8))
+
+
+class TestImports(unittest.TestCase):
+
+	def loaded(self, statement):
+		"""Return the names of the modules loaded by running statement in a new interpreter."""
+		output = subprocess.run([sys.executable, '-c', statement + '; import sys; print(" ".join(sys.modules))'], capture_output=True, text=True, check=True).stdout
+		return output.split()
+
+	def test_engine_without_pygame(self):
+		modules = self.loaded('import pieces, utils, perft, search, bitboard, packed, instrument, evaluation')
+		self.assertNotIn('pygame', modules)
+		self.assertNotIn('numpy', modules)
+
+	@unittest.skipIf(render is None, 'pygame is not installed')
+	def test_game_import(self):
+		# pygame is only loaded, and the window only opened, when main() runs
+		modules = self.loaded('import chess; assert chess.screen is None')
+		self.assertIn('chess', modules)
+		self.assertNotIn('pygame.display', modules)
+
+
 if __name__ == '__main__':
 	unittest.main()
@@ -1,4 +1,9 @@
 from pieces import *
+from collections import OrderedDict
+import sys
+
+
+PROMOTION_LETTERS = {'Queen': 'q', 'Rook': 'r', 'Bishop': 'b', 'Knight': 'n'}
 
 
 def opponent(player):
@@ -10,6 +15,9 @@ def can_move(player, board):
 	"""
 	Return if player has a valid move it can make.
 
+	The answer is the status of the position in MOVE_CACHE, so asking again about a position already seen costs a dict
+	lookup, and a position not seen before is only searched up to its first legal move.
+
 	Args:
 		player: 'white' or 'black'.
 		board: chessboard.
@@ -17,20 +25,356 @@ def can_move(player, board):
 	Returns:
 		A boolean representing if there is a valid move player can make in the input board.
 	"""
-	pieces = [piece for piece in board.values() if piece != 'empty' and piece.color == player]
-	for piece in pieces:
-		for move in piece.get_moves():
-			if piece.valid_move(move):
-				return True
+	return MOVE_CACHE.status(board, player) not in ('checkmate', 'stalemate')
+
+
+def _checks_and_pins(board, king, player):
+	"""
+	Find the pieces checking and pinned against player's king.
+
+	Args:
+		board: chessboard.
+		king: square number of player's king.
+		player: 'white' or 'black'.
+
+	Returns:
+		A (checkers, block, pins) tuple: the square numbers of the opponent pieces giving check, the set of square numbers a
+		piece may move to in order to capture or block a single checker, and a dict from the square number of each pinned
+		piece to the set of square numbers it may move to without leaving the line of its pin.
+	"""
+	squares = board.squares
+	color = COLORS[player]
+	enemy = color ^ BLACK
+	checkers = []
+	block = set()
+	pins = {}
+
+	for target in PAWN_CAPTURES[player][king]:
+		if target != -1 and squares[target] == PAWN | enemy:
+			checkers.append(target)
+			block.add(target)
+	for target in KNIGHT_TARGETS[king]:
+		if squares[target] == KNIGHT | enemy:
+			checkers.append(target)
+			block.add(target)
+
+	for offset in ROOK_OFFSETS + BISHOP_OFFSETS:
+		slider = ROOK | enemy if offset in ROOK_OFFSETS else BISHOP | enemy
+		ray = RAYS[offset][king]
+		pinned = -1
+		for distance, target in enumerate(ray):
+			code = squares[target]
+			if code == EMPTY:
+				continue
+			if code & BLACK == color:
+				if pinned != -1:
+					break
+				pinned = target
+				continue
+			if code == slider or code == QUEEN | enemy:
+				if pinned == -1:
+					checkers.append(target)
+					block.update(ray[:distance + 1])
+				else:
+					pins[pinned] = set(ray[:distance + 1])
+			break
+	return checkers, block, pins
+
+
+def _en_passant_safe(board, start, end, king, player):
+	"""Return if the en passant capture from start to end leaves player's king, on square number king, out of check."""
+	squares = board.squares
+	captured = start - start % 8 + end % 8
+	pawn = squares[start]
+	taken = squares[captured]
+	squares[start] = EMPTY
+	squares[captured] = EMPTY
+	squares[end] = pawn
+	safe = not is_square_attacked(board, king, opponent(player))
+	squares[end] = EMPTY
+	squares[captured] = taken
+	squares[start] = pawn
+	return safe
+
+
+# the squares each kind of piece besides pawns and kings reaches, as rays or single steps
+_CAPTURE_RAYS = {ROOK: ROOK_RAYS, BISHOP: BISHOP_RAYS, QUEEN: QUEEN_RAYS}
+
+
+def _capture_moves(board, start, kind, player):
+	"""
+	Return the locations the piece of kind on square number start may capture on or promote on, ignoring pins and checks.
+
+	Only the first piece along each ray is looked at, so this is cheaper than listing the piece's moves and filtering them.
+	"""
+	squares = board.squares
+	enemy = BLACK if player == 'white' else WHITE
+	moves = []
+	if kind == PAWN:
+		forward = PAWN_ADVANCES[player][start][0]
+		if forward != -1 and squares[forward] == EMPTY and not 8 <= forward < 56:
+			moves.append(NAMES[forward])
+		state = board.state
+		en_passant = state.en_passant if state.side == player else -1
+		for diagonal in PAWN_CAPTURES[player][start]:
+			if diagonal != -1 and ((squares[diagonal] != EMPTY and squares[diagonal] & BLACK == enemy) or diagonal == en_passant):
+				moves.append(NAMES[diagonal])
+	elif kind == KNIGHT:
+		for target in KNIGHT_TARGETS[start]:
+			if squares[target] != EMPTY and squares[target] & BLACK == enemy:
+				moves.append(NAMES[target])
+	else:
+		for ray in _CAPTURE_RAYS[kind][start]:
+			for target in ray:
+				if squares[target] != EMPTY:
+					if squares[target] & BLACK == enemy:
+						moves.append(NAMES[target])
+					break
+	return moves
+
+
+def generate_legal_moves(board, player, captures_only=False):
+	"""
+	Return all legal moves player can make.
+
+	The pieces giving check and the pinned pieces are found once for the position, so moves are never tried out on the
+	board, apart from en passant captures, which can uncover a check along the row of the two pawns.
+
+	Args:
+		board: chessboard.
+		player: 'white' or 'black'.
+		captures_only: whether to leave out every move that neither captures nor promotes a pawn, castling included,
+			without testing if they are legal.
+
+	Returns:
+		A list of (start, end) location pairs. A pawn move to the last row is listed once; its new piece is chosen with promote.
+	"""
+	squares = board.squares
+	color = COLORS[player]
+	king = board.kings[player]
+	checkers, block, pins = _checks_and_pins(board, king, player)
+
+	moves = []
+	king_piece = board.pieces[king]
+	squares[king] = EMPTY
+	for end in king_piece.standard_moves():
+		if captures_only and squares[SQUARES[end]] == EMPTY:
+			continue
+		if not is_square_attacked(board, SQUARES[end], opponent(player)):
+			moves.append((king_piece.location, end))
+	squares[king] = KING | color
+	if len(checkers) > 1:
+		return moves
+	if not checkers and not captures_only:
+		for end in king_piece._castle():
+			moves.append((king_piece.location, end))
+
+	for start, piece in board.by_color[player].items():
+		if start == king:
+			continue
+		pin = pins.get(start)
+		for move in _capture_moves(board, start, piece.kind, player) if captures_only else piece.get_moves():
+			end = SQUARES[move]
+			if piece.kind == PAWN and squares[end] == EMPTY and (end - start) % 8 != 0:
+				if _en_passant_safe(board, start, end, king, player):
+					moves.append((piece.location, move))
+			elif (pin is None or end in pin) and (not checkers or end in block):
+				moves.append((piece.location, move))
+	return moves
+
+
+def iter_legal_moves(board, player):
+	"""
+	Yield the legal moves player can make one at a time, cheapest to test first.
+
+	King moves need no pin or block test, and come first. The captures of all the other pieces come next, and their
+	quiet moves last, walking each piece's moves lazily a second time, so that a caller that stops early never lists
+	the rest; listing every move this way costs more than generate_legal_moves. board must not be changed while the
+	moves are being yielded.
+
+	Args:
+		board: chessboard.
+		player: 'white' or 'black'.
+
+	Yields:
+		(start, end) location pairs, as generate_legal_moves returns them.
+	"""
+	squares = board.squares
+	king = board.kings[player]
+	code = squares[king]
+	checkers, block, pins = _checks_and_pins(board, king, player)
+
+	king_piece = board.pieces[king]
+	for end in king_piece.iter_standard_moves():
+		squares[king] = EMPTY
+		safe = not is_square_attacked(board, SQUARES[end], opponent(player))
+		squares[king] = code
+		if safe:
+			yield (king_piece.location, end)
+	if len(checkers) > 1:
+		return
+	if not checkers:
+		for end in king_piece._castle():
+			yield (king_piece.location, end)
+
+	pieces = [(start, piece) for start, piece in board.by_color[player].items() if start != king]
+	# captures of every piece first, then the quiet moves
+	for captures in (True, False):
+		for start, piece in pieces:
+			pin = pins.get(start)
+			for move in piece.iter_moves():
+				end = SQUARES[move]
+				if squares[end] != EMPTY:
+					if not captures:
+						continue
+				elif piece.kind == PAWN and (end - start) % 8 != 0:
+					if captures and _en_passant_safe(board, start, end, king, player):
+						yield (piece.location, move)
+					continue
+				elif captures:
+					continue
+				if (pin is None or end in pin) and (not checkers or end in block):
+					yield (piece.location, move)
+
+
+def has_legal_move(board, player):
+	"""
+	Return if player has a legal move, stopping at the first one found.
+
+	Args:
+		board: chessboard.
+		player: 'white' or 'black'.
+
+	Returns:
+		A boolean representing if player can move; False means checkmate or stalemate.
+	"""
+	for move in iter_legal_moves(board, player):
+		return True
 	return False
 
 
+class MoveCache:
+	"""
+	Least recently used cache of the legal moves and status of positions, keyed by Zobrist key and player to move.
+
+	Positions are told apart by board.key, which make_move, promote, placing pieces on the board and setting their
+	moved and en passant flags keep up to date, so moving a piece changes the key instead of needing to invalidate
+	entries. A board whose state is changed directly must have its key set again with rehash before it is looked up.
+
+	The moves and the status of a position are found separately, when first asked for, so that asking only for the
+	status stops at the first legal move instead of listing them all.
+	"""
+
+	# estimated bytes of an entry besides its moves: the key tuple, the entry list and the dict slot
+	ENTRY_BYTES = 200
+	# status of an entry whose status has not been found yet
+	UNKNOWN = 'unknown'
+
+	def __init__(self, max_bytes=1 << 22):
+		"""
+		max_bytes: estimated memory the entries may take before the least recently used ones are evicted.
+		"""
+		self.max_bytes = max_bytes
+		self.entries = OrderedDict()
+		self.bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def _entry(self, board, player):
+		"""Return the [moves, status, size] entry of player in board, adding one with neither found if there is none."""
+		key = (board.key, player)
+		entry = self.entries.get(key)
+		if entry is None:
+			entry = self.entries[key] = [None, self.UNKNOWN, self.ENTRY_BYTES]
+			self._grow(self.ENTRY_BYTES)
+		else:
+			self.entries.move_to_end(key)
+		return entry
+
+	def _grow(self, size):
+		"""(Mutating) Add size to the estimated bytes, evicting the least recently used entries while there are too many."""
+		self.bytes += size
+		while self.bytes > self.max_bytes and len(self.entries) > 1:
+			self.bytes -= self.entries.popitem(last=False)[1][2]
+			self.evictions += 1
+
+	def _moves(self, entry, board, player):
+		"""Return the legal moves of entry, finding them if they have not been, and counting the hit or miss."""
+		if entry[0] is not None:
+			self.hits += 1
+			return entry[0]
+		self.misses += 1
+		moves = entry[0] = tuple(generate_legal_moves(board, player))
+		size = sys.getsizeof(moves) + len(moves) * sys.getsizeof(('e2', 'e4'))
+		entry[2] += size
+		self._grow(size)
+		return moves
+
+	def _status(self, entry, board, player):
+		"""Return the status of entry, finding it if it has not been, from its moves if they have been found."""
+		if entry[1] == self.UNKNOWN:
+			moves = len(entry[0]) > 0 if entry[0] is not None else has_legal_move(board, player)
+			check = is_square_attacked(board, board.kings[player], opponent(player))
+			if moves:
+				entry[1] = 'check' if check else None
+			else:
+				entry[1] = 'checkmate' if check else 'stalemate'
+		return entry[1]
+
+	def lookup(self, board, player):
+		"""
+		Return the legal moves and status of player in board, finding them only if the position is not cached.
+
+		Args:
+			board: chessboard.
+			player: 'white' or 'black'.
+
+		Returns:
+			A (moves, status) tuple: a tuple of (start, end) location pairs, as generate_legal_moves returns them, and
+			'checkmate', 'stalemate', 'check', or None if player is not in check and can move.
+		"""
+		entry = self._entry(board, player)
+		moves = self._moves(entry, board, player)
+		return moves, self._status(entry, board, player)
+
+	def legal_moves(self, board, player):
+		"""Return the legal moves of player in board, a tuple of (start, end) location pairs."""
+		return self._moves(self._entry(board, player), board, player)
+
+	def status(self, board, player):
+		"""
+		Return 'checkmate', 'stalemate', 'check', or None for player in board.
+
+		If the legal moves of the position are not cached, has_legal_move finds if player can move without listing them.
+		"""
+		entry = self._entry(board, player)
+		if entry[1] != self.UNKNOWN:
+			self.hits += 1
+			return entry[1]
+		self.misses += 1
+		return self._status(entry, board, player)
+
+	def clear(self):
+		"""Remove all entries and reset the counters."""
+		self.entries.clear()
+		self.bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def stats(self):
+		"""Return a dict of the number of entries, their estimated bytes, and the hit, miss and eviction counts."""
+		return {'entries': len(self.entries), 'bytes': self.bytes, 'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+# the cache shared by can_move and the game's display
+MOVE_CACHE = MoveCache()
+
+
 def starting_board():
 	"""Return chessboard with all pieces in their starting positions."""
-	board = {}
-	for column in range(ord('a'), ord('h') + 1):
-		for row in range(1, 9):
-			board[chr(column) + str(row)] = 'empty'
+	board = Board()
 	board['a1'] = Rook('white', 'a1', board)
 	board['b1'] = Knight('white', 'b1', board)
 	board['c1'] = Bishop('white', 'c1', board)
@@ -51,9 +395,219 @@ def starting_board():
 	board['f8'] = Bishop('black', 'f8', board)
 	board['g8'] = Knight('black', 'g8', board)
 	board['h8'] = Rook('black', 'h8', board)
+	rehash(board, 'white')
 	return board
 
 
+def apply_castling(board, rights):
+	"""
+	(Mutating) Give board the castling rights in rights, by clearing the moved flags of their King and Rook.
+
+	Used when setting up a position whose Kings and Rooks were all placed as having moved. A right is only given if its
+	King and Rook, of the color the right belongs to, stand on their starting squares.
+
+	Args:
+		board: chessboard.
+		rights: castling rights, a combination of the castling rights bits.
+
+	Returns:
+		The rights that were not given, for want of their King or Rook.
+	"""
+	missing = 0
+	for right, king, rook, color in CASTLING_SQUARES:
+		if rights & right:
+			if type(board[king]) == King and board[king].color == color and type(board[rook]) == Rook and board[rook].color == color:
+				board[king].moved = False
+				board[rook].moved = False
+			else:
+				missing |= right
+	return missing
+
+
+FEN_PIECES = {'p': Pawn, 'n': Knight, 'b': Bishop, 'r': Rook, 'q': Queen, 'k': King}
+FEN_LETTERS = {Pawn: 'p', Knight: 'n', Bishop: 'b', Rook: 'r', Queen: 'q', King: 'k'}
+# (FEN castling letter, castling right, king location, rook location, color)
+FEN_CASTLING = (
+	('K', WHITE_KINGSIDE, 'e1', 'h1', 'white'),
+	('Q', WHITE_QUEENSIDE, 'e1', 'a1', 'white'),
+	('k', BLACK_KINGSIDE, 'e8', 'h8', 'black'),
+	('q', BLACK_QUEENSIDE, 'e8', 'a8', 'black'),
+)
+
+
+def from_fen(fen):
+	"""
+	Return the chessboard described by a FEN record.
+
+	The King and Rook moved flags are set from the castling rights, and the en passant square is kept only if a pawn of
+	the player to move can capture on it.
+
+	Args:
+		fen: FEN record, such as 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1'. The move clocks may be left out.
+
+	Returns:
+		A (board, player) tuple, where player is 'white' or 'black', the player to move.
+
+	Raises:
+		ValueError: if fen is not a valid FEN record.
+	"""
+	fields = fen.split()
+	if len(fields) not in (2, 4, 6):
+		raise ValueError('FEN record needs 2, 4 or 6 fields: ' + repr(fen))
+	castling = fields[2] if len(fields) > 2 else '-'
+	en_passant = fields[3] if len(fields) > 3 else '-'
+
+	board = Board()
+	rows = fields[0].split('/')
+	if len(rows) != 8:
+		raise ValueError('FEN record needs 8 rows: ' + repr(fen))
+	for row, rank in zip(rows, '87654321'):
+		column = 0
+		for letter in row:
+			if letter in '12345678':
+				column += int(letter)
+				continue
+			if letter.lower() not in FEN_PIECES or column > 7:
+				raise ValueError('bad FEN row ' + repr(row) + ': ' + repr(fen))
+			if letter.lower() == 'p' and rank in '18':
+				raise ValueError('pawn on the first or last row: ' + repr(fen))
+			location = FILES[column] + rank
+			color = 'white' if letter.isupper() else 'black'
+			if letter.lower() in 'rk':
+				board[location] = FEN_PIECES[letter.lower()](color, location, board, True)
+			else:
+				board[location] = FEN_PIECES[letter.lower()](color, location, board)
+			column += 1
+		if column != 8:
+			raise ValueError('bad FEN row ' + repr(row) + ': ' + repr(fen))
+	for color in COLORS:
+		if len([piece for piece in board.by_color[color].values() if piece.kind == KING]) != 1:
+			raise ValueError('FEN record needs one ' + color + ' king: ' + repr(fen))
+
+	if fields[1] not in ('w', 'b'):
+		raise ValueError('bad FEN player to move ' + repr(fields[1]) + ': ' + repr(fen))
+	player = 'white' if fields[1] == 'w' else 'black'
+
+	if castling != '-' and (not castling or any(letter not in 'KQkq' or castling.count(letter) > 1 for letter in castling)):
+		raise ValueError('bad FEN castling rights ' + repr(castling) + ': ' + repr(fen))
+	missing = apply_castling(board, sum(right for letter, right, king, rook, color in FEN_CASTLING if letter in castling))
+	for letter, right, king, rook, color in FEN_CASTLING:
+		if missing & right:
+			raise ValueError('castling right ' + letter + ' without its king and rook: ' + repr(fen))
+
+	if en_passant != '-':
+		if en_passant not in SQUARES or en_passant[1] != ('6' if player == 'white' else '3'):
+			raise ValueError('bad FEN en passant square ' + repr(en_passant) + ': ' + repr(fen))
+		advanced = en_passant[0] + ('5' if player == 'white' else '4')
+		if type(board[advanced]) != Pawn or board[advanced].color == player:
+			raise ValueError('en passant square ' + en_passant + ' without the pawn that passed it: ' + repr(fen))
+		board.state.en_passant = en_passant_square(board, advanced, player)
+	if len(fields) > 5:
+		if not fields[4].isdigit() or not fields[5].isdigit():
+			raise ValueError('bad FEN move clocks: ' + repr(fen))
+		board.state.halfmove = int(fields[4])
+		board.state.fullmove = int(fields[5])
+	rehash(board, player)
+	return board, player
+
+
+def to_fen(board):
+	"""
+	Return the FEN record of board, with the player to move, castling rights, en passant square and clocks of its state.
+
+	The en passant square is only written when a pawn can capture on it, so it may differ from the record board was
+	read from, which by convention gives it after every two square pawn advance.
+	"""
+	rows = []
+	for rank in '87654321':
+		row = ''
+		empty = 0
+		for file in FILES:
+			piece = board[file + rank]
+			if piece == 'empty':
+				empty += 1
+				continue
+			if empty:
+				row += str(empty)
+				empty = 0
+			letter = FEN_LETTERS[type(piece)]
+			row += letter.upper() if piece.color == 'white' else letter
+		rows.append(row + (str(empty) if empty else ''))
+	state = board.state
+	castling = ''.join(letter for letter, right, king, rook, color in FEN_CASTLING if state.castling & right) or '-'
+	en_passant = NAMES[state.en_passant] if state.en_passant != -1 else '-'
+	return ' '.join(['/'.join(rows), state.side[0], castling, en_passant, str(state.halfmove), str(state.fullmove)])
+
+
+def parse_epd(line):
+	"""
+	Return the position and operations of one EPD record.
+
+	The record is the first four fields of a FEN record, optionally followed by the two move clocks, then operations
+	ending in semicolons, such as 'bm Nf3; id "test 1";' or, in perft suites, ';D1 20 ;D2 400'. The hmvc and fmvn
+	operations set the move clocks.
+
+	Args:
+		line: EPD record.
+
+	Returns:
+		A (board, player, operations) tuple, where operations is a dict from each operation's opcode to its operands, a
+		string with any quotes removed.
+
+	Raises:
+		ValueError: if line is not a valid EPD record.
+	"""
+	fields = line.split(None, 4)
+	if len(fields) < 4:
+		raise ValueError('EPD record needs 4 fields: ' + repr(line))
+	rest = fields[4] if len(fields) > 4 else ''
+	position = fields[:4]
+	clocks = rest.split(None, 2)
+	if len(clocks) >= 2 and clocks[0].isdigit() and clocks[1].isdigit():
+		position += clocks[:2]
+		rest = clocks[2] if len(clocks) > 2 else ''
+
+	operations = {}
+	for operation in rest.split(';'):
+		words = operation.split(None, 1)
+		if words:
+			operations[words[0]] = words[1].strip().strip('"') if len(words) > 1 else ''
+	if len(position) == 4 and 'hmvc' in operations and 'fmvn' in operations:
+		position += [operations['hmvc'], operations['fmvn']]
+	board, player = from_fen(' '.join(position))
+	return board, player, operations
+
+
+def read_epd(source):
+	"""
+	Yield the positions of a file of EPD or FEN records one at a time, reading the file as they are used.
+
+	Blank lines and lines starting with '#' are skipped.
+
+	Args:
+		source: path of the file, or an open text file or other iterable of lines.
+
+	Yields:
+		(board, player, operations) tuples, as parse_epd returns them.
+
+	Raises:
+		ValueError: if a line is not a valid record; the message gives its line number.
+	"""
+	if type(source) == str:
+		with open(source) as file:
+			yield from read_epd(file)
+		return
+	for number, line in enumerate(source, 1):
+		line = line.strip()
+		if not line or line.startswith('#'):
+			continue
+		try:
+			record = parse_epd(line)
+		except ValueError as error:
+			raise ValueError('line ' + str(number) + ': ' + str(error)) from None
+		yield record
+
+
 def promote(board, piece, player, position):
 	"""
 	(Mutating) Mutate board to promote pawn to new piece.